@@ -18,7 +18,16 @@ logging.basicConfig(level=logging.INFO)
 ## START OF APPLICATION
 ############################################################################
 
-from cspr_summarization.services.lp_block_summarizer.lp_block_summarizer import LPBlockSummarizer
+from cspr_summarization.services.lp_block_summarizer.lp_block_range_summarizer import LPBlockRangeSummarizer
+from cspr_summarization.services.pair_state.pair_state import PairState
+
+# Number of blocks summarized per window while catching up. Override with the `BLOCK_SUMMARY_WINDOW_SIZE` env var
+BLOCK_SUMMARY_WINDOW_SIZE = int(os.getenv('BLOCK_SUMMARY_WINDOW_SIZE') or 1000)
+
+# Latest reserves and total supply of every pair, carried from one window to the next and snapshotted to
+# the `PAIR_STATE_SNAPSHOT_PATH` file (when set) so a restart does not rebuild it from the whole history
+PAIR_STATE_SNAPSHOT_PATH = os.getenv('PAIR_STATE_SNAPSHOT_PATH')
+pairState = PairState.load(PAIR_STATE_SNAPSHOT_PATH)
 
 def main():
     try:
@@ -33,12 +42,17 @@ def main():
 
     
     if latest_block_hour >= latest_block_summary:
-        for i in range(latest_block_summary, latest_block_hour + 1):
+        for start_block in range(latest_block_summary, latest_block_hour + 1, BLOCK_SUMMARY_WINDOW_SIZE):
+            end_block = min(start_block + BLOCK_SUMMARY_WINDOW_SIZE - 1, latest_block_hour)
             try:
-                lpBlockSummarizer = LPBlockSummarizer(i)
-                lpBlockSummarizer.summarizer()
-            except:
-                logging.error(f'Failed to summarize for block {i}')
+                lpBlockRangeSummarizer = LPBlockRangeSummarizer(start_block, end_block, pairState)
+                num_rows = lpBlockRangeSummarizer.summarizer()
+                logging.info(f'Summarized blocks {start_block} - {end_block} ({num_rows} rows)')
+            except Exception as e:
+                # stop at the failed window: the next run resumes from the latest block summarized
+                logging.error(f'Failed to summarize for blocks {start_block} - {end_block}: {str(e)}')
+                break
+        pairState.save(PAIR_STATE_SNAPSHOT_PATH)
 
 if __name__ == '__main__':
     schedule.every(1).minutes.do(main)
@@ -27,6 +27,13 @@ class HourlyData(models.Model):
   volume_1 = models.FloatField()
   max_block = models.IntegerField()
   close_lp_token_supply = models.DecimalField(max_digits=155, decimal_places=0)
+  # running totals of the pool up to this hour, included
+  cumulative_volume_0 = models.FloatField(null=True)
+  cumulative_volume_1 = models.FloatField(null=True)
+  cumulative_num_swaps_0 = models.BigIntegerField(null=True)
+  cumulative_num_swaps_1 = models.BigIntegerField(null=True)
+  cumulative_num_mints = models.BigIntegerField(null=True)
+  cumulative_num_burns = models.BigIntegerField(null=True)
 
   def __init__(self, address, open_timestamp_utc, close_timestamp_utc, *args, **kwargs):
     super().__init__(*args, **kwargs)
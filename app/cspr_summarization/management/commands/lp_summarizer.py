@@ -14,9 +14,11 @@ import datetime
 
 from django.core.management.base import BaseCommand
 from django.db import transaction, connection
+from django.db.models import Q
 from datetime import datetime, timedelta, timezone
 
 import traceback
+import pandas as pd
 
 # Models
 from cspr_summarization.entities.SummaryType import SummaryType
@@ -28,6 +30,42 @@ from data_servers.db_connection_manager import DBConnectionManager
 from data_servers.data_server import DataServer
 
 
+# Number of liquidity pools summarized together in --batch mode
+LP_SUMMARY_BATCH_SIZE = 200
+
+# Summary types computed together with --all-periods
+ALL_PERIODS_DATA_FREQUENCIES = ["t1d", "t7d", "t30", "M", "tq", "t12"]
+
+# lp_summary field: key of the summary returned by LPSummary.get_lp_period_summaries
+LP_SUMMARY_FIELDS = {
+    'total_period_return': "total_period_return",
+    'total_apy': "total_apy",
+    'yield_on_lp_fees': "yield_on_lp_fees",
+    'fees_apy': "fees_apy",
+    'price_change_ret': "price_change_ret",
+    'hodl_return': "hodl_return",
+    'impermanent_loss_level': "impermanent_loss_level",
+    'impermanent_loss_impact': "impermanent_loss_impact",
+    'volume': "volume",
+    'transactions_period': "transactions_period",
+    'poolsize': "close_poolsize",
+    'open_poolsize': "open_poolsize",
+    'close_poolsize': "close_poolsize",
+    'open_reserve_0': "open_reserve_0",
+    'open_reserve_1': "open_reserve_1",
+    'close_reserve_0': "close_reserve_0",
+    'close_reserve_1': "close_reserve_1",
+    'open_price_0': "open_price_0",
+    'open_price_1': "open_price_1",
+    'high_price_0': "high_price_0",
+    'high_price_1': "high_price_1",
+    'low_price_0': "low_price_0",
+    'low_price_1': "low_price_1",
+    'close_price_0': "close_price_0",
+    'close_price_1': "close_price_1"
+}
+
+
 class Command(BaseCommand):
     help = 'Summarizes Liquidity Pools v3'
     wait_for_summaries_loop_timeout = 10    # seconds
@@ -52,6 +90,13 @@ class Command(BaseCommand):
         parser.add_argument('--t12', action='store_true', help='Process trailing 12 month summary', )
 
         parser.add_argument('--refresh', action='store_true', help='Refresh materialized view', )
+        parser.add_argument('--batch', action='store_true',
+                            help='Summarize the LPs in batches: one hourly_data query and one bulk write per batch', )
+        parser.add_argument('--batch-size', type=int, default=LP_SUMMARY_BATCH_SIZE,
+                            help='Number of LPs summarized together with --batch', )
+        parser.add_argument('--all-periods', action='store_true',
+                            help='Process the t1d, t7d, t30, monthly, tq and t12 summaries together from one load of '
+                                 'the LPs\' data, in batches', )
 
     def handle(self, *args, **kwargs):
         debug = False
@@ -113,6 +158,14 @@ class Command(BaseCommand):
         currency_id = 1                                         # Default to USD
         data_server.set_denomination_currency(currency_id)
 
+        data_frequency = summary_data_frequency(kwargs)
+        if kwargs['batch'] or kwargs['all_periods']:
+            data_frequencies = ALL_PERIODS_DATA_FREQUENCIES if kwargs['all_periods'] else [data_frequency]
+            pair_process_cnt = self.summarize_in_batches(pair_list, data_server, data_frequencies, kwargs['batch_size'],
+                                                         overwrite, debug)
+            self.stdout.write(self.style.HTTP_INFO("Summarizer stored %s summaries" % pair_process_cnt))
+            return
+
         ###############################################################
         # Loop through liquidity pools
         for lp_id in pair_list:
@@ -126,11 +179,11 @@ class Command(BaseCommand):
                 # Example = "2023-03-26 12:00:00+00"
 
                 # Get the datetime the lp_summary_populator last completed for this liquidity pool
-                last_processed = HourlyData.objects.using('default').filter(address=lp_object.contract_address).order_by('-close_timestamp_utc')[1]
+                last_processed = HourlyData.objects.using('default').filter(address=lp_object.contract_address).order_by('-close_timestamp_utc').values('close_timestamp_utc')[1]
 
                 if last_processed is not None:
                     if debug:
-                        print("FLUIDEFI processed up to timestamp UTC:", last_processed.close_timestamp_utc)
+                        print("FLUIDEFI processed up to timestamp UTC:", last_processed['close_timestamp_utc'])
                 else:
                     print("WARNING: Can not find any hourly data for this liquidity pool. Skipping...")
                     skip = True
@@ -140,57 +193,8 @@ class Command(BaseCommand):
                 if not skip:
 
                     # last_processed.max_block
-                    if kwargs['daily'] or kwargs['d']:
-                        # End at the top of the current hour
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="D")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0, hour=0)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0, hour=0)
-                        end_datetime = process_end_datetime
-                        start_datetime = (end_datetime - timedelta(days=1))
-
-                    elif kwargs['weekly'] or kwargs['w']:
-                        # End at midnight of the current day
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="W")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0, hour=0)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0, hour=0)
-                        end_datetime = process_end_datetime  # lp_object.last_processed3
-                        start_datetime = (end_datetime - timedelta(days=7))
-
-                    elif kwargs['t7d']:
-                        # End at the top of the hour
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="t7d")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0)
-                        end_datetime = process_end_datetime
-                        start_datetime = (end_datetime - timedelta(days=7))
-
-                    elif kwargs['monthly'] or kwargs['m']:
-                        # Get the first day of this month and subtract 1 day
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="M")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0, hour=0, day=1)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0, hour=0,
-                                                                                         day=1)
-                        process_end_datetime = process_end_datetime - timedelta(days=1)
-                        end_datetime = process_end_datetime
-                        start_datetime = process_end_datetime.replace(microsecond=0, second=0, minute=0, hour=0, day=1)
-
-                    elif kwargs['t30']:
-                        # End at midnight of the current day
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="t30")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0, hour=0)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0)
-                        end_datetime = process_end_datetime
-                        start_datetime = (end_datetime - timedelta(days=30))
-
-                    else:
-                        # Default is t1d, the last 24 hours
-                        summary_type = SummaryType.objects.using('default').get(data_frequency="t1d")
-                        # process_end_datetime = datetime.now(timezone.utc).replace(microsecond=0, second=0, minute=0)
-                        process_end_datetime = last_processed.close_timestamp_utc.replace(microsecond=0, second=0, minute=0)
-                        end_datetime = process_end_datetime
-                        start_datetime = (end_datetime - timedelta(days=1))
-
-                    data_server.set_date_range(start_datetime, end_datetime)
+                    summary_type = SummaryType.objects.using('default').get(data_frequency=data_frequency)
+                    start_datetime, end_datetime = summary_period(data_frequency, last_processed['close_timestamp_utc'])
 
                     ###############################################################
                     # If overwrite is enabled, proceed; Otherwise, see if the record already exists
@@ -215,14 +219,20 @@ class Command(BaseCommand):
                     ###############################################################################################
                     if not skip:
                         try:
-                            summary = data_server.lp_summary.get_lp_summary(lp_address=lp_object.contract_address,
-                                                                            network=lp_object.network_id)
+                            # the same summary of the period as in --batch and --all-periods mode
+                            period = pd.DataFrame([{'contract_address': lp_object.contract_address,
+                                                    'network': lp_object.network_id,
+                                                    'data_frequency': data_frequency,
+                                                    'start_date': start_datetime,
+                                                    'end_date': end_datetime}])
+                            summary = data_server.lp_summary.get_lp_period_summaries(period).get(
+                                (lp_object.contract_address, data_frequency))
                             if debug:
                                 print("lp_summary: ")
                                 print(summary)
 
                         except Exception as e:
-                            print("EXCEPTION: lp_summarizer calling get_lp_summary server:", e)
+                            print("EXCEPTION: lp_summarizer calling the lp_summary server:", e)
                             if debug:
                                 print(traceback.format_exc())
                                 if summary is not None:
@@ -244,7 +254,7 @@ class Command(BaseCommand):
 
                     # Check if data frame came back empty
                     if not skip and not summary:
-                        print(f"WARNING: No data for period. {lp_object.name} - address: {lp_object.contract_address} on network: {lp_network} | data_frequency: H | currency: {currency_id} | {start_datetime} to {end_datetime}")
+                        print(f"WARNING: No data for period. {lp_object.name} - address: {lp_object.contract_address} on network: {lp_object.network_id} | data_frequency: {data_frequency} | currency: {currency_id} | {start_datetime} to {end_datetime}")
                         skip = True
                         lp_object.last_processed = datetime.now(timezone.utc)
                         lp_object.save(update_fields=['last_processed'])
@@ -260,32 +270,7 @@ class Command(BaseCommand):
                         summary_type=summary_type,
                         defaults={'open_timestamp_utc': start_datetime,
                                   'close_timestamp_utc': end_datetime,
-                                  'total_period_return': summary["total_period_return"],
-                                  'total_apy': summary["total_apy"],
-                                  'yield_on_lp_fees': summary["yield_on_lp_fees"],
-                                  'fees_apy': summary["fees_apy"],
-                                  'price_change_ret': summary["price_change_ret"],
-                                  'hodl_return': summary["hodl_return"],
-                                  'impermanent_loss_level': summary["impermanent_loss_level"],
-                                  'impermanent_loss_impact': summary["impermanent_loss_impact"],
-                                  'volume': summary["volume"],
-                                  'transactions_period': summary["transactions_period"],
-                                  'poolsize': summary["close_poolsize"],
-                                  'open_poolsize': summary["open_poolsize"],
-                                  'close_poolsize': summary["close_poolsize"],
-                                  'open_reserve_0': summary["open_reserve_0"],
-                                  'open_reserve_1': summary["open_reserve_1"],
-                                  'close_reserve_0': summary["close_reserve_0"],
-                                  'close_reserve_1': summary["close_reserve_1"],
-                                  'open_price_0': summary["open_price_0"],
-                                  'open_price_1': summary["open_price_1"],
-                                  'high_price_0': summary["high_price_0"],
-                                  'high_price_1': summary["high_price_1"],
-                                  'low_price_0': summary["low_price_0"],
-                                  'low_price_1': summary["low_price_1"],
-                                  'close_price_0': summary["close_price_0"],
-                                  'close_price_1': summary["close_price_1"]
-                                  })
+                                  **{field: summary[key] for field, key in LP_SUMMARY_FIELDS.items()}})
                     if debug:
                         print(f"{lp_object.name} {lp_object.fee_taken} UPDATED {summary_type.data_frequency} for {start_datetime} to {end_datetime}")
 
@@ -330,6 +315,186 @@ class Command(BaseCommand):
         self.stdout.write(self.style.HTTP_INFO("Summarizer stored %s liquidity pools" % pair_process_cnt))
 
 
+    def summarize_in_batches(self, lp_ids, data_server, data_frequencies, batch_size, overwrite, debug):
+        """
+        Summarizes the liquidity pools batch_size at a time: the last hour processed of the pools is read with one
+        query, their summaries are computed together by LPSummary.get_lp_period_summaries, like one at a time, and
+        written with one bulk upsert
+
+        @param data_frequencies: data_frequency of each summary type to process
+        @return: number of summaries stored
+        """
+        summary_types = {data_frequency: SummaryType.objects.using('default').get(data_frequency=data_frequency)
+                         for data_frequency in data_frequencies}
+        lp_objects = list(LiquidityPool.objects.using('default').filter(id__in=list(lp_ids)))
+        lp_count = len(lp_objects)
+        summary_process_cnt = 0
+        for batch_start in range(0, lp_count, batch_size):
+            batch = {lp_object.contract_address: lp_object for lp_object in lp_objects[batch_start:batch_start + batch_size]}
+            print(f"Processing liquidity pools {batch_start + 1} to {batch_start + len(batch)} of {lp_count} LPs. ")
+
+            # Get the datetime the lp_summary_populator last completed for each liquidity pool
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT address, close_timestamp_utc
+                    FROM (
+                        SELECT address, close_timestamp_utc,
+                               ROW_NUMBER() OVER (PARTITION BY address ORDER BY close_timestamp_utc DESC) AS row_number
+                        FROM hourly_data
+                        WHERE address IN %s
+                    ) latest_hours
+                    WHERE row_number = 2""", [tuple(batch)])
+                last_processed = dict(cursor.fetchall())
+            for address in set(batch) - set(last_processed):
+                print(f"WARNING: Can not find any hourly data for liquidity pool {batch[address].name}. Skipping...")
+
+            # period of each summary to compute, by liquidity pool id and data_frequency
+            periods = {(batch[address].id, data_frequency): summary_period(data_frequency, close_timestamp_utc)
+                       for address, close_timestamp_utc in last_processed.items()
+                       for data_frequency in data_frequencies}
+            processed_lp_ids = {lp_id for lp_id, _ in periods}
+            if overwrite:
+                print("Overwrite enabled; PROCESSING", ", ".join(data_frequencies))
+            elif len(periods) > 0:
+                existing = Q()
+                for (lp_id, data_frequency), (start_datetime, end_datetime) in periods.items():
+                    existing |= Q(liquidity_pool_id=lp_id, summary_type=summary_types[data_frequency],
+                                  open_timestamp_utc=start_datetime, close_timestamp_utc=end_datetime)
+                for lp_id, data_frequency in LpSummary.objects.using('default').filter(existing).values_list(
+                        'liquidity_pool_id', 'summary_type__data_frequency'):
+                    print(f"{data_frequency} summary record already exists; SKIPPING OVER {lp_id}")
+                    periods.pop((lp_id, data_frequency), None)
+            if len(periods) == 0:
+                continue
+
+            lp_by_id = {lp_object.id: lp_object for lp_object in batch.values()}
+            pools = pd.DataFrame([{'contract_address': lp_by_id[lp_id].contract_address,
+                                   'network': lp_by_id[lp_id].network_id,
+                                   'data_frequency': data_frequency,
+                                   'start_date': start_datetime,
+                                   'end_date': end_datetime}
+                                  for (lp_id, data_frequency), (start_datetime, end_datetime) in periods.items()])
+            try:
+                summaries = data_server.lp_summary.get_lp_period_summaries(pools)
+            except Exception as e:
+                print("EXCEPTION: lp_summarizer calling the lp_summary server:", e)
+                if debug:
+                    print(traceback.format_exc())
+                continue
+
+            lp_summaries = []
+            for (lp_id, data_frequency), (start_datetime, end_datetime) in periods.items():
+                summary = summaries.get((lp_by_id[lp_id].contract_address, data_frequency))
+                if not summary:
+                    print(f"WARNING: No data for period. {lp_by_id[lp_id].name} - address: {lp_by_id[lp_id].contract_address} | data_frequency: {data_frequency} | {start_datetime} to {end_datetime}")
+                    continue
+                lp_summaries.append(LpSummary(liquidity_pool_id=lp_id,
+                                              summary_type=summary_types[data_frequency],
+                                              open_timestamp_utc=start_datetime,
+                                              close_timestamp_utc=end_datetime,
+                                              **{field: summary[key] for field, key in LP_SUMMARY_FIELDS.items()}))
+
+            try:
+                with transaction.atomic(using='default'):
+                    LpSummary.objects.using('default').bulk_create(
+                        lp_summaries,
+                        update_conflicts=True,
+                        unique_fields=['liquidity_pool', 'summary_type', 'close_timestamp_utc'],
+                        update_fields=['open_timestamp_utc', *LP_SUMMARY_FIELDS])
+                    # Clean up old summaries of these liquidity pools that don't match their current period
+                    old_summaries = Q()
+                    for lp_summary in lp_summaries:
+                        old_summaries |= Q(liquidity_pool_id=lp_summary.liquidity_pool_id,
+                                           summary_type=lp_summary.summary_type) & ~Q(
+                            open_timestamp_utc=lp_summary.open_timestamp_utc,
+                            close_timestamp_utc=lp_summary.close_timestamp_utc)
+                    if len(lp_summaries) > 0:
+                        deleted, _ = LpSummary.objects.using('default').filter(old_summaries).delete()
+                        if debug:
+                            print(f"Deleted {deleted} old summary records")
+            except Exception as e:
+                print(traceback.format_exc())
+                self.stdout.write("EXCEPTION: Cannot save LpSummary records.")
+                self.stdout.write(self.style.HTTP_INFO(e))
+                continue
+
+            # the pools without data for the period are marked processed too, like one at a time
+            LiquidityPool.objects.using('default').filter(id__in=list(processed_lp_ids)).update(
+                last_processed=datetime.now(timezone.utc))
+            summary_process_cnt += len(lp_summaries)
+        return summary_process_cnt
+
+def summary_data_frequency(kwargs):
+    """
+    data_frequency of the summary type selected by the command line flags (t1d by default)
+    """
+    if kwargs['daily'] or kwargs['d']:
+        return "D"
+    elif kwargs['weekly'] or kwargs['w']:
+        return "W"
+    elif kwargs['t7d']:
+        return "t7d"
+    elif kwargs['monthly'] or kwargs['m']:
+        return "M"
+    elif kwargs['t30']:
+        return "t30"
+    elif kwargs['tq']:
+        return "tq"
+    elif kwargs['t12']:
+        return "t12"
+    return "t1d"
+
+
+def summary_period(data_frequency, last_processed):
+    """
+    Start and end of the period summarized, from the close timestamp of the last hour processed for the liquidity pool
+
+    @param data_frequency: data_frequency of the summary type, see summary_data_frequency
+    @param last_processed: close_timestamp_utc of the last hourly_data record to summarize
+    @return: start_datetime, end_datetime
+    """
+    if data_frequency == "D":
+        # End at midnight of the current day
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0, hour=0)
+        start_datetime = (end_datetime - timedelta(days=1))
+
+    elif data_frequency == "W":
+        # End at midnight of the current day
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0, hour=0)
+        start_datetime = (end_datetime - timedelta(days=7))
+
+    elif data_frequency == "t7d":
+        # End at the top of the hour
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0)
+        start_datetime = (end_datetime - timedelta(days=7))
+
+    elif data_frequency == "M":
+        # Get the first day of this month and subtract 1 day
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0, hour=0, day=1) - timedelta(days=1)
+        start_datetime = end_datetime.replace(microsecond=0, second=0, minute=0, hour=0, day=1)
+
+    elif data_frequency == "t30":
+        # End at the top of the hour
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0)
+        start_datetime = (end_datetime - timedelta(days=30))
+
+    elif data_frequency == "tq":
+        # End at the top of the hour
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0)
+        start_datetime = (end_datetime - timedelta(days=90))
+
+    elif data_frequency == "t12":
+        # End at the top of the hour
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0)
+        start_datetime = (end_datetime - timedelta(days=365))
+
+    else:
+        # Default is t1d, the last 24 hours
+        end_datetime = last_processed.replace(microsecond=0, second=0, minute=0)
+        start_datetime = (end_datetime - timedelta(days=1))
+    return start_datetime, end_datetime
+
+
 @transaction.atomic
 def refresh_views():
     starttime = datetime.now(timezone.utc)
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cspr_summarization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+        """
+            ALTER TABLE hourly_data
+                ADD COLUMN IF NOT EXISTS cumulative_volume_0 DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS cumulative_volume_1 DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS cumulative_num_swaps_0 BIGINT,
+                ADD COLUMN IF NOT EXISTS cumulative_num_swaps_1 BIGINT,
+                ADD COLUMN IF NOT EXISTS cumulative_num_mints BIGINT,
+                ADD COLUMN IF NOT EXISTS cumulative_num_burns BIGINT;
+
+            -- running totals of the existing rows, the hourly summarizer extends them from there
+            UPDATE hourly_data
+            SET cumulative_volume_0 = totals.cumulative_volume_0,
+                cumulative_volume_1 = totals.cumulative_volume_1,
+                cumulative_num_swaps_0 = totals.cumulative_num_swaps_0,
+                cumulative_num_swaps_1 = totals.cumulative_num_swaps_1,
+                cumulative_num_mints = totals.cumulative_num_mints,
+                cumulative_num_burns = totals.cumulative_num_burns
+            FROM (
+                SELECT id,
+                       SUM(volume_0) OVER pair_hours AS cumulative_volume_0,
+                       SUM(volume_1) OVER pair_hours AS cumulative_volume_1,
+                       SUM(num_swaps_0) OVER pair_hours AS cumulative_num_swaps_0,
+                       SUM(num_swaps_1) OVER pair_hours AS cumulative_num_swaps_1,
+                       SUM(num_mints) OVER pair_hours AS cumulative_num_mints,
+                       SUM(num_burns) OVER pair_hours AS cumulative_num_burns
+                FROM hourly_data
+                WINDOW pair_hours AS (PARTITION BY address ORDER BY open_timestamp_utc)
+            ) totals
+            WHERE hourly_data.id = totals.id;
+        """,
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import connections, transaction
+
+import io
+import logging
+logging.basicConfig(level=logging.INFO)
+
+'''
+# Serializes the dataframe as CSV so it can be streamed through COPY (NaN/None are written as NULL)
+'''
+def _to_csv_buffer(df):
+  buffer = io.StringIO()
+  df.to_csv(buffer, index=False, header=False)
+  buffer.seek(0)
+  return buffer
+
+'''
+# Creates a temp table with the columns of `table` and fills it with the rows of df through COPY.
+# The temp table is dropped when the outermost transaction commits.
+'''
+def _copy_to_temp_table(cursor, table, df):
+  temp_table = f'tmp_{table}'
+  columns = ', '.join(df.columns)
+  # a previous write inside the same outer transaction may still hold the temp table
+  cursor.execute(f'DROP TABLE IF EXISTS {temp_table}')
+  cursor.execute(f'CREATE TEMP TABLE {temp_table} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA')
+  cursor.copy_expert(f'COPY {temp_table} ({columns}) FROM STDIN WITH (FORMAT csv)', _to_csv_buffer(df))
+  return temp_table
+
+'''
+# Inserts the rows of df into the model's table, or updates `update_columns` (default: every non key column)
+# of the rows that already exist, with one COPY and one INSERT ... ON CONFLICT statement.
+# `conflict_columns` must match a unique constraint of the table.
+'''
+def bulk_upsert(model, df, conflict_columns, update_columns=None, using='writer'):
+  if df is None or df.empty:
+    return 0
+  table = model._meta.db_table
+  df = df.drop_duplicates(subset=conflict_columns, keep='last')
+  if update_columns is None:
+    update_columns = [col for col in df.columns if col not in conflict_columns]
+  columns = ', '.join(df.columns)
+  updates = ', '.join([f'{col} = EXCLUDED.{col}' for col in update_columns])
+  with transaction.atomic(using=using):
+    with connections[using].cursor() as cursor:
+      temp_table = _copy_to_temp_table(cursor, table, df)
+      cursor.execute(f'''
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {temp_table}
+        ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {updates}
+      ''')
+  return len(df)
+
+'''
+# Updates the columns of df that are not in `key_columns` for the existing rows matching the key columns,
+# with one COPY and one UPDATE ... FROM statement. Rows of df without a match are ignored.
+'''
+def bulk_update(model, df, key_columns, using='writer'):
+  if df is None or df.empty:
+    return 0
+  table = model._meta.db_table
+  df = df.drop_duplicates(subset=key_columns, keep='last')
+  update_columns = [col for col in df.columns if col not in key_columns]
+  updates = ', '.join([f'{col} = src.{col}' for col in update_columns])
+  matches = ' AND '.join([f'dst.{col} = src.{col}' for col in key_columns])
+  with transaction.atomic(using=using):
+    with connections[using].cursor() as cursor:
+      temp_table = _copy_to_temp_table(cursor, table, df)
+      cursor.execute(f'UPDATE {table} AS dst SET {updates} FROM {temp_table} AS src WHERE {matches}')
+      return cursor.rowcount
@@ -0,0 +1,170 @@
+from cspr_summarization.entities.UniswapV2Pair import UniswapV2Pair
+from cspr_summarization.entities.PairSyncEvent import PairSyncEvent
+from cspr_summarization.entities.Blocks import Blocks
+from cspr_summarization.entities.PairMintEvent import PairMintEvent
+from cspr_summarization.entities.PairBurnEvent import PairBurnEvent
+from cspr_summarization.entities.PairSwapEvent import PairSwapEvent
+from cspr_summarization.entities.TokenTotalSupply import TokenTotalSupply
+from cspr_summarization.entities.BlockSummary import BlockSummary
+from cspr_summarization.services.bulk_writer.bulk_writer import bulk_upsert
+
+import pandas as pd
+import logging
+logging.basicConfig(level=logging.WARN)
+
+# Number of rows fetched per round trip while streaming the raw event tables
+STREAM_CHUNK_SIZE = 10000
+
+SUMMARY_COLUMNS = ['address', 'block_number', 'block_timestamp_utc', 'reserve0', 'reserve1', 'total_supply',
+                   'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns', 'mints_0', 'mints_1', 'burns_0', 'burns_1',
+                   'volume_0', 'volume_1']
+
+class LPBlockRangeSummarizer:
+    '''
+    Summarizes every block of [startBlock, endBlock] at once: the raw events of the whole window are streamed sorted by block,
+    aggregated per (address, block) and the latest reserves and total supply are carried forward from the state before the window.
+    '''
+    def __init__(self, startBlock, endBlock, pairState=None):
+        self.startBlock = startBlock
+        self.endBlock = endBlock
+        # optional PairState shared across windows, the state before the window is read from it when it can serve it
+        self.pairState = pairState
+        self.pairs = self.allPairsFinder()
+        self.summary = self.rangeSummaryFinder()
+
+    '''
+    Finds all of the pairs minted up to the end of the window with the block at which they were first minted
+    '''
+    def allPairsFinder(self):
+        try:
+            all_pairs_table = UniswapV2Pair.objects.using('default') \
+                .filter(first_mint_event_block_number__lte=self.endBlock) \
+                .values('contract_address', 'first_mint_event_block_number')
+            df = pd.DataFrame.from_records(all_pairs_table, columns=['contract_address', 'first_mint_event_block_number'])
+            return df.rename(columns={'contract_address': 'address'})
+        except Exception as e:
+            logging.error('Error occurred while finding pairs: %s', str(e))
+            raise
+
+    '''
+    Finds the block numbers and timestamps of the window
+    '''
+    def blocksFinder(self):
+        blocks = Blocks.objects.using('default') \
+            .filter(block_number__range=(self.startBlock, self.endBlock)) \
+            .values('block_number', 'timestamp_utc').order_by('block_number')
+        return pd.DataFrame.from_records(blocks, columns=['block_number', 'timestamp_utc'])
+
+    '''
+    Streams the rows of an event table inside the window sorted by block and returns them as a dataframe
+    '''
+    def eventsFinder(self, model, columns, order_by=('block_number', 'log_index')):
+        rows = model.objects.using('default') \
+            .filter(block_number__range=(self.startBlock, self.endBlock)) \
+            .values(*columns).order_by(*order_by) \
+            .iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    '''
+    Finds the latest reserves of every pair before the window, from the pair state or with a single DISTINCT ON (address) query
+    '''
+    def initialSyncsFinder(self, addresses):
+        if self.pairState is not None:
+            reserves = self.pairState.reserves_at(self.startBlock - 1)
+            if reserves is not None:
+                return reserves[reserves['address'].isin(addresses)][['address', 'reserve0', 'reserve1']]
+        syncs = PairSyncEvent.objects.using('default') \
+            .filter(block_number__lt=self.startBlock, address__in=addresses) \
+            .order_by('address', '-block_number', '-log_index') \
+            .distinct('address') \
+            .values('address', 'reserve0', 'reserve1')
+        return pd.DataFrame.from_records(syncs, columns=['address', 'reserve0', 'reserve1'])
+
+    '''
+    Finds the latest total supply of every pair before the window, from the pair state or with a single DISTINCT ON (token_address) query
+    '''
+    def initialSuppliesFinder(self, addresses):
+        if self.pairState is not None:
+            supplies = self.pairState.supplies_at(self.startBlock - 1)
+            if supplies is not None:
+                supplies = supplies[supplies['token_address'].isin(addresses)][['token_address', 'total_supply']]
+                return supplies.rename(columns={'token_address': 'address'})
+        supplies = TokenTotalSupply.objects.using('default') \
+            .filter(block_number__lt=self.startBlock, token_address__in=addresses) \
+            .order_by('token_address', '-block_number') \
+            .distinct('token_address') \
+            .values('token_address', 'total_supply')
+        df = pd.DataFrame.from_records(supplies, columns=['token_address', 'total_supply'])
+        return df.rename(columns={'token_address': 'address'})
+
+    '''
+    Returns the value of `columns` at every (address, block_number) of `index`: the last event at or before that block,
+    or the state before the window if the pair had no event yet inside the window
+    '''
+    def carryForward(self, index, initial, events, columns):
+        latest = events.groupby(['address', 'block_number'], sort=False)[columns].last()
+        seed = initial.assign(block_number=self.startBlock - 1).set_index(['address', 'block_number'])[columns]
+        state = pd.concat([seed, latest])
+        state = state.reindex(state.index.union(index)).sort_index()
+        state = state.groupby(level='address').ffill()
+        return state.reindex(index)
+
+    '''
+    Builds one summary row per (pair, block) of the window from the streamed events with grouped operations
+    '''
+    def rangeSummaryAssembler(self, blocks, initialSyncs, initialSupplies, syncs, mints, burns, swaps, supplies):
+        grid = self.pairs.merge(blocks, how='cross')
+        grid = grid[grid['block_number'] >= grid['first_mint_event_block_number']]
+        grid = grid.rename(columns={'timestamp_utc': 'block_timestamp_utc'}) \
+            .set_index(['address', 'block_number']).sort_index()[['block_timestamp_utc']]
+
+        grid = grid.join(self.carryForward(grid.index, initialSyncs, syncs, ['reserve0', 'reserve1']))
+        grid = grid.join(self.carryForward(grid.index, initialSupplies, supplies, ['total_supply']))
+
+        by_block = ['address', 'block_number']
+        mints = mints.groupby(by_block).agg(num_mints=('amount0', 'size'), mints_0=('amount0', 'sum'), mints_1=('amount1', 'sum'))
+        burns = burns.groupby(by_block).agg(num_burns=('amount0', 'size'), burns_0=('amount0', 'sum'), burns_1=('amount1', 'sum'))
+        swaps = swaps.assign(swap_0=(swaps['amount0_in'] > 0) | (swaps['amount0_out'] > 0),
+                             swap_1=(swaps['amount1_in'] > 0) | (swaps['amount1_out'] > 0))
+        swaps = swaps.groupby(by_block).agg(num_swaps_0=('swap_0', 'sum'), num_swaps_1=('swap_1', 'sum'),
+                                            amount0_in=('amount0_in', 'sum'), amount0_out=('amount0_out', 'sum'),
+                                            amount1_in=('amount1_in', 'sum'), amount1_out=('amount1_out', 'sum'))
+        swaps['volume_0'] = (swaps['amount0_in'] - swaps['amount0_out']).abs()
+        swaps['volume_1'] = (swaps['amount1_in'] - swaps['amount1_out']).abs()
+        swaps = swaps[['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']]
+
+        grid = grid.join(mints).join(burns).join(swaps)
+        grid = grid.fillna(0).reset_index()
+        count_columns = ['num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns']
+        grid[count_columns] = grid[count_columns].astype(int)
+        return grid[SUMMARY_COLUMNS]
+
+    '''
+    Loads the events of the window and assembles the block summaries. Errors are raised so the window is not skipped
+    '''
+    def rangeSummaryFinder(self):
+        if self.pairs is None or self.pairs.empty:
+            return None
+        try:
+            addresses = list(self.pairs['address'])
+            return self.rangeSummaryAssembler(
+                self.blocksFinder(),
+                self.initialSyncsFinder(addresses),
+                self.initialSuppliesFinder(addresses),
+                self.eventsFinder(PairSyncEvent, ['address', 'block_number', 'log_index', 'reserve0', 'reserve1']),
+                self.eventsFinder(PairMintEvent, ['address', 'block_number', 'amount0', 'amount1']),
+                self.eventsFinder(PairBurnEvent, ['address', 'block_number', 'amount0', 'amount1']),
+                self.eventsFinder(PairSwapEvent, ['address', 'block_number', 'amount0_in', 'amount0_out', 'amount1_in', 'amount1_out']),
+                self.eventsFinder(TokenTotalSupply, ['token_address', 'block_number', 'total_supply'], order_by=('block_number',))
+                    .rename(columns={'token_address': 'address'}))
+        except Exception as e:
+            logging.error(f'Error occurred while summarizing blocks {self.startBlock} - {self.endBlock}: %s', str(e))
+            raise
+
+    '''
+    Saves the block summaries of the window to the datastore in bulk
+    '''
+    def summarizer(self):
+        if self.summary is None or self.summary.empty:
+            return 0
+        return bulk_upsert(BlockSummary, self.summary, ['address', 'block_number'])
@@ -6,21 +6,29 @@ from cspr_summarization.entities.PairBurnEvent import PairBurnEvent
 from cspr_summarization.entities.PairSwapEvent import PairSwapEvent
 from cspr_summarization.entities.TokenTotalSupply import TokenTotalSupply
 from cspr_summarization.entities.BlockSummary import BlockSummary
+from cspr_summarization.services.bulk_writer.bulk_writer import bulk_upsert
 
+from django.db.models import Count, Sum, Q
 from decimal import Decimal
 import pandas as pd
 import numpy as np
 import logging
 logging.basicConfig(level=logging.WARN)
 class LPBlockSummarizer:
-    def __init__(self, blockNumber):
+    def __init__(self, blockNumber, batched=False, pairState=None):
         self.blockNumber = blockNumber
+        # optional PairState shared across blocks, the latest reserves and total supplies are read from it in batched mode
+        self.pairState = pairState
         self.pairs = self.allPairsFinder()
-        self.syncs = self.pairSyncEventChecker()
-        self.mints = self.pairMintEventChecker()
-        self.burns = self.pairBurnEventChecker()
-        self.swaps = self.pairSwapEventChecker()
-        self.summary = self.tokenTotalSupplyChecker()
+        if batched:
+            # one grouped query per event table for all the pairs
+            self.summary = self.batchedSummaryFinder()
+        else:
+            self.syncs = self.pairSyncEventChecker()
+            self.mints = self.pairMintEventChecker()
+            self.burns = self.pairBurnEventChecker()
+            self.swaps = self.pairSwapEventChecker()
+            self.summary = self.tokenTotalSupplyChecker()
     '''
     Finds the timestamp of the block and returns the timestamp as a scalar value.
     '''
@@ -262,6 +270,118 @@ class LPBlockSummarizer:
             merged_df = pd.concat(dfs)
         return pd.merge(self.swaps, merged_df, on='address', how='outer')
     
+    '''
+    Finds the latest sync event of every pair at the current height, from the pair state when it can serve this block or else with a single DISTINCT ON (address) query, and returns address, reserve0 and reserve1 as a dataframe
+    '''
+    def latestPairSyncEventsFinder(self, addresses):
+        try:
+            if self.pairState is not None:
+                reserves = self.pairState.reserves_at(self.blockNumber)
+                if reserves is not None:
+                    return reserves[['address', 'reserve0', 'reserve1']]
+            raw_pair_sync_event_table = PairSyncEvent.objects.using('default') \
+                .filter(block_number__lte=self.blockNumber, address__in=addresses) \
+                .order_by('address', '-block_number', '-log_index') \
+                .distinct('address') \
+                .values('address', 'reserve0', 'reserve1')
+            return pd.DataFrame.from_records(raw_pair_sync_event_table, columns=['address', 'reserve0', 'reserve1'])
+        except Exception as e:
+            logging.error('Error occurred while finding sync events for block: %s', str(e))
+            return None
+
+    '''
+    Finds the mint events of every pair at the current height grouped by address and returns the number of mint events, amount added in token0, and token1 as a dataframe
+    '''
+    def pairMintEventsFinder(self):
+        try:
+            raw_pair_mint_event_table = PairMintEvent.objects.using('default') \
+                .filter(block_number=self.blockNumber) \
+                .values('address') \
+                .annotate(num_mints=Count('id'), mints_0=Sum('amount0'), mints_1=Sum('amount1'))
+            return pd.DataFrame.from_records(raw_pair_mint_event_table, columns=['address', 'num_mints', 'mints_0', 'mints_1'])
+        except Exception as e:
+            logging.error('Error occurred while finding mint events for block: %s', str(e))
+            return None
+
+    '''
+    Finds the burn events of every pair at the current height grouped by address and returns the number of burn events, amount removed from token0, and token1 as a dataframe
+    '''
+    def pairBurnEventsFinder(self):
+        try:
+            raw_pair_burn_event_table = PairBurnEvent.objects.using('default') \
+                .filter(block_number=self.blockNumber) \
+                .values('address') \
+                .annotate(num_burns=Count('id'), burns_0=Sum('amount0'), burns_1=Sum('amount1'))
+            return pd.DataFrame.from_records(raw_pair_burn_event_table, columns=['address', 'num_burns', 'burns_0', 'burns_1'])
+        except Exception as e:
+            logging.error('Error occurred while finding burn events for block: %s', str(e))
+            return None
+
+    '''
+    Finds the swap events of every pair at the current height grouped by address and returns the swap counts and the summed amount0_in, amount0_out, amount1_in, amount1_out as a dataframe
+    '''
+    def pairSwapEventsFinder(self):
+        try:
+            raw_pair_swap_event_table = PairSwapEvent.objects.using('default') \
+                .filter(block_number=self.blockNumber) \
+                .values('address') \
+                .annotate(num_swaps_0=Count('id', filter=Q(amount0_in__gt=0) | Q(amount0_out__gt=0)),
+                          num_swaps_1=Count('id', filter=Q(amount1_in__gt=0) | Q(amount1_out__gt=0)),
+                          amount0_in=Sum('amount0_in'), amount0_out=Sum('amount0_out'),
+                          amount1_in=Sum('amount1_in'), amount1_out=Sum('amount1_out'))
+            cols = ['address', 'num_swaps_0', 'num_swaps_1', 'amount0_in', 'amount0_out', 'amount1_in', 'amount1_out']
+            return pd.DataFrame.from_records(raw_pair_swap_event_table, columns=cols)
+        except Exception as e:
+            logging.error('Error occurred while finding swap events for block: %s', str(e))
+            return None
+
+    '''
+    Finds the latest token total supply of every pair at the current height with a single DISTINCT ON (token_address) query and returns address and total_supply as a dataframe
+    '''
+    def latestTokenTotalSuppliesFinder(self, addresses):
+        try:
+            if self.pairState is not None:
+                supplies = self.pairState.supplies_at(self.blockNumber)
+                if supplies is not None:
+                    return supplies[['token_address', 'total_supply']].rename(columns={'token_address': 'address'})
+            token_total_supply_table = TokenTotalSupply.objects.using('default') \
+                .filter(block_number__lte=self.blockNumber, token_address__in=addresses) \
+                .order_by('token_address', '-block_number') \
+                .distinct('token_address') \
+                .values('token_address', 'total_supply')
+            df = pd.DataFrame.from_records(token_total_supply_table, columns=['token_address', 'total_supply'])
+            return df.rename(columns={'token_address': 'address'})
+        except Exception as e:
+            logging.error('Error occurred while finding the token total supplies for block: %s', str(e))
+            return None
+
+    '''
+    Joins the grouped sync, mint, burn, swap and total supply dataframes onto the pairs in one pass. Pairs without events get 0 counts and amounts.
+    '''
+    def summaryAssembler(self, syncs, mints, burns, swaps, supplies):
+        df = self.pairs.set_index('address')
+        for events in [syncs, mints, burns, swaps, supplies]:
+            if events is not None and not events.empty:
+                df = df.join(events.set_index('address'), how='left')
+        if 'amount0_in' in df.columns:
+            df['volume_0'] = (df['amount0_in'] - df['amount0_out']).abs()
+            df['volume_1'] = (df['amount1_in'] - df['amount1_out']).abs()
+            df = df.drop(columns=['amount0_in', 'amount0_out', 'amount1_in', 'amount1_out'])
+        return df.reset_index()
+
+    '''
+    Finds the syncs, mints, burns, swaps and total supplies of all the pairs at the current height with one query per event table and assembles the summary dataframe
+    '''
+    def batchedSummaryFinder(self):
+        if self.pairs is None or self.pairs.empty:
+            return None
+        addresses = list(self.pairs['address'])
+        return self.summaryAssembler(self.latestPairSyncEventsFinder(addresses),
+                                     self.pairMintEventsFinder(),
+                                     self.pairBurnEventsFinder(),
+                                     self.pairSwapEventsFinder(),
+                                     self.latestTokenTotalSuppliesFinder(addresses))
+
     '''
     Cleans up the dataframe and saves to datastore
     '''   
@@ -272,13 +392,9 @@ class LPBlockSummarizer:
         for col in columns_to_check:
             if col not in df.columns:
                 df[col] = 0
+        count_columns = ['num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns']
+        df[count_columns] = df[count_columns].astype(int)
         try:
-            for index, row in df.iterrows():
-                block_summary, created_block_summary = BlockSummary.objects.using('writer').update_or_create(
-                    address=row['address'],
-                    block_number=row['block_number'],
-                    defaults=row.to_dict(),
-                )
-            return block_summary,created_block_summary
+            return bulk_upsert(BlockSummary, df, ['address', 'block_number'])
         except Exception as e:
-            logging.info(f"Couldn't save block_summary for {row} %s", str(e))
\ No newline at end of file
+            logging.info(f"Couldn't save block_summary for block {self.blockNumber} %s", str(e))
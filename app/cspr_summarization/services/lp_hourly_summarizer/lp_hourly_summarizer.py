@@ -8,22 +8,123 @@ from cspr_summarization.entities.PairSwapEvent import PairSwapEvent
 from cspr_summarization.entities.PairSyncEvent import PairSyncEvent
 from cspr_summarization.entities.TokenTotalSupply import TokenTotalSupply
 from cspr_summarization.entities.HourlyData import HourlyData
+from cspr_summarization.services.bulk_writer.bulk_writer import bulk_upsert, bulk_update
 
 
 import pandas as pd
 import numpy as np
 from decimal import Decimal
 from django.db.models import F
-from django.db import IntegrityError
+from django.db import IntegrityError, connections, transaction
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
+HOURLY_DATA_KEY = ['address', 'open_timestamp_utc', 'close_timestamp_utc']
+HOURLY_DATA_ZERO_COLUMNS = ['close_reserves_0', 'close_reserves_1', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns',
+                            'mints_0', 'mints_1', 'burns_0', 'burns_1', 'volume_0', 'volume_1', 'max_block', 'close_lp_token_supply']
+
+'''
+# Sums `columns` of df per `by` value with exact integer precision and counts the rows of each group.
+# Amounts are NUMERIC(155) so they are summed as Python ints (object arrays) with np.add.reduceat,
+# Decimal arithmetic would round them to 28 digits. Groups are returned in order of first appearance.
+'''
+def grouped_exact_sum(df, columns, by='address'):
+  codes, uniques = pd.factorize(df[by])
+  result = pd.DataFrame(index=pd.Index(uniques))
+  if len(df) == 0:
+    result['num_events'] = np.array([], dtype=int)
+    for col in columns:
+      result[col] = np.array([], dtype=object)
+    return result
+  order = np.argsort(codes, kind='stable')
+  sorted_codes = codes[order]
+  starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+  result['num_events'] = np.diff(np.r_[starts, len(codes)])
+  for col in columns:
+    values = np.array([int(value) for value in df[col].values], dtype=object)
+    result[col] = np.add.reduceat(values[order], starts)
+  return result
+
+
+# running total column of hourly_data: hourly column it adds up
+HOURLY_DATA_CUMULATIVE_COLUMNS = {'cumulative_volume_0': 'volume_0', 'cumulative_volume_1': 'volume_1',
+                                  'cumulative_num_swaps_0': 'num_swaps_0', 'cumulative_num_swaps_1': 'num_swaps_1',
+                                  'cumulative_num_mints': 'num_mints', 'cumulative_num_burns': 'num_burns'}
+
+'''
+# Sets the running totals (HOURLY_DATA_CUMULATIVE_COLUMNS) of the hourly_data rows with start_hour <= open_timestamp_utc
+# < end_hour (up to the latest row when end_hour is None) of `pairs` (every pair when None, none when empty), from the
+# totals of the latest row of each pair before start_hour, with one UPDATE statement.
+# A row's totals depend on the rows before it: hours must be updated in order, and rewriting past hours shifts the
+# totals of every later row of the pair, which a call without end_hour updates too.
+# Totals left NULL by clear_cumulative_totals stay NULL on the later rows until they are backfilled.
+'''
+def update_cumulative_totals(start_hour, end_hour = None, pairs = None, using='writer'):
+  if pairs is not None and len(pairs) == 0:
+    return 0
+  filters = 'AND open_timestamp_utc < %(end_hour)s' if end_hour is not None else ''
+  if pairs is not None:
+    filters += ' AND address IN %(pairs)s'
+  totals = ', '.join([f'CASE WHEN previous.address IS NULL THEN 0 ELSE previous.{col} END '
+                      f'+ SUM(hours.{hourly_col}) OVER pair_hours AS {col}'
+                      for col, hourly_col in HOURLY_DATA_CUMULATIVE_COLUMNS.items()])
+  with transaction.atomic(using=using):
+    with connections[using].cursor() as cursor:
+      cursor.execute(f'''
+        WITH hours AS (
+          SELECT id, address, open_timestamp_utc, {', '.join(HOURLY_DATA_CUMULATIVE_COLUMNS.values())}
+          FROM hourly_data
+          WHERE open_timestamp_utc >= %(start_hour)s {filters}
+        ), previous AS (
+          SELECT pairs.address, {', '.join([f'latest.{col}' for col in HOURLY_DATA_CUMULATIVE_COLUMNS])}
+          FROM (SELECT DISTINCT address FROM hours) pairs
+          CROSS JOIN LATERAL (
+            SELECT {', '.join(HOURLY_DATA_CUMULATIVE_COLUMNS)}
+            FROM hourly_data
+            WHERE hourly_data.address = pairs.address AND hourly_data.open_timestamp_utc < %(start_hour)s
+            ORDER BY hourly_data.open_timestamp_utc DESC
+            LIMIT 1
+          ) latest
+        ), totals AS (
+          SELECT hours.id, {totals}
+          FROM hours
+          LEFT JOIN previous ON previous.address = hours.address
+          WINDOW pair_hours AS (PARTITION BY hours.address ORDER BY hours.open_timestamp_utc)
+        )
+        UPDATE hourly_data
+        SET {', '.join([f'{col} = totals.{col}' for col in HOURLY_DATA_CUMULATIVE_COLUMNS])}
+        FROM totals
+        WHERE hourly_data.id = totals.id
+      ''', {'start_hour': start_hour, 'end_hour': end_hour, 'pairs': tuple(pairs) if pairs is not None else None})
+      return cursor.rowcount
+
+'''
+# Sets the running totals of the hourly_data rows with open_timestamp_utc >= start_hour of `pairs` (every pair when
+# None) to NULL, for when they could not be updated: period summaries of NULL totals are computed from the hourly rows
+'''
+def clear_cumulative_totals(start_hour, pairs = None, using='writer'):
+  if pairs is not None and len(pairs) == 0:
+    return 0
+  filters = 'AND address IN %(pairs)s' if pairs is not None else ''
+  with transaction.atomic(using=using):
+    with connections[using].cursor() as cursor:
+      cursor.execute(f'''
+        UPDATE hourly_data
+        SET {', '.join([f'{col} = NULL' for col in HOURLY_DATA_CUMULATIVE_COLUMNS])}
+        WHERE open_timestamp_utc >= %(start_hour)s {filters}
+      ''', {'start_hour': start_hour, 'pairs': tuple(pairs) if pairs is not None else None})
+      return cursor.rowcount
+
 class LpHourlySummarizer:
   
-  def __init__(self, start_hour, end_hour):
+  def __init__(self, start_hour, end_hour, pair_state = None, pairs = None):
     self.start_hour = start_hour
     self.end_hour = end_hour
+    # optional list of pair addresses: only these pairs are summarized
+    self.pairs = pairs
+    # optional PairState shared across hours, the close reserves and lp token supplies are read from it
+    self.pair_state = pair_state
     # Fetch the last hour blocks
     blocks = Blocks.objects \
       .filter(timestamp_utc__gte=self.start_hour, timestamp_utc__lt= self.end_hour) \
@@ -31,7 +132,10 @@ class LpHourlySummarizer:
     self.last_hour_block_numbers = pd.DataFrame.from_records(blocks)
     if len(blocks) > 0:
       max_block_number = blocks.first()['block_number']
-      all_pairs = AllPairs.objects.filter(first_mint_event_block_number__lte=max_block_number).values('id', 'contract_address', 'token0_decimals', 'token1_decimals', 'token0_address', 'token1_address')
+      all_pairs = AllPairs.objects.filter(first_mint_event_block_number__lte=max_block_number)
+      if pairs is not None:
+        all_pairs = all_pairs.filter(contract_address__in=pairs)
+      all_pairs = all_pairs.values('id', 'contract_address', 'token0_decimals', 'token1_decimals', 'token0_address', 'token1_address')
       self.all_pairs = pd.DataFrame.from_records(all_pairs)
     else:
       all_pairs = []
@@ -40,19 +144,26 @@ class LpHourlySummarizer:
     
   
   '''
-  # create a record for each pair, with all values at zero
+  # create a record for each pair, with all values at zero (existing records of the hour are reset to zero)
   '''
   def init_hourly_data(self):
-    for index, pair in self.all_pairs.iterrows():
-      try:
-        hourly_data = HourlyData(pair['contract_address'], self.start_hour, self.end_hour)
-        hourly_data.save()
-      except:
-        hourly_data = HourlyData.objects.get(address=pair['contract_address'], open_timestamp_utc=self.start_hour, close_timestamp_utc=self.end_hour)
-        HourlyData.objects \
-            .filter(address=pair['contract_address'], open_timestamp_utc=self.start_hour, close_timestamp_utc=self.end_hour) \
-            .update(close_reserves_0=0 , close_reserves_1= 0, num_swaps_0= 0, num_swaps_1= 0, num_mints= 0, num_burns= 0, \
-                    mints_0= 0, mints_1= 0, burns_0= 0, burns_1= 0, volume_0= 0, volume_1= 0, max_block= 0, close_lp_token_supply= 0)
+    if len(self.all_pairs) == 0:
+      return
+    hourly_data = pd.DataFrame({'address': self.all_pairs['contract_address']})
+    hourly_data['open_timestamp_utc'] = self.start_hour
+    hourly_data['close_timestamp_utc'] = self.end_hour
+    for col in HOURLY_DATA_ZERO_COLUMNS:
+      hourly_data[col] = 0
+    bulk_upsert(HourlyData, hourly_data, HOURLY_DATA_KEY)
+
+  '''
+  # update the given columns of this hour's rows, df must have an `address` column
+  '''
+  def hourly_data_saver(self, df):
+    df = df.copy()
+    df['open_timestamp_utc'] = self.start_hour
+    df['close_timestamp_utc'] = self.end_hour
+    bulk_update(HourlyData, df, HOURLY_DATA_KEY)
   
   '''
   # SyncEvents Summarization
@@ -108,7 +219,7 @@ class LpHourlySummarizer:
   # Close lp token supply
   '''
   def close_lp_token_supply_consumer(self):
-    df_token_supply = self.lp_token_supply_finder()
+    df_token_supply = self.lp_token_supply_finder(self.last_hour_block_numbers.loc[0,'block_number'])
     if len(df_token_supply) > 0:
       close_total_supply = self.lp_token_supply_summarizer(df_token_supply)
       self.lp_token_supply_saver(close_total_supply)
@@ -123,6 +234,71 @@ class LpHourlySummarizer:
     self.max_block_saver(max_block, self.start_hour, self.end_hour)
   
 
+  '''
+  # Single pass summarization: syncs, mints, burns, swaps, lp token supply and max_block are summarized in memory,
+  # joined into one frame and each hourly_data row is written once (replaces init_hourly_data + the six consumers)
+  '''
+  def single_pass_consumer(self):
+    hourly_data = self.single_pass_summarizer()
+    try:
+      bulk_upsert(HourlyData, hourly_data, HOURLY_DATA_KEY)
+    except:
+      logging.error('Error occurred while saving hourly summarization results to DB')
+
+  '''
+  # return the hourly_data rows of every pair for the hour without writing them
+  '''
+  def single_pass_summarizer(self):
+    close_reserves = mints_sum_result = burns_sum_result = swap_sum_result = close_total_supply = max_block = None
+    if len(self.last_hour_block_numbers) > 0:
+      block_numbers = self.last_hour_block_numbers['block_number'].values
+      df_sync = self.sync_finder(self.last_hour_block_numbers.loc[0,'block_number'])
+      if df_sync is not None and len(df_sync) > 0:
+        close_reserves = self.sync_summarizer(df_sync)
+      df_mints = self.mint_finder(block_numbers)
+      if df_mints is not None and len(df_mints) > 0:
+        mints_sum_result = self.mint_summarizer(df_mints)
+      df_burns = self.burn_finder(block_numbers)
+      if df_burns is not None and len(df_burns) > 0:
+        burns_sum_result = self.burn_summarizer(df_burns)
+      df_swaps = self.swap_finder(block_numbers)
+      if df_swaps is not None and len(df_swaps) > 0:
+        swap_sum_result = self.swap_summarizer(df_swaps)
+      df_token_supply = self.lp_token_supply_finder(self.last_hour_block_numbers.loc[0,'block_number'])
+      if df_token_supply is not None and len(df_token_supply) > 0:
+        close_total_supply = self.lp_token_supply_summarizer(df_token_supply)
+      max_block = self.max_block_finder(self.start_hour, self.end_hour)
+
+    return self.hourly_data_assembler(close_reserves, mints_sum_result, burns_sum_result, swap_sum_result,
+                                      close_total_supply, max_block)
+
+  '''
+  # join the summarized data of every pair into one hourly_data frame, pairs without data are at zero
+  '''
+  def hourly_data_assembler(self, close_reserves, mints_sum_result, burns_sum_result, swap_sum_result, close_total_supply, max_block):
+    hourly_data = pd.DataFrame({'address': self.all_pairs['contract_address'] if len(self.all_pairs) > 0 else []})
+    hourly_data = hourly_data.set_index('address')
+    if close_reserves is not None:
+      hourly_data = hourly_data.join(close_reserves.set_index('address')[['reserve0', 'reserve1']] \
+        .rename(columns={'reserve0': 'close_reserves_0', 'reserve1': 'close_reserves_1'}))
+    for sum_result in [mints_sum_result, burns_sum_result, swap_sum_result]:
+      if sum_result is not None:
+        hourly_data = hourly_data.join(sum_result)
+    if close_total_supply is not None:
+      hourly_data = hourly_data.join(close_total_supply.set_index('token_address')[['total_supply']] \
+        .rename(columns={'total_supply': 'close_lp_token_supply'}))
+    for col in HOURLY_DATA_ZERO_COLUMNS:
+      if col not in hourly_data.columns:
+        hourly_data[col] = 0
+    hourly_data = hourly_data.fillna(0)
+    hourly_data['max_block'] = max_block if max_block is not None else 0
+    count_columns = ['num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns', 'max_block']
+    hourly_data[count_columns] = hourly_data[count_columns].astype(int)
+    hourly_data['open_timestamp_utc'] = self.start_hour
+    hourly_data['close_timestamp_utc'] = self.end_hour
+    return hourly_data.reset_index()[HOURLY_DATA_KEY + HOURLY_DATA_ZERO_COLUMNS]
+  
+
   # =================================================================
   #                             Setters
   # =================================================================
@@ -149,17 +325,24 @@ class LpHourlySummarizer:
   # =================================================================
     
   '''
-  # return sync events where sync.block_number in block_numbers arg 
+  # return the latest sync event of every pair where sync.block_number lte block_number arg
   '''
   def sync_finder(self, block_number):
     try:
-      # get all the syncs whose block_number lte arg block_number
+      # the pair state only reads the syncs since the last block it was advanced to
+      if self.pair_state is not None:
+        df_sync = self.pair_state.reserves_at(block_number)
+        if df_sync is not None:
+          return df_sync
+      # get the latest sync of every pair whose block_number lte arg block_number with a single DISTINCT ON (address) query
       # to ensure that in case the current hour doesn't have a sync then we'll get the previous one
       sync_table = PairSyncEvent.objects.using('default') \
         .filter(block_number__lte=block_number) \
+        .order_by('address', '-block_number', '-log_index') \
+        .distinct('address') \
         .values('id', 'address','block_number', 'reserve0', 'reserve1')
 
-      df_sync = pd.DataFrame.from_records(sync_table)
+      df_sync = pd.DataFrame.from_records(sync_table, columns=['id', 'address', 'block_number', 'reserve0', 'reserve1'])
       return df_sync
     except:
       logging.error('Error occurred while trying to fetch pair sync events from DB')
@@ -182,11 +365,9 @@ class LpHourlySummarizer:
   '''
   def sync_saver(self, close_reserves):
     try:
-      for key, item in close_reserves.iterrows():    
-      # Updte DB rows
-        HourlyData.objects.using('writer') \
-          .filter(address=item['address'], open_timestamp_utc=self.start_hour) \
-          .update(close_reserves_0=item['reserve0'], close_reserves_1=item['reserve1'])
+      close_reserves = close_reserves[['address', 'reserve0', 'reserve1']] \
+        .rename(columns={'reserve0': 'close_reserves_0', 'reserve1': 'close_reserves_1'})
+      self.hourly_data_saver(close_reserves)
 
     except:
       logging.error('Error occured while saving sync summarization results to DB')
@@ -218,17 +399,13 @@ class LpHourlySummarizer:
   '''
   def mint_summarizer(self, df_mints):
     try: 
-      mints_sum_result = pd.DataFrame({'num_mints':[], 'mints_0': [], 'mints_1': []})
-      # loop through addresses within df_mints
-      for index, pair in df_mints.iterrows():
-        if pair['address'] in  mints_sum_result.index:
-          mint_sum = mints_sum_result.loc[pair['address']]
-          mint0 = Decimal(int(np.sum([mint_sum['mints_0'], pair['amount0']])))
-          mint1 = Decimal(int(np.sum([mint_sum['mints_1'], pair['amount1']])))
-          num_mints = mint_sum['num_mints'] + 1
-          mints_sum_result.loc[pair['address']] = [num_mints, mint0, mint1]
-        else:
-          mints_sum_result.loc[pair['address']] = [1, pair['amount0'], pair['amount1']]
+      # group by address and sum the amounts
+      sums = grouped_exact_sum(df_mints, ['amount0', 'amount1'])
+      mints_sum_result = pd.DataFrame({
+        'num_mints': sums['num_events'],
+        'mints_0': sums['amount0'].map(Decimal),
+        'mints_1': sums['amount1'].map(Decimal)
+      })
       
       return mints_sum_result
     except:
@@ -240,10 +417,8 @@ class LpHourlySummarizer:
   '''
   def mint_saver(self, mints_result):
     try:
-      for address, item in mints_result.iterrows():
-        HourlyData.objects.using('writer') \
-          .filter(address=address, open_timestamp_utc=self.start_hour) \
-          .update(num_mints=item['num_mints'], mints_0=item['mints_0'], mints_1=item['mints_1'])
+      mints_result = mints_result[['num_mints', 'mints_0', 'mints_1']].astype({'num_mints': int})
+      self.hourly_data_saver(mints_result.rename_axis('address').reset_index())
     except:
       logging.error('Error occurred while saving mint summarization results to DB')
 
@@ -275,17 +450,13 @@ class LpHourlySummarizer:
   '''
   def burn_summarizer(self, df_burns):
     try:
-      burns_sum_result = pd.DataFrame({'num_burns':[], 'burns_0': [], 'burns_1': []})
-      # loop through addresses within df_burn
-      for index, pair in df_burns.iterrows():
-        if pair['address'] in  burns_sum_result.index:
-          my_sum = burns_sum_result.loc[pair['address']]
-          burn0 = Decimal(int(np.sum([my_sum['burns_0'], pair['amount0']])))
-          burn1 = Decimal(int(np.sum([my_sum['burns_1'], pair['amount1']])))
-          num_burns = my_sum['num_burns'] + 1
-          burns_sum_result.loc[pair['address']] = [num_burns, burn0, burn1]
-        else:
-          burns_sum_result.loc[pair['address']] = [1, pair['amount0'], pair['amount1']]
+      # group by address and sum the amounts
+      sums = grouped_exact_sum(df_burns, ['amount0', 'amount1'])
+      burns_sum_result = pd.DataFrame({
+        'num_burns': sums['num_events'],
+        'burns_0': sums['amount0'].map(Decimal),
+        'burns_1': sums['amount1'].map(Decimal)
+      })
       
       return burns_sum_result
     except:
@@ -297,10 +468,8 @@ class LpHourlySummarizer:
   '''
   def burn_saver(self, burns_result):
     try:
-      for address, item in burns_result.iterrows():
-        HourlyData.objects.using('writer') \
-          .filter(address=address, open_timestamp_utc=self.start_hour) \
-          .update(num_burns=item['num_burns'], burns_0=item['burns_0'], burns_1=item['burns_1'])
+      burns_result = burns_result[['num_burns', 'burns_0', 'burns_1']].astype({'num_burns': int})
+      self.hourly_data_saver(burns_result.rename_axis('address').reset_index())
     except:
       logging.error('Error occurred while trying to save burns summarization results to DB')
 
@@ -332,25 +501,18 @@ class LpHourlySummarizer:
   '''
   def swap_summarizer(self, df_swaps):
     try:
-      # swap_sum_result
-      swap_sum_result = pd.DataFrame({'num_swaps_0':[], 'num_swaps_1':[], 'amount0_in':[], 'amount0_out':[], 'amount1_in':[], 'amount1_out':[], 'volume_0':[], 'volume_1':[]})
+      # a swap counts for a token when some amount of this token went in or out
+      df_swaps = df_swaps.assign(swap_0=((df_swaps['amount0_in'] > 0) | (df_swaps['amount0_out'] > 0)).astype(int),
+                                 swap_1=((df_swaps['amount1_in'] > 0) | (df_swaps['amount1_out'] > 0)).astype(int))
       # aggregate with group_by pair
-      for index, item in df_swaps.iterrows():
-        if item['address'] in swap_sum_result.index:
-          my_swap = swap_sum_result.loc[item['address']]
-          num_swaps_0 = my_swap['num_swaps_0'] + 1 if (item['amount0_in'] > 0 or item['amount0_out']>0) else my_swap['num_swaps_0']
-          num_swaps_1 = my_swap['num_swaps_1'] + 1 if (item['amount1_in'] > 0 or item['amount1_out']>0) else my_swap['num_swaps_1']
-          amount0_in = Decimal(int(np.sum([my_swap['amount0_in'], item['amount0_in']])))
-          amount0_out = Decimal(int(np.sum([my_swap['amount0_out'], item['amount0_out']])))
-          amount1_in = Decimal(int(np.sum([my_swap['amount1_in'], item['amount1_in']])))
-          amount1_out = Decimal(int(np.sum([my_swap['amount1_out'], item['amount1_out']])))
-          swap_sum_result.loc[item['address']] = [num_swaps_0, num_swaps_1, amount0_in, amount0_out, amount1_in, amount1_out, 0, 0]
-        else: 
-          swap_sum_result.loc[item['address']] = [1, 1, item['amount0_in'], item['amount0_out'], item['amount1_in'], item['amount1_out'], 0, 0]
-      # update Volumes ( |amount0_in - amount1_in| )
-      for address, item in swap_sum_result.iterrows():
-        swap_sum_result.loc[address, 'volume_0'] = Decimal(int(np.abs(item['amount0_in'] - item['amount0_out'])))
-        swap_sum_result.loc[address, 'volume_1'] = Decimal(int(np.abs(item['amount1_in'] - item['amount1_out'])))
+      sums = grouped_exact_sum(df_swaps, ['swap_0', 'swap_1', 'amount0_in', 'amount0_out', 'amount1_in', 'amount1_out'])
+      # Volumes ( |amount_in - amount_out| )
+      swap_sum_result = pd.DataFrame({
+        'num_swaps_0': sums['swap_0'].astype(int),
+        'num_swaps_1': sums['swap_1'].astype(int),
+        'volume_0': (sums['amount0_in'] - sums['amount0_out']).abs().map(Decimal),
+        'volume_1': (sums['amount1_in'] - sums['amount1_out']).abs().map(Decimal)
+      })
       
       return swap_sum_result[['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']]
     except:
@@ -363,10 +525,8 @@ class LpHourlySummarizer:
   def swap_saver(self, swap_result):
     try:
       # update DB
-      for address, item in swap_result.iterrows():
-        HourlyData.objects.using('writer') \
-          .filter(address=address, open_timestamp_utc=self.start_hour) \
-          .update(num_swaps_0=item['num_swaps_0'], num_swaps_1=item['num_swaps_1'], volume_0=item['volume_0'], volume_1=item['volume_1'])
+      swap_result = swap_result[['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']].astype({'num_swaps_0': int, 'num_swaps_1': int})
+      self.hourly_data_saver(swap_result.rename_axis('address').reset_index())
     except:
       logging.error('Error occurred while trying to save swaps summarization results to DB')
   
@@ -379,12 +539,21 @@ class LpHourlySummarizer:
   # =================================================================
 
   '''
-  # return token total supply rows
+  # return the latest token total supply row of every token where block_number lte block_number arg
   '''
-  def lp_token_supply_finder(self):
+  def lp_token_supply_finder(self, block_number):
     try:
-      token_total_supply_table = TokenTotalSupply.objects.using('default').values()
-      df_token_supply = pd.DataFrame.from_records(token_total_supply_table)
+      if self.pair_state is not None:
+        df_token_supply = self.pair_state.supplies_at(block_number)
+        if df_token_supply is not None:
+          return df_token_supply
+      # a single DISTINCT ON (token_address) query bounded by the hour's max block
+      token_total_supply_table = TokenTotalSupply.objects.using('default') \
+        .filter(block_number__lte=block_number) \
+        .order_by('token_address', '-block_number') \
+        .distinct('token_address') \
+        .values('id', 'token_address', 'block_number', 'total_supply')
+      df_token_supply = pd.DataFrame.from_records(token_total_supply_table, columns=['id', 'token_address', 'block_number', 'total_supply'])
 
       return df_token_supply
     except:
@@ -407,10 +576,9 @@ class LpHourlySummarizer:
   '''
   def lp_token_supply_saver(self, close_total_supply):
     try:
-      for key, item in close_total_supply.iterrows():
-        HourlyData.objects.using('writer') \
-          .filter(address=item['token_address'], open_timestamp_utc=self.start_hour) \
-          .update(close_lp_token_supply=item['total_supply'])
+      close_total_supply = close_total_supply[['token_address', 'total_supply']] \
+        .rename(columns={'token_address': 'address', 'total_supply': 'close_lp_token_supply'})
+      self.hourly_data_saver(close_total_supply)
     except:
       logging.error('Error occurred while trying to save lp_supply_token to DB')
 
@@ -449,5 +617,25 @@ class LpHourlySummarizer:
   # =================================================================
   #                       end Max_block methods
   # =================================================================
+
+  # =================================================================
+  #                     Cumulative totals methods
+  # =================================================================
+
+  '''
+  # Running totals of the hour's rows, the rows after it are shifted by the caller once all the hours are written.
+  # When they cannot be updated, the totals of the hour and of the later rows are cleared instead of being left stale
+  '''
+  def cumulative_totals_consumer(self):
+    if len(self.all_pairs) == 0:
+      return
+    try:
+      update_cumulative_totals(self.start_hour, self.end_hour, self.pairs)
+    except Exception as e:
+      logging.error(f'Error occurred while trying to update the cumulative totals of hourly_data, clearing them: {str(e)}')
+      clear_cumulative_totals(self.start_hour, self.pairs)
+  # =================================================================
+  #                   end Cumulative totals methods
+  # =================================================================
   
     
\ No newline at end of file
@@ -13,6 +13,28 @@ class TokenNotTrackedError(Exception):
 class TokenPricesNotFound(Exception):
     pass
 
+TOKEN_PRICE_COLUMNS = """
+    close as close_price,
+    open as open_price,
+    high as high_price,
+    low as low_price,
+    timestamp_utc as open_timestamp_utc,
+    timestamp_utc + INTERVAL '1 hour' as close_timestamp_utc,
+    ath as all_time_high,
+    hrs_since_ath as hours_since_ath"""
+
+
+def _clean_token_prices(token_prices) -> pd.DataFrame:
+    """
+    Naive UTC timestamps, and the missing or 0 prices replaced by the previous price
+    """
+    if len(token_prices) > 0:
+        token_prices['open_timestamp_utc'] = token_prices['open_timestamp_utc'].dt.tz_convert(None)
+        token_prices['close_timestamp_utc'] = token_prices['close_timestamp_utc'].dt.tz_convert(None)
+        token_prices = token_prices.fillna(0).replace(to_replace=0, method='ffill')
+    return token_prices.dropna(subset=['close_price'])
+
+
 class ExchangeRate:
     """
     Responsible for fetching token prices.
@@ -68,25 +90,105 @@ class ExchangeRate:
         # NOTE: Assumes currency is USD for this version
         query = f"""
             SELECT 
-                close as close_price,
-                open as open_price,
-                high as high_price,
-                low as low_price,
-                timestamp_utc as open_timestamp_utc,
-                timestamp_utc + INTERVAL '1 hour' as close_timestamp_utc,
-                ath as all_time_high,
-                hrs_since_ath as hours_since_ath
+                {TOKEN_PRICE_COLUMNS}
             FROM exchange_rate
             WHERE 
                 currency = 1 AND base_currency={token_id} AND
                 timestamp_utc BETWEEN '{self.start_date}' AND '{self.end_date}'
+            ORDER BY timestamp_utc
+        """
+        token_prices = pd.read_sql(text(query), self.prod_us1_conn, parse_dates=['open_timestamp_utc', 'close_timestamp_utc'])
+        return _clean_token_prices(token_prices)
+
+    def load_token_price_histories(self, token_addresses, network):
+        """
+        Loads the prices of many tokens at once, with one currency query and one exchange_rate query, so that
+        get_token_price_history serves them from memory
+
+        @param token_addresses: addresses of the tokens
+        @param network: network of the tokens
+        """
+        self._assert_required_input(request_type='history')
+        missing_addresses = ", ".join(f"'{address}'" for address in set(token_addresses)
+                                      if address not in self.token_address_id_map)
+        if missing_addresses:
+            query = f"SELECT token_address, id FROM currency WHERE token_address IN ({missing_addresses}) and network_id={network}"
+            self.token_address_id_map.update(dict(self.prod_us1_conn.execute(text(query)).fetchall()))
+        token_ids = {self.token_address_id_map[address] for address in token_addresses
+                     if address in self.token_address_id_map} - set(self.prices)
+        if len(token_ids) == 0:
+            return
+        query = f"""
+            SELECT 
+                base_currency,
+                {TOKEN_PRICE_COLUMNS}
+            FROM exchange_rate
+            WHERE 
+                currency = 1 AND base_currency IN ({", ".join(str(token_id) for token_id in token_ids)}) AND
+                timestamp_utc BETWEEN '{self.start_date}' AND '{self.end_date}'
+            ORDER BY base_currency, timestamp_utc
         """
         token_prices = pd.read_sql(text(query), self.prod_us1_conn, parse_dates=['open_timestamp_utc', 'close_timestamp_utc'])
-        if len(token_prices) > 0:
-            token_prices['open_timestamp_utc'] = token_prices['open_timestamp_utc'].dt.tz_convert(None)
-            token_prices['close_timestamp_utc'] = token_prices['close_timestamp_utc'].dt.tz_convert(None)
-            token_prices = token_prices.fillna(0).replace(to_replace=0, method='ffill')
-        return token_prices.dropna(subset=['close_price'])
+        # the tokens without prices are left to get_token_price_history_by_id, which reports them
+        for token_id, prices in token_prices.groupby('base_currency'):
+            prices = _clean_token_prices(prices.drop('base_currency', axis=1).reset_index(drop=True))
+            if not prices.empty:
+                self.prices[token_id] = prices
+
+    def get_token_period_prices(self, token_periods, network) -> pd.DataFrame:
+        """
+        Prices of tokens over periods from lookups at the first and last hour of each period, without loading the
+        hours in between: the latest prices at or before these hours (0 prices skipped, as get_token_price_history
+        replaces them with the previous price), and the high, low and all time high of the period
+
+        @param token_periods: dataframe with the token_address, first_hour and last_hour (naive UTC) of each period
+        @param network: network of the tokens
+        @return: open_price (first hour), close_price (last hour), high_price, low_price, all_time_high and
+        hours_since_ath (last hour) of the periods with prices, indexed like token_periods
+        """
+        self._assert_required_input(request_type='quote')
+        token_period_values = ", ".join(f"({period}, '{row.token_address}', CAST('{row.first_hour}' AS timestamptz), "
+                                        f"CAST('{row.last_hour}' AS timestamptz))"
+                                        for period, row in enumerate(token_periods.itertuples()))
+        # NOTE: Assumes currency is USD for this version
+        query = f"""
+            WITH token_periods (period, token_address, first_hour, last_hour) AS (VALUES {token_period_values})
+            SELECT
+                token_periods.period,
+                first_prices.open AS open_price,
+                last_prices.close AS close_price,
+                period_range.high AS high_price,
+                period_range.low AS low_price,
+                period_range.ath AS all_time_high,
+                last_prices.hrs_since_ath AS hours_since_ath
+            FROM token_periods
+            JOIN currency ON currency.token_address = token_periods.token_address AND currency.network_id = {network}
+            CROSS JOIN LATERAL (
+                SELECT open
+                FROM exchange_rate
+                WHERE currency = 1 AND base_currency = currency.id AND timestamp_utc <= token_periods.first_hour
+                AND open > 0
+                ORDER BY timestamp_utc DESC
+                LIMIT 1
+            ) first_prices
+            CROSS JOIN LATERAL (
+                SELECT close, hrs_since_ath
+                FROM exchange_rate
+                WHERE currency = 1 AND base_currency = currency.id AND timestamp_utc <= token_periods.last_hour
+                AND close > 0
+                ORDER BY timestamp_utc DESC
+                LIMIT 1
+            ) last_prices
+            CROSS JOIN LATERAL (
+                SELECT MAX(NULLIF(high, 0)) AS high, MIN(NULLIF(low, 0)) AS low, MAX(ath) AS ath
+                FROM exchange_rate
+                WHERE currency = 1 AND base_currency = currency.id
+                AND timestamp_utc BETWEEN token_periods.first_hour AND token_periods.last_hour
+            ) period_range
+        """
+        prices = pd.read_sql(text(query), self.prod_us1_conn, index_col='period')
+        prices.index = token_periods.index[prices.index]
+        return prices
 
     def _assert_required_input(self, request_type):
         assert request_type in ['history', 'quote']
@@ -18,11 +18,139 @@ import pandas as pd
 from db_connection_manager import DBConnectionManager
 from datetime import timedelta, datetime
 import concurrent.futures
+import io
+import multiprocessing
+import queue
+import json
+import time
 import numpy as np
 from utils import load_blocks_range_df
+from shared_frames import to_shared_memory, from_shared_memory
+from pricing.native_price import NativePrice, NATIVE_PRICE_DIR
 
 EXCHANGE_RATE_TBL_NAME = "exchange_rate"
 NUM_THREADS = 15
+# thread: the tokens are priced by NUM_THREADS threads, process: by NUM_PROCESSES processes (pricing is GIL bound)
+WORKERS_MODE = os.getenv('EXCHANGE_RATE_WORKERS_MODE', 'thread')
+NUM_PROCESSES = int(os.getenv('EXCHANGE_RATE_NUM_PROCESSES') or os.cpu_count())
+# number of tokens whose exchange rates are written together, with one COPY and one transaction
+WRITE_BATCH_TOKENS = int(os.getenv('EXCHANGE_RATE_WRITE_BATCH_TOKENS') or 50)
+EXCHANGE_RATE_COLUMNS = ['currency', 'base_currency', 'timestamp_utc', 'open', 'high', 'low', 'close', 'ath',
+                         'hrs_since_ath']
+# file where the time taken to price each token is kept, to schedule the most expensive tokens first (empty: no file)
+TOKEN_TIMINGS_PATH = os.getenv('EXCHANGE_RATE_TOKEN_TIMINGS_PATH')
+# file where the all time high of each token as at its last hour written is kept, so a run carries on from it without
+# waiting for fungible_token_pricing to be refreshed (empty: the latest_ath of fungible_token_pricing is used)
+ATH_STATE_PATH = os.getenv('EXCHANGE_RATE_ATH_STATE_PATH')
+
+# state of a worker process, set by _init_worker_process
+_worker_process = {}
+
+class ExchangeRateWriteError(Exception):
+    def __init__(self, token_ids, error):
+        super().__init__(f"could not write the exchange rates of tokens {token_ids}: {str(error)[0:500]}")
+        # target_token_id of each token whose exchange rates were dropped
+        self.token_ids = token_ids
+
+
+class ExchangeRateWriter:
+    def __init__(self, engine, batch_tokens=WRITE_BATCH_TOKENS):
+        """
+        Writes the exchange rates of many tokens at once: the rates are kept until batch_tokens tokens were added, then
+        streamed with COPY to a temporary table and merged in the exchange rate table in one transaction. The hours
+        already in the table (one_price_per_hour) are updated, so writing the same hours again is harmless
+
+        @param engine: write engine of the database of the exchange rate table
+        @param batch_tokens: number of tokens written together
+        """
+        self.engine = engine
+        self.batch_tokens = batch_tokens
+        self._rates = []
+        # all time high state of each token as at the last hour written, by target_token_id
+        self.ath_states = {}
+
+    def add(self, ohlc_ath_df):
+        """
+        Adds the exchange rates of a token, written once the batch is full (see flush)
+
+        @param ohlc_ath_df: exchange rates indexed by timestamp_utc, see _get_exchange_rates
+        """
+        self._rates.append(ohlc_ath_df)
+        if len(self._rates) >= self.batch_tokens:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes the exchange rates added since the last write. If the batch can't be written, its tokens are written one
+        at a time and the rates of the tokens that still fail are dropped, so a bad token does not hold up the others
+
+        @return: number of rows written
+        @raise ExchangeRateWriteError: with the tokens dropped, once the others are written
+        """
+        pending, self._rates = self._rates, []
+        if len(pending) == 0:
+            return 0
+        try:
+            return self._write(pending)
+        except Exception as e:
+            if len(pending) == 1:
+                raise ExchangeRateWriteError([int(token_id) for token_id in pending[0]['base_currency'].unique()], e)
+            print(f"WARNING: could not write the exchange rates of a batch of {len(pending)} tokens, writing them one "
+                  f"at a time:", str(e)[0:500])
+        num_rows = 0
+        failed_token_ids = []
+        error = None
+        for ohlc_ath_df in pending:
+            try:
+                num_rows += self._write([ohlc_ath_df])
+            except Exception as e:
+                failed_token_ids += [int(token_id) for token_id in ohlc_ath_df['base_currency'].unique()]
+                error = e
+        if len(failed_token_ids) > 0:
+            raise ExchangeRateWriteError(failed_token_ids, error)
+        return num_rows
+
+    def _write(self, token_rates) -> int:
+        """
+        Writes the exchange rates of tokens in one transaction and keeps the all time high state of their last hour
+
+        @param token_rates: list of the exchange rates of each token, see add
+        @return: number of rows written
+        """
+        rates = pd.concat(token_rates).reset_index()[EXCHANGE_RATE_COLUMNS]
+        csv = io.StringIO()
+        rates.to_csv(csv, index=False, header=False)
+        csv.seek(0)
+
+        columns = ", ".join(f'"{column}"' for column in EXCHANGE_RATE_COLUMNS)
+        updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in EXCHANGE_RATE_COLUMNS[3:])
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    CREATE TEMPORARY TABLE {EXCHANGE_RATE_TBL_NAME}_batch ON COMMIT DROP AS
+                    SELECT {columns} FROM {EXCHANGE_RATE_TBL_NAME} WITH NO DATA""")
+                cursor.copy_expert(f"COPY {EXCHANGE_RATE_TBL_NAME}_batch ({columns}) FROM STDIN WITH (FORMAT csv)", csv)
+                # one row per hour and token, ON CONFLICT can't update the same row twice
+                cursor.execute(f"""
+                    INSERT INTO {EXCHANGE_RATE_TBL_NAME} ({columns})
+                    SELECT DISTINCT ON (currency, base_currency, timestamp_utc) {columns}
+                    FROM {EXCHANGE_RATE_TBL_NAME}_batch
+                    ON CONFLICT ON CONSTRAINT one_price_per_hour DO UPDATE SET {updates}""")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        # these hours are committed, the next run of these tokens can carry on from their last one
+        last_hours = rates.sort_values('timestamp_utc', kind='stable').groupby('base_currency').tail(1)
+        for last_hour in last_hours.itertuples():
+            self.ath_states[int(last_hour.base_currency)] = {'timestamp_utc': last_hour.timestamp_utc.isoformat(),
+                                                             'ath': float(last_hour.ath),
+                                                             'hrs_since_ath': int(last_hour.hrs_since_ath)}
+        return len(rates)
+
 
 def _load_target_tokens_info(prod_us1_conn, prod_us1_conn_write):
     """
@@ -73,6 +201,11 @@ def _get_network_token_price(start_block, end_block, table_name, fl_agg_conn):
     @param fl_agg_conn:
     @return:
     """
+    if NATIVE_PRICE_DIR:
+        # only the blocks added since the last run are read, the series is a view of the memory mapped file
+        native_price = NativePrice(NATIVE_PRICE_DIR, table_name)
+        native_price.update(fl_agg_conn, start_block, end_block)
+        return native_price.get(start_block, end_block)
     ntwk_token_price_query = f"""SELECT 
                             block_number, {table_name}_usd
                             FROM {table_name}
@@ -84,49 +217,68 @@ def _get_network_token_price(start_block, end_block, table_name, fl_agg_conn):
     return network_token_price_usd
 
 
-def _get_job_indices(max_num_threads, num_jobs):
-    """
-    Useful for dividing a set of jobs across multiple threads
-    Returns a list of tuples with two elements: index of start and index of end for each set of jobs
-    """
-    num_threads = min(max_num_threads, num_jobs)
-    num_jobs_per_thread = int(round(num_jobs / num_threads+.5, 0))
-    job_indices = [(thread_num*num_jobs_per_thread, (thread_num+1)*num_jobs_per_thread)
-                   for thread_num in range(num_threads)]
-    return job_indices
-
-
-def _ohlc_from_series(prices) -> tuple:
+def get_ohlc(price_index, blocks_ranges):
     """
-    Returns the open, high, low and the close price (OHLC) from pd.Series of prices
-    @return: tuple
+    Open, high, low and close price of every hour of blocks_ranges. The first and last block of each hour are located
+    with np.searchsorted on the block numbers of price_index and the high and low are computed for all the hours at once
+    with np.fmax.reduceat and np.fmin.reduceat (NaN prices are skipped like pd.Series.max/min). Hours without any
+    price are NaN.
+
+    @param price_index: price per block, indexed by block number
+    @param blocks_ranges: dataframe with the start_block and end_block (inclusive) of each hour
+    @return: dataframe with the open, high, low and close columns, indexed like blocks_ranges
     """
-    if len(prices) > 0:
-        return prices.iloc[0], prices.max(), prices.min(), prices.iloc[-1]
-    return np.nan, np.nan, np.nan, np.nan
-
-
-def get_ohlc(price_index, blocks_ranges):
+    if not price_index.index.is_monotonic_increasing:
+        price_index = price_index.sort_index()
+    blocks = price_index.index.values
+    prices = price_index.values.astype(float)
+
+    starts = np.searchsorted(blocks, blocks_ranges['start_block'].values, side='left')
+    ends = np.searchsorted(blocks, blocks_ranges['end_block'].values, side='right')
+    priced = ends > starts
+
+    ohlc_rates = np.full((len(blocks_ranges), 4), np.nan)
+    if priced.any():
+        starts, ends = starts[priced], ends[priced]
+        # reduceat over the (start, end) pairs reduces prices[start:end] at the even positions, the NaN appended at
+        # the end keeps an end equal to len(prices) a valid index
+        bounds = np.column_stack([starts, ends]).ravel()
+        padded_prices = np.append(prices, np.nan)
+        ohlc_rates[priced, 0] = prices[starts]
+        ohlc_rates[priced, 1] = np.fmax.reduceat(padded_prices, bounds)[::2]
+        ohlc_rates[priced, 2] = np.fmin.reduceat(padded_prices, bounds)[::2]
+        ohlc_rates[priced, 3] = prices[ends - 1]
+
+    return pd.DataFrame(ohlc_rates, index=blocks_ranges.index, columns=["open", "high", "low", "close"])
+
+
+def get_step_ohlc(price_index, blocks_ranges):
     """
+    Open, high, low and close price of every hour of blocks_ranges from a step function price index (the blocks where
+    the price changes, as returned by PriceIndex.get_sparse_price_index). The price in effect at the start of each hour
+    is added to the changes inside the hour, so the result is get_ohlc of the price index expanded to every block.
 
-    @param price_index:
-    @param blocks_ranges:
-    @return:
+    @param price_index: price per block where the price changes, indexed by block number
+    @param blocks_ranges: dataframe with the start_block and end_block (inclusive) of each hour
+    @return: dataframe with the open, high, low and close columns, indexed like blocks_ranges
     """
-    ohlc_rates = blocks_ranges.apply(
-        lambda x: _ohlc_from_series(price_index.loc[x['start_block']:x['end_block']]), axis=1)
-
-    ohlc_rates = ohlc_rates.apply(pd.Series)
-    ohlc_rates.columns = ["open", "high", "low", "close"]
-    return ohlc_rates
+    if len(price_index) == 0:
+        return get_ohlc(price_index, blocks_ranges)
+    if not price_index.index.is_monotonic_increasing:
+        price_index = price_index.sort_index()
+    start_blocks = blocks_ranges['start_block'].values
+    start_blocks = start_blocks[(start_blocks > price_index.index[0]) & ~np.isin(start_blocks, price_index.index)]
+    opening_prices = price_index.reindex(start_blocks, method='ffill')
+    return get_ohlc(pd.concat([price_index, opening_prices]).sort_index(kind='stable'), blocks_ranges)
 
 
 def _append_ath_metrics(ohlc, latest_ath, hrs_since_ath) -> pd.DataFrame:
     """
-    Helper function responsible for calculating the all time high and the number of hours since the all time high
+    Helper function responsible for calculating the all time high and the number of hours since the all time high, in
+    one pass over the new hours from the state as at the beginning of this dataframe
 
     @param ohlc: A dataframe containing open, high, low, and close rates
-    @param ath: all time high rate as at the beginning of this dataframe
+    @param latest_ath: all time high rate as at the beginning of this dataframe
     @param hrs_since_ath: number of hours as at the beginning of this dataframe
     @return: ohlc with ath metrics
     """
@@ -135,71 +287,330 @@ def _append_ath_metrics(ohlc, latest_ath, hrs_since_ath) -> pd.DataFrame:
         latest_ath = 0
         hrs_since_ath = 0
 
-    ohlc['ath'] = np.maximum(latest_ath, ohlc['high'].expanding().max())
-    ohlc['hrs_since_ath'] = ohlc['ath'].groupby((ohlc['ath'] != ohlc['ath'].shift()).cumsum()).cumcount()
-    if ohlc['ath'].iloc[0] == latest_ath:
-        if 0 in ohlc['hrs_since_ath'].iloc[1:].values:
-            # index where there is a new all time high
-            idx = ohlc['hrs_since_ath'].iloc[1:][ohlc['hrs_since_ath'].iloc[1:] == 0].idxmax()
-            # index right before all time high occurs
-            idx = ohlc.loc[:idx].index[-2]
-        else:
-            idx = None
-        ohlc.loc[:idx, 'hrs_since_ath'] += (hrs_since_ath + 1)
+    ath = np.fmax.accumulate(np.fmax(ohlc['high'].values, latest_ath))
+    hours = np.arange(len(ohlc))
+    # hour of the latest new all time high, the hours before the first one carry on from the previous all time high
+    is_new_ath = ath > np.concatenate([[latest_ath], ath[:-1]])
+    ath_hour = np.maximum.accumulate(np.where(is_new_ath, hours, -(int(hrs_since_ath) + 1)))
+    ohlc['ath'] = ath
+    ohlc['hrs_since_ath'] = hours - ath_hour
     return ohlc
 
 
-def populate_exchange_rate(tokens, network_token_price, blocks_ranges, dbcm):
+def _get_token_blocks(token_info, blocks_ranges) -> tuple:
     """
-    Populates our exchange rate table.
+    First and last block (inclusive) to price a token, (None, None) if there is no hour to price
+
+    @param token_info: pricing information of the token
+    @param blocks_ranges: A dataframe containing the starting and ending block for each hour
+    """
+    target_blocks_ranges = blocks_ranges[token_info['start_timestamp']:]
+    if len(target_blocks_ranges) == 0:
+        return None, None
+    return target_blocks_ranges.iloc[0]['start_block'], target_blocks_ranges.iloc[-1]['end_block']
+
+
+def _load_json_file(path, description) -> dict:
+    """
+    Content of a json file kept between runs, empty when there is no file or it can't be read
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except Exception as e:
+        print(f"ERROR: could not load the {description}:", str(e)[0:500])
+        return {}
+
+
+def _save_json_file(path, content, description):
+    """
+    Writes a json file kept between runs (written to a temp file first so a crash never leaves a partial file)
+    """
+    if not path:
+        return
+    try:
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as json_file:
+            json.dump(content, json_file)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"ERROR: could not save the {description}:", str(e)[0:500])
+
+
+def _load_token_timings(path) -> dict:
+    """
+    Seconds per block it took to price each token (by target_token_id) in the previous runs, empty when unknown
+    """
+    return {int(token_id): seconds for token_id, seconds in _load_json_file(path, "token timings").items()}
+
+
+def _save_token_timings(path, timings):
+    """
+    Writes the seconds per block it took to price each token
+    """
+    _save_json_file(path, {str(token_id): seconds for token_id, seconds in timings.items()}, "token timings")
+
+
+def _load_ath_states(path) -> dict:
+    """
+    All time high state of each token (by target_token_id) as at its last hour written, see ExchangeRateWriter
+    """
+    return {int(token_id): state for token_id, state in _load_json_file(path, "ath states").items()}
+
+
+def _save_ath_states(path, ath_states):
+    """
+    Writes the all time high state of each token
+    """
+    _save_json_file(path, {str(token_id): state for token_id, state in ath_states.items()}, "ath states")
+
+
+def _apply_ath_states(tokens, ath_states) -> pd.DataFrame:
+    """
+    Starts the tokens whose all time high state is at least as recent as their latest price in fungible_token_pricing
+    (which is only as recent as its last refresh) from the hour after the state, with its all time high
+
+    @param tokens: A dataframe containing pricing information, see _load_target_tokens_info
+    @param ath_states: all time high state of each token, by target_token_id
+    @return: tokens with their start_timestamp, latest_ath and latest_hrs_since_ath
+    """
+    if len(ath_states) == 0 or len(tokens) == 0:
+        return tokens
+    states = pd.DataFrame.from_dict(ath_states, orient='index').reindex(tokens['target_token_id'].values)
+    states.index = tokens.index
+    next_hour = pd.to_datetime(states['timestamp_utc'], utc=True) + timedelta(hours=1)
+    is_ahead = next_hour >= tokens['start_timestamp']
+    tokens = tokens.copy()
+    tokens['start_timestamp'] = tokens['start_timestamp'].mask(is_ahead, next_hour)
+    tokens['latest_ath'] = tokens['latest_ath'].mask(is_ahead, states['ath'])
+    tokens['latest_hrs_since_ath'] = tokens['latest_hrs_since_ath'].mask(is_ahead, states['hrs_since_ath'])
+    return tokens
+
+
+def _schedule_tokens(tokens, blocks_ranges, pricing_data, timings) -> pd.DataFrame:
+    """
+    Orders the tokens by decreasing expected cost, so the longest ones start first and the workers pulling the
+    tokens one at a time finish together. The cost of a token is its number of blocks to price times the seconds per
+    block it took last time, or, for a token never timed, times its number of pricing pools and the median seconds
+    per block and pool of the timed tokens
+
+    @param tokens: A dataframe containing pricing information
+    @param blocks_ranges: A dataframe containing the starting and ending block for each hour
+    @param pricing_data: pricing pools and reserves loaded by _load_pricing_data
+    @param timings: seconds per block of the tokens timed before, by target_token_id
+    @return: tokens, most expensive first
+    """
+    if len(tokens) == 0:
+        return tokens
+    num_pools = pricing_data['pricing_info'].groupby('target_token_id').size()
+    token_num_pools = tokens['target_token_id'].map(num_pools).fillna(1).clip(lower=1)
+    num_blocks = []
+    for _, token_info in tokens.iterrows():
+        start_block, end_block = _get_token_blocks(token_info, blocks_ranges)
+        num_blocks.append(0 if start_block is None else end_block - start_block + 1)
+    seconds_per_block = tokens['target_token_id'].map(timings)
+    timed = seconds_per_block.notna()
+    seconds_per_pool_block = (seconds_per_block[timed] / token_num_pools[timed]).median() if timed.any() else 1
+    seconds_per_block = seconds_per_block.fillna(token_num_pools * seconds_per_pool_block)
+    expected_cost = np.array(num_blocks) * seconds_per_block.values
+    return tokens.iloc[np.argsort(-expected_cost, kind='stable')]
+
+
+def _fill_token_queue(token_queue, tokens, num_workers):
+    """
+    Puts the tokens in the queue, in order, followed by a None per worker to mark the end of the queue
+    """
+    for _, token_info in tokens.iterrows():
+        token_queue.put(token_info)
+    for _ in range(num_workers):
+        token_queue.put(None)
+
+
+def _pull_token(token_queue):
+    """
+    Next token of the queue (see _fill_token_queue), None once there are no more tokens
+    """
+    return token_queue.get()
+
+
+def _load_pricing_data(tokens, blocks_ranges, network, prod_us1_conn, fl_agg_conn) -> dict:
+    """
+    Loads the pricing pools and the reserves needed to price all the tokens of a network at once, to be shared by
+    every populate_exchange_rate job of the network
 
     @param tokens: A dataframe containing pricing information
+    @param blocks_ranges: A dataframe containing the starting and ending block for each hour
+    @param network: fluidefi network id
+    @return: pricing data, see PriceIndex.load_pricing_data
+    """
+    start_blocks = {}
+    for _, token_info in tokens.iterrows():
+        start_block, _ = _get_token_blocks(token_info, blocks_ranges)
+        if start_block is not None:
+            start_blocks[token_info['target_token_id']] = start_block
+    pi = PriceIndex(prod_us1_conn, fl_agg_conn)
+    return pi.load_pricing_data(start_blocks, blocks_ranges.iloc[-1]['end_block'], network)
+
+
+def _get_exchange_rates(pi, token_info, blocks_ranges):
+    """
+    Hourly exchange rates of a token, with their all time high metrics, from its first hour to price
+
+    @param pi: PriceIndex of the token's network
+    @param token_info: pricing information of the token
+    @param blocks_ranges: A dataframe containing the starting and ending block for each hour
+    @return: dataframe of the rates to write to the exchange rate table, None if the token can't be priced
+    """
+    # Used for debugging if token_info['target_token_id'] < 1000:
+    target_blocks_ranges = blocks_ranges[token_info['start_timestamp']:]
+    start_block, end_block = _get_token_blocks(token_info, blocks_ranges)
+    price_index = pi.get_sparse_price_index(start_block, end_block, currency_id=token_info['target_token_id'])
+    if len(price_index) == 0:
+        message = f"Skipping {token_info['target_token_address']}, empty price index series."
+        print(message)
+        return None
+    ohlc_rates = get_step_ohlc(price_index, target_blocks_ranges).dropna()
+    ohlc_ath_df = _append_ath_metrics(ohlc_rates, token_info['latest_ath'], token_info['latest_hrs_since_ath'])
+
+    ohlc_ath_df['base_currency'] = token_info['target_token_id']
+    ohlc_ath_df['currency'] = 1
+    ohlc_ath_df.index.name = "timestamp_utc"
+    # print(ohlc_ath_df)
+    return ohlc_ath_df
+
+
+def populate_exchange_rate(token_queue, network_token_price, blocks_ranges, dbcm, pricing_data=None):
+    """
+    Populates our exchange rate table.
+
+    @param token_queue: queue of the tokens to price (rows of pricing information, see _fill_token_queue), pulled one
+    at a time so the workers sharing it stay busy until the last token
     @param network_token_price: Series of prices of the network token
     @param blocks_ranges: A dataframe containing the starting and ending block for each hour
     @param dbcm: used to instantiate db connection
-    @return: None
+    @param pricing_data: pricing pools and reserves loaded by _load_pricing_data, queried token by token when None
+    @return: seconds per block it took to price each token and the all time high state of each token written (see
+    ExchangeRateWriter), both by target_token_id
     """
-    if len(tokens) == 0:
-        return
+    timings = {}
+    token_info = _pull_token(token_queue)
+    if token_info is None:
+        return timings, {}
 
-    fl_agg_db_name = tokens.iloc[0]['fl_db_name']
+    fl_agg_db_name = token_info['fl_db_name']
     fl_agg_read = dbcm.get_connection(fl_agg_db_name, "r")
     prod_us1_write = dbcm.get_connection("postgres", "rw")
     prod_us1_read = dbcm.get_connection("postgres", "r")
     pi = PriceIndex(prod_us1_read, fl_agg_read)
-    pi.set_network_token_price(network_token_price, tokens.iloc[0]['network_token_symbol'] + "_price")
-    for _, token_info in tokens.iterrows():
+    pi.set_network_token_price(network_token_price, token_info['network_token_symbol'] + "_price")
+    if pricing_data is not None:
+        pi.set_pricing_data(pricing_data)
+    writer = ExchangeRateWriter(dbcm._fl_agg_cspr_eng_rw)
+    while token_info is not None:
         try:
-            # Used for debugging if token_info['target_token_id'] < 1000:
-            target_blocks_ranges = blocks_ranges[token_info['start_timestamp']:]
-            start_block, end_block = target_blocks_ranges.iloc[0]['start_block'], target_blocks_ranges.iloc[-1]['end_block']
-            price_index = pi.get_price_index(start_block, end_block, currency_id=token_info['target_token_id'])
-            if len(price_index) == 0:
-                message = f"Skipping {token_info['target_token_address']}, empty price index series."
-                print(message)
-                continue
-            ohlc_rates = get_ohlc(price_index, target_blocks_ranges).dropna()
-            ohlc_ath_df = _append_ath_metrics(ohlc_rates, token_info['latest_ath'], token_info['latest_hrs_since_ath'])
-
-            ohlc_ath_df['base_currency'] = token_info['target_token_id']
-            ohlc_ath_df['currency'] = 1
-            ohlc_ath_df.index.name = "timestamp_utc"
-            # print(ohlc_ath_df)
-
-            ohlc_ath_df.to_sql(EXCHANGE_RATE_TBL_NAME,
-                               dbcm._fl_agg_cspr_eng_rw,
-                               if_exists='append',
-                               method='multi',
-                               index=True,
-                               chunksize=1000)
-
+            start = time.perf_counter()
+            ohlc_ath_df = _get_exchange_rates(pi, token_info, blocks_ranges)
+            start_block, end_block = _get_token_blocks(token_info, blocks_ranges)
+            timings[token_info['target_token_id']] = (time.perf_counter() - start) / (end_block - start_block + 1)
         except Exception as e:
            print("ERROR:", str(e)[0:500], token_info)
            # print(e, token_info)
+           ohlc_ath_df = None
+        if ohlc_ath_df is not None:
+            try:
+                writer.add(ohlc_ath_df)
+            except ExchangeRateWriteError as e:
+                print("ERROR:", str(e))
+        token_info = _pull_token(token_queue)
+    try:
+        writer.flush()
+    except ExchangeRateWriteError as e:
+        print("ERROR:", str(e))
 
     fl_agg_read.close()
     prod_us1_write.close()
     prod_us1_read.close()
+    return timings, writer.ath_states
+
+
+def _init_worker_process(token_queue, network_token_price, blocks_range, pricing_data, connect=True):
+    """
+    Initializer of the worker processes: attaches the network token price and blocks range the main process put in
+    shared memory, and opens the connections of this process
+
+    @param token_queue: queue of the tokens to price, shared by the worker processes
+    @param network_token_price: description of the shared network token price, see shared_frames.to_shared_memory
+    @param blocks_range: description of the shared blocks range, see shared_frames.to_shared_memory
+    @param pricing_data: pricing pools and reserves loaded by _load_pricing_data
+    @param connect: False to skip the connections (used by the benchmarks)
+    """
+    _worker_process['token_queue'] = token_queue
+    # the shared memory blocks stay referenced for as long as the process lives
+    _worker_process['network_token_price_shm'], _worker_process['network_token_price'] = \
+        from_shared_memory(network_token_price)
+    _worker_process['blocks_range_shm'], _worker_process['blocks_range'] = from_shared_memory(blocks_range)
+    _worker_process['pricing_data'] = pricing_data
+    _worker_process['dbcm'] = DBConnectionManager(pool_size=2) if connect else None
+
+
+def _populate_exchange_rate_in_worker_process():
+    """
+    populate_exchange_rate from the shared token queue, in a worker process
+    """
+    return populate_exchange_rate(_worker_process['token_queue'],
+                                  _worker_process['network_token_price'],
+                                  _worker_process['blocks_range'],
+                                  _worker_process['dbcm'],
+                                  _worker_process['pricing_data'])
+
+
+def _run_in_threads(tokens, network_token_price, blocks_range, dbcm, pricing_data, num_threads, job):
+    """
+    Runs job in num_threads threads pulling the tokens from a shared queue, in the order of tokens
+
+    @param tokens: A dataframe containing pricing information
+    @param job: function of (token_queue, network_token_price, blocks_range, dbcm, pricing_data), e.g.
+    populate_exchange_rate
+    @return: list of the results of the threads
+    """
+    num_threads = max(min(num_threads, len(tokens)), 1)
+    token_queue = queue.Queue()
+    _fill_token_queue(token_queue, tokens, num_threads)
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as executor:
+        results = [executor.submit(job, token_queue, network_token_price, blocks_range, dbcm, pricing_data)
+                   for _ in range(num_threads)]
+    return [result.result() for result in results]
+
+
+def _run_in_processes(tokens, network_token_price, blocks_range, pricing_data, num_processes, job, connect=True):
+    """
+    Runs job in num_processes processes pulling the tokens from a shared queue, in the order of tokens. The network
+    token price and the blocks range are shared through shared memory instead of being pickled for every process
+
+    @param tokens: A dataframe containing pricing information
+    @param job: function without arguments run in each worker process, e.g. _populate_exchange_rate_in_worker_process
+    @return: list of the results of the processes
+    """
+    num_processes = max(min(num_processes, len(tokens)), 1)
+    token_queue = multiprocessing.Queue()
+    _fill_token_queue(token_queue, tokens, num_processes)
+    network_token_price_shm, network_token_price_description = to_shared_memory(network_token_price)
+    blocks_range_shm, blocks_range_description = to_shared_memory(blocks_range)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                num_processes,
+                initializer=_init_worker_process,
+                initargs=(token_queue, network_token_price_description, blocks_range_description, pricing_data,
+                          connect)
+        ) as executor:
+            results = [executor.submit(job) for _ in range(num_processes)]
+        return [result.result() for result in results]
+    finally:
+        for shm in [network_token_price_shm, blocks_range_shm]:
+            shm.close()
+            shm.unlink()
 
 
 def run():
@@ -221,6 +632,10 @@ def run():
 
     message = f"Processing {len(target_tokens)} tokens. "
     print(message)
+    token_timings = _load_token_timings(TOKEN_TIMINGS_PATH)
+    # the tokens written by the previous runs carry on from their last hour, even before the view is refreshed
+    ath_states = _load_ath_states(ATH_STATE_PATH)
+    target_tokens = _apply_ath_states(target_tokens, ath_states)
 
     for network in set(target_tokens['network']):
         # To limit the tokens, create a list of only the tokens
@@ -252,18 +667,36 @@ def run():
                                                        end_block=blocks_range.iloc[-1]['end_block'],
                                                        table_name=network_token_price_table,
                                                        fl_agg_conn=fl_agg_conn)
+        # The reserves of the pools shared by the tokens (e.g. the WCSPR pairs) are loaded once for all of them
+        prod_us1_conn = dbcm.get_connection("postgres", "r")
+        pricing_data = _load_pricing_data(network_target_tokens, blocks_range, network, prod_us1_conn, fl_agg_conn)
+        prod_us1_conn.close()
+        if debug:
+            print("Pools loaded for pricing: ", len(pricing_data['reserves_by_pool']))
         fl_agg_conn.close()
         # populate_exchange_rate(network_target_tokens, network_token_price, blocks_range, dbcm)
-        job_indices = _get_job_indices(NUM_THREADS, len(network_target_tokens))
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = [executor.submit(populate_exchange_rate,
-                                       network_target_tokens.iloc[start:end],
-                                       network_token_price,
-                                       blocks_range,
-                                       dbcm)
-                       for start, end in job_indices]
-        for count, result in enumerate(results):
-            result.result()
+        # The workers pull the tokens one at a time, the most expensive ones first
+        network_target_tokens = _schedule_tokens(network_target_tokens, blocks_range, pricing_data, token_timings)
+        if WORKERS_MODE == 'process':
+            results = _run_in_processes(network_target_tokens,
+                                        network_token_price,
+                                        blocks_range,
+                                        pricing_data,
+                                        NUM_PROCESSES,
+                                        _populate_exchange_rate_in_worker_process)
+        else:
+            results = _run_in_threads(network_target_tokens,
+                                      network_token_price,
+                                      blocks_range,
+                                      dbcm,
+                                      pricing_data,
+                                      NUM_THREADS,
+                                      populate_exchange_rate)
+        for timings, written_ath_states in results:
+            token_timings.update(timings)
+            ath_states.update(written_ath_states)
+        _save_token_timings(TOKEN_TIMINGS_PATH, token_timings)
+        _save_ath_states(ATH_STATE_PATH, ath_states)
 
     message = "Closing connections"
     print(message)
@@ -1,7 +1,59 @@
 from abc import ABC, abstractmethod
+import numpy as np
 import pandas as pd
 
 
+def compounded_return(returns):
+    """
+    Return of a period compounded from the returns of its hours. Aggregation rule of the return columns, computed for
+    all the periods at once by aggregate_lp_data (see _resample_lp_data)
+    """
+    return (returns + 1).prod() - 1
+
+
+def _resample_lp_data(lp_summary, data_frequency, aggregation_rules) -> pd.DataFrame:
+    """
+    lp_summary.resample(data_frequency).agg(aggregation_rules) without a Python call per period: the compounded_return
+    columns are the expm1 of the sums of log1p(returns) of each period, and the other rules are names of pandas'
+    native aggregations
+
+    @param lp_summary: hourly data indexed by open_timestamp_utc
+    @param data_frequency: pandas frequency of the periods
+    @param aggregation_rules: aggregation of each column, see LiquidityPool.aggregation_rules
+    """
+    resampler = lp_summary.resample(data_frequency)
+    compounded_columns = [col for col, rule in aggregation_rules.items() if rule is compounded_return]
+    # one native aggregation per rule over all its numeric columns, and per column for the others (e.g. all None)
+    column_rules = {}
+    for col, rule in aggregation_rules.items():
+        if rule is not compounded_return:
+            is_numeric = lp_summary[col].dtype.kind in 'iufbM'
+            column_rules.setdefault((rule, is_numeric), []).append(col)
+    aggregated = pd.concat([resampler[columns].agg(rule) if is_numeric else resampler.agg({col: rule for col in columns})
+                            for (rule, is_numeric), columns in column_rules.items()], axis=1)
+
+    # (x + 1).prod() skips missing returns, and a return below -1 flips the sign of the product
+    returns = lp_summary[compounded_columns].astype(np.float64)
+    returns = returns.where(returns.notna()).values
+    is_negative = returns < -1
+    # a return of -1 is a log of -inf, counted below
+    with np.errstate(divide='ignore'):
+        log_growth = np.log1p(np.where(is_negative, -2 - returns, returns))
+    # the compensated sums of pandas turn infinite logs into NaN, so the returns of -1 and inf are counted apart
+    sums = pd.DataFrame(np.hstack([log_growth == -np.inf, log_growth == np.inf, is_negative,
+                                   np.where(np.isinf(log_growth), 0, log_growth)]), index=lp_summary.index)
+    num_zero, num_infinite, num_negative, log_growth = np.split(sums.resample(data_frequency).sum().values, 4, axis=1)
+    log_growth[num_zero > 0] = -np.inf
+    log_growth[num_infinite > 0] = np.where(num_zero > 0, np.nan, np.inf)[num_infinite > 0]
+    is_negative_product = num_negative % 2 == 1
+    compounded = np.where(is_negative_product, -np.exp(log_growth) - 1, np.expm1(log_growth))
+    for i, col in enumerate(compounded_columns):
+        # products of integer returns stay integers, e.g. misc_return
+        is_integer = lp_summary[col].dtype.kind in 'iub'
+        aggregated[col] = np.rint(compounded[:, i]).astype(np.int64) if is_integer else compounded[:, i]
+    return aggregated[list(aggregation_rules)]
+
+
 class LiquidityPool(ABC):
     def __init__(self, prod_us1_conn, fl_agg_conn, exchange_rate_server):
         self.prod_us1_conn = prod_us1_conn
@@ -57,11 +109,11 @@ class LiquidityPool(ABC):
             "high_price_1": "max",
             "low_price_0": "min",
             "low_price_1": "min",
-            "total_period_return": lambda x: (x + 1).prod() - 1,
-            "price_change_ret": lambda x: (x + 1).prod() - 1,
-            "misc_return": lambda x: (x + 1).prod() - 1,
-            "token_0_price_return": lambda x: (x + 1).prod() - 1,
-            "token_1_price_return": lambda x: (x + 1).prod() - 1,
+            "total_period_return": compounded_return,
+            "price_change_ret": compounded_return,
+            "misc_return": compounded_return,
+            "token_0_price_return": compounded_return,
+            "token_1_price_return": compounded_return,
         }
 
     @abstractmethod
@@ -69,7 +121,23 @@ class LiquidityPool(ABC):
         pass
 
     @abstractmethod
-    def compute_returns(self, lp_summary):
+    def fetch_lp_data_by_pool(self, pools, network):
+        pass
+
+    @abstractmethod
+    def compute_returns(self, lp_summary, init_lp_tokens_invested=None, by=None):
+        pass
+
+    @abstractmethod
+    def aggregate_periods(self, lp_summary, periods):
+        pass
+
+    @abstractmethod
+    def fetch_period_bounds(self, periods, network):
+        pass
+
+    @abstractmethod
+    def aggregate_period_bounds(self, bounds, periods):
         pass
 
     @abstractmethod
@@ -128,7 +196,7 @@ class LiquidityPool(ABC):
             return lp_summary
         elif data_frequency is not None:
             lp_summary.set_index('open_timestamp_utc', inplace=True, drop=False)
-            lp_summary = lp_summary.resample(data_frequency).agg(self.aggregation_rules)
+            lp_summary = _resample_lp_data(lp_summary, data_frequency, self.aggregation_rules)
             lp_summary.reset_index(drop=True, inplace=True)
 
             lp_summary.drop([col for col in lp_summary.columns if "_croi" in col], inplace=True, axis=1)
@@ -173,3 +241,31 @@ class LiquidityPool(ABC):
         lp_summary = self.aggregate_lp_data(lp_summary, data_frequency)
         return lp_summary
 
+    def get_lp_period_summaries(self, periods, network):
+        """
+        Summaries of many periods of many pools of a network. Each period is looked up at its bounds (see
+        fetch_period_bounds), so its cost does not depend on its length. The periods of the pools whose running totals
+        are not filled in yet are aggregated from their hourly data instead: the hourly data of each of these pools is
+        fetched once, over the widest of its periods, and every period is aggregated from it
+
+        @param periods: dataframe with the address, start_date and end_date (naive UTC) of each period, any number of
+        periods per pool
+        @param network: network of the pools
+        @return: one row per period with data (see aggregate_periods), None if none of the pools has data
+        """
+        bounds = self.fetch_period_bounds(periods, network)
+        if bounds is None:
+            return None
+        has_totals = bounds[['volume_0', 'volume_1', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns']] \
+            .notnull().all(axis=1)
+        summaries = [self.aggregate_period_bounds(bounds[has_totals].reset_index(drop=True), periods)]
+        hourly_periods = bounds.loc[~has_totals, periods.columns].reset_index(drop=True)
+        if len(hourly_periods) > 0:
+            print(f"Running totals missing in hourly_data for {hourly_periods['address'].nunique()} pools on network "
+                  f"{network}, aggregating their hourly data")
+            pools = hourly_periods.groupby('address', as_index=False).agg(start_date=('start_date', 'min'),
+                                                                          end_date=('end_date', 'max'))
+            lp_summary = self.fetch_lp_data_by_pool(pools, network)
+            if lp_summary is not None and not lp_summary.empty:
+                summaries.append(self.aggregate_periods(lp_summary, hourly_periods))
+        return pd.concat(summaries, ignore_index=True)
@@ -1,10 +1,153 @@
 from sqlalchemy import text
-from data_servers.liquidity_pool.liquidity_pool import LiquidityPool
+from data_servers.liquidity_pool.liquidity_pool import LiquidityPool, compounded_return
 import pandas as pd
 from datetime import timedelta
 import numpy as np
 
 
+HOURLY_DATA_COLUMNS = """
+    close_lp_token_supply,
+    num_swaps_0,
+    num_swaps_1,
+    num_burns,
+    num_mints,
+    volume_0,
+    volume_1,
+    open_timestamp_utc,
+    close_reserves_0 as close_reserve_0,
+    close_reserves_1 as close_reserve_1"""
+
+# running totals of hourly_data (see update_cumulative_totals of the hourly summarizer): hourly column they sum
+HOURLY_DATA_CUMULATIVE_COLUMNS = {'cumulative_volume_0': 'volume_0', 'cumulative_volume_1': 'volume_1',
+                                  'cumulative_num_swaps_0': 'num_swaps_0', 'cumulative_num_swaps_1': 'num_swaps_1',
+                                  'cumulative_num_mints': 'num_mints', 'cumulative_num_burns': 'num_burns'}
+
+# hourly return: cumulative return since the first hour it compounds to
+RET_CROI_METRICS = {
+    'total_period_return': 'total_croi',
+    'price_change_ret': 'price_change_croi',
+    'token_1_price_return': 'hodl_token_1_croi',
+    'token_0_price_return': 'hodl_token_0_croi',
+    'hodl_return': 'hodl_croi',
+    'yield_on_lp_fees': 'fees_croi',
+    'token_1_fees_return': 'token_1_fees_croi',
+    'token_0_fees_return': 'token_0_fees_croi'
+}
+
+
+def _group_start_positions(lp_summary, by=None) -> np.ndarray:
+    """
+    Position of the first row of the group of every row, the rows of a group being contiguous
+
+    @param lp_summary: hourly data of one or many pools
+    @param by: column of the pool of each row, None if lp_summary is a single pool
+    """
+    if by is None:
+        return np.zeros(len(lp_summary), dtype=np.int64)
+    keys = lp_summary[by].values
+    is_start = np.concatenate([[True], keys[1:] != keys[:-1]])
+    return np.maximum.accumulate(np.where(is_start, np.arange(len(keys)), 0))
+
+
+def _pct_change(values, is_start) -> np.ndarray:
+    """
+    pct_change() of the hours of one or many pools, restarting at the first hour of each pool
+
+    @param values: one value per hour of one or many pools, their hours contiguous, or a (pool x hour) matrix
+    @param is_start: whether each value is the first hour of its pool, shaped like values
+    """
+    positions = np.broadcast_to(np.arange(values.shape[-1]), values.shape)
+    # position of the latest value that is not missing, without going back past the first hour of the pool
+    filled_positions = np.maximum.accumulate(np.where(pd.notna(values) | is_start, positions, 0), axis=-1)
+    filled = np.take_along_axis(values, filled_positions, axis=-1)
+    previous = np.roll(filled, 1, axis=-1)
+    previous[is_start] = np.nan
+    return filled / previous - 1
+
+
+def compute_lp_returns(close, initial, is_start, init_lp_tokens_invested=None) -> dict:
+    """
+    Returns of an investment in pools since their first hour, with whole-array operations: over the hours of one or
+    many pools (see UniV2LiquidityPool.compute_returns), or over a (pool x hour) matrix
+
+    @param close: close_reserve_0, close_reserve_1, close_lp_token_supply, close_lp_token_price, close_price_0 and
+    close_price_1 arrays, one value per hour of one or many pools with their hours contiguous, or (pool x hour) matrices
+    @param initial: open_reserve_0, open_reserve_1, open_price_0, open_price_1, open_lp_token_price,
+    open_lp_token_supply, open_poolsize and close_lp_token_supply of the first hour of the pool of each value, as
+    arrays broadcastable to the close arrays, e.g. one value per hour or a (pool x 1) matrix
+    @param is_start: whether each value is the first hour of its pool, shaped like the close arrays
+    @param init_lp_tokens_invested: lp tokens invested at the first hour, the lp token supply of the first hour if None
+    @return: the return columns of compute_returns and their arrays
+    """
+    # ToDo: Reserves may be 0 for testnet
+    # ToDo: I suggest changing the date entered by the user to a date where the initial reserves are not 0
+    # ToDo:  This way, you don't have to handle the errors with 0 -> I highly don't recommend this
+    # ToDo:  it'll blow up in many other places, and at the best case, it'll produce ridiculously wrong data
+    returns = {}
+    initial_ratio = initial["open_reserve_1"] / initial["open_reserve_0"]
+    current_rr = close["close_reserve_1"] / close["close_reserve_0"]
+    if init_lp_tokens_invested is None:
+        init_lp_tokens_invested = initial['open_lp_token_supply']  # randomly picked
+    # Todo: exact init reserve for lp investor
+    pool_share = init_lp_tokens_invested / close['close_lp_token_supply']
+    init_investment = init_lp_tokens_invested / initial['close_lp_token_supply'] * initial['open_poolsize']
+    init_k = initial["open_reserve_1"] * initial["open_reserve_0"] * (
+            init_lp_tokens_invested / initial['open_lp_token_supply']) ** 2
+    # Total return
+    returns["total_croi"] = close['close_lp_token_price'] / initial["open_lp_token_price"] - 1
+    returns["total_period_return"] = _pct_change(returns["total_croi"] + 1, is_start)
+    returns['investment_growth'] = returns["total_croi"] + 1
+
+    # Token 0 and 1 hodler returns
+    hodl_croi = (close["close_price_1"] / initial["open_price_1"] +
+                 close["close_price_0"] / initial["open_price_0"]) / 2 - 1
+    returns['hodl_croi'] = hodl_croi
+    returns['hodl_return'] = _pct_change(hodl_croi + 1, is_start)
+
+    #  Token 0 only hodler returns
+    returns['hodl_token_0_croi'] = close["close_price_0"] / initial["open_price_0"] - 1
+    returns['token_0_price_return'] = _pct_change(close["close_price_0"], is_start)
+
+    #  Token 1 only hodler returns
+    returns['token_1_price_return'] = _pct_change(close["close_price_1"], is_start)
+    returns['hodl_token_1_croi'] = close["close_price_1"] / initial["open_price_1"] - 1
+
+    # compute impermanent loss relative to the beginning of the period
+    returns["impermanent_loss_level"] = UniV2LiquidityPool.compute_impermanent_loss_level(current_rr, initial_ratio)
+    returns["impermanent_loss_impact"] = returns["impermanent_loss_level"] * (1 + hodl_croi)
+
+    # Return contribution to LP holder form the price change
+    returns["price_change_croi"] = returns["impermanent_loss_impact"] + hodl_croi
+    returns["price_change_ret"] = _pct_change(returns["price_change_croi"] + 1, is_start)
+
+    # Return contribution to LP holder from fees earned
+
+    curr_reserve0_assuming_no_fees = (init_k / current_rr) ** .5
+
+    returns["accumulated_token_1_fees"] = pool_share * close['close_reserve_1'] - init_k / curr_reserve0_assuming_no_fees
+    returns["token_1_fees_croi"] = returns["accumulated_token_1_fees"] * close["close_price_1"] / init_investment
+    returns["token_1_fees_return"] = _pct_change(returns["token_1_fees_croi"] + 1, is_start)
+
+    returns["accumulated_token_0_fees"] = pool_share * close['close_reserve_0'] - curr_reserve0_assuming_no_fees
+    returns["token_0_fees_croi"] = returns["accumulated_token_0_fees"] * close["close_price_0"] / init_investment
+    returns["token_0_fees_return"] = _pct_change(returns["token_0_fees_croi"] + 1, is_start)
+
+    returns["fees_croi"] = returns["token_1_fees_croi"] + returns["token_0_fees_croi"]
+    returns["yield_on_lp_fees"] = _pct_change(returns["fees_croi"] + 1, is_start)
+
+    # pct_change results in an empty first observation. Fill it up:
+    for ret_metric, croi_metric in RET_CROI_METRICS.items():
+        returns[ret_metric] = np.where(is_start, returns[croi_metric], returns[ret_metric])
+    return returns
+
+
+def _hour_numbers(timestamps) -> np.ndarray:
+    """
+    Number of hours since the epoch of naive timestamps
+    """
+    return pd.to_datetime(timestamps).values.astype('datetime64[h]').astype(np.int64)
+
+
 class UniV2LiquidityPool(LiquidityPool):
 
     def __init__(self, prod_us1_conn, fl_agg_conn, exchange_rate_server):
@@ -19,10 +162,10 @@ class UniV2LiquidityPool(LiquidityPool):
                 "accumulated_token_0_fees": "last",
                 "close_lp_token_price": "last",
                 "close_lp_token_supply": "last",
-                "hodl_return": lambda x: (x + 1).prod() - 1,
-                "yield_on_lp_fees": lambda x: (x + 1).prod() - 1,
-                "token_1_fees_return": lambda x: (x + 1).prod() - 1,
-                'token_0_fees_return': lambda x: (x + 1).prod() - 1,
+                "hodl_return": compounded_return,
+                "yield_on_lp_fees": compounded_return,
+                "token_1_fees_return": compounded_return,
+                'token_0_fees_return': compounded_return,
             }
         self.aggregation_rules = {**self.common_aggregation_rules, **univ2_rules}
 
@@ -34,17 +177,7 @@ class UniV2LiquidityPool(LiquidityPool):
         @param lp_address:
         @return:
         """
-        lp3_query = f"""SELECT 
-                        close_lp_token_supply,
-                        num_swaps_0,
-                        num_swaps_1,
-                        num_burns,
-                        num_mints,
-                        volume_0,
-                        volume_1,
-                        open_timestamp_utc,
-                        close_reserves_0 as close_reserve_0,
-                        close_reserves_1 as close_reserve_1
+        lp3_query = f"""SELECT {HOURLY_DATA_COLUMNS}
                     FROM hourly_data
                     WHERE address='{lp_address}'"""
         lp3_query = f"""
@@ -140,6 +273,126 @@ class UniV2LiquidityPool(LiquidityPool):
         lp_summary['close_reserve_ratio'] = lp_summary['close_reserve_0'] / lp_summary['close_reserve_1']
         return lp_summary
 
+    def fetch_lp_data_by_pool(self, pools, network):
+        """
+        Hourly data of many pools of a network, each over its own date range, loaded with one hourly_data query and
+        one all_pairs query. Same data as fetch_lp_data for each pool, in one dataframe with an address column
+
+        @param pools: dataframe with the address, start_date and end_date (naive UTC) of each pool
+        @param network: network of the pools
+        @return: hourly data sorted by address and open_timestamp_utc, without the pools fetch_lp_data would skip
+        """
+        pool_ranges = ", ".join(f"('{pool.address}', CAST('{pool.start_date}' AS timestamptz), "
+                                f"CAST('{pool.end_date}' AS timestamptz))" for pool in pools.itertuples())
+        query = f"""
+            WITH pools (address, start_date, end_date) AS (VALUES {pool_ranges})
+            (
+                -- Get the latest reserves prior to the period of interest of each pool
+                SELECT DISTINCT ON (hourly_data.address) hourly_data.address, {HOURLY_DATA_COLUMNS}
+                FROM hourly_data
+                JOIN pools ON pools.address = hourly_data.address
+                WHERE open_timestamp_utc < pools.start_date
+                ORDER BY hourly_data.address, open_timestamp_utc DESC
+            )
+            UNION ALL
+            (
+                SELECT hourly_data.address, {HOURLY_DATA_COLUMNS}
+                FROM hourly_data
+                JOIN pools ON pools.address = hourly_data.address
+                WHERE open_timestamp_utc >= pools.start_date
+                AND close_timestamp_utc <= pools.end_date
+            )
+        """
+        hourly_data = pd.read_sql(text(query), self.fl_agg_conn[network], parse_dates=['open_timestamp_utc'])
+        if hourly_data.empty:
+            print(f"No data in hourly_data table for the {len(pools)} pools on network {network}.")
+            return hourly_data
+        hourly_data['open_timestamp_utc'] = hourly_data['open_timestamp_utc'].dt.tz_convert(None)
+        hourly_data = hourly_data.sort_values(['address', 'open_timestamp_utc'], kind='stable', ignore_index=True)
+
+        null_pools = hourly_data.loc[hourly_data.isnull().any(axis=1), 'address'].unique()
+        if len(null_pools) > 0:
+            print(f"WARNING: Null values in hourly_data on network {network}, skipping pools: {list(null_pools)}")
+            hourly_data = hourly_data[~hourly_data['address'].isin(null_pools)]
+
+        # initial reserves/token supply of each pool are the close value from the record right before the beginning of
+        # its period, and its first record is not an active hour
+        close_metrics = ['close_reserve_0', 'close_reserve_1', 'close_lp_token_supply']
+        open_metrics = ['open_reserve_0', 'open_reserve_1', 'open_lp_token_supply']
+        is_first = ~hourly_data['address'].duplicated()
+        initial_values = hourly_data.loc[is_first].set_index('address')[close_metrics + ['open_timestamp_utc']]
+        active_pool_hours = pd.MultiIndex.from_frame(hourly_data.loc[~is_first, ['address', 'open_timestamp_utc']])
+
+        dups = hourly_data.duplicated(['address', 'open_timestamp_utc'], keep='last')
+        if dups.any():
+            print(f"WARNING: Found duplicated records in hourly_data table: {hourly_data.loc[dups, 'address'].unique()}")
+            print("Dropping duplicates...")
+            hourly_data = hourly_data[~dups]
+
+        # Fill missing hours: every hour of each pool's period holds its latest record
+        pools = pools.set_index('address').join(initial_values['open_timestamp_utc'].rename('first_hour'), how='inner')
+        first_hours = np.maximum(pools['start_date'].values, pools['first_hour'].values)
+        last_hours = (pools['end_date'] - pd.Timedelta(hours=1)).values
+        num_hours = np.maximum((last_hours - first_hours) // np.timedelta64(1, 'h') + 1, 0)
+        hour_numbers = np.arange(num_hours.sum()) - np.repeat(np.cumsum(num_hours) - num_hours, num_hours)
+        lp_summary = pd.DataFrame({
+            'address': np.repeat(pools.index.values, num_hours),
+            'open_timestamp_utc': np.repeat(first_hours, num_hours) + hour_numbers * np.timedelta64(1, 'h')
+        })
+        if lp_summary.empty:
+            return lp_summary
+        lp_summary = pd.merge_asof(lp_summary.sort_values('open_timestamp_utc', kind='stable'),
+                                   hourly_data.sort_values('open_timestamp_utc', kind='stable'),
+                                   on='open_timestamp_utc', by='address')
+        lp_summary = lp_summary.sort_values(['address', 'open_timestamp_utc'], kind='stable', ignore_index=True)
+
+        zero_cols = ["num_swaps_0", "num_swaps_1", "num_burns", "num_mints", "volume_0", "volume_1"]
+        is_active = pd.MultiIndex.from_frame(lp_summary[['address', 'open_timestamp_utc']]).isin(active_pool_hours)
+        lp_summary.loc[~is_active, zero_cols] = 0
+
+        lp_summary[open_metrics] = lp_summary.groupby('address')[close_metrics].shift().values
+        is_first = ~lp_summary['address'].duplicated()
+        lp_summary.loc[is_first, open_metrics] = \
+            initial_values.loc[lp_summary.loc[is_first, 'address'], close_metrics].values
+
+        # Get the underlying tokens' prices
+        addresses = ", ".join(f"'{address}'" for address in pools.index)
+        token_address_query = f"""
+            SELECT
+                contract_address as address,
+                token0_address,
+                token1_address
+            FROM all_pairs
+            WHERE contract_address IN ({addresses})"""
+        token_addresses = pd.read_sql(text(token_address_query), self.fl_agg_conn[network])
+        lp_summary = lp_summary.merge(token_addresses.drop_duplicates('address'), on='address')
+        token_prices = {}
+        pool_tokens = pd.unique(token_addresses[['token0_address', 'token1_address']].values.ravel())
+        self.exchange_rate_server.load_token_price_histories(pool_tokens, network)
+        for token_address in pool_tokens:
+            prices = self.get_fungible_token_price(token_address, network)
+            if len(prices) > 0:
+                token_prices[token_address] = prices
+        if len(token_prices) == 0:
+            print("No prices were found for the underlying tokens of these pools")
+            return pd.DataFrame()
+        token_prices = pd.concat(token_prices, names=['token_address', 'open_timestamp_utc']).reset_index()
+        for i in [0, 1]:
+            prices = token_prices.rename(columns={col: f"{col}_{i}" for col in token_prices.columns
+                                                  if col not in ['token_address', 'open_timestamp_utc']})
+            lp_summary = lp_summary.merge(prices.rename(columns={'token_address': f'token{i}_address'}),
+                                          on=[f'token{i}_address', 'open_timestamp_utc'])
+        # the inner joins on the prices leave no missing price to infer
+        lp_summary = lp_summary.drop(['token0_address', 'token1_address'], axis=1)
+        lp_summary = lp_summary.sort_values(['address', 'open_timestamp_utc'], kind='stable', ignore_index=True)
+        lp_summary["close_timestamp_utc"] = lp_summary['open_timestamp_utc'] + pd.Timedelta(hours=1)
+
+        self._compute_base_currency_metrics(lp_summary)
+        self._compute_backward_compatibility_metrics(lp_summary)
+        lp_summary['open_reserve_ratio'] = lp_summary['open_reserve_0'] / lp_summary['open_reserve_1']
+        lp_summary['close_reserve_ratio'] = lp_summary['close_reserve_0'] / lp_summary['close_reserve_1']
+        return lp_summary
+
     def aggregate_lp_data(self, lp_summary, data_frequency=None):
         """
         Aggregates the hourly liquidity pool data
@@ -149,6 +402,189 @@ class UniV2LiquidityPool(LiquidityPool):
         self._compute_base_currency_metrics(lp_summary)
         return lp_summary
 
+    def aggregate_periods(self, lp_summary, periods):
+        """
+        Aggregates the hourly data of each period into one row, as aggregate_lp_data would aggregate the hourly data
+        fetched for that period alone, without slicing it: sums are differences of prefix sums, first and last values
+        are lookups, and the compounded returns of the period are the cumulative returns of its last hour relative to
+        its first hour
+
+        @param lp_summary: hourly data of many pools over their widest period, see fetch_lp_data_by_pool
+        @param periods: dataframe with the address, start_date and end_date (naive UTC) of each period
+        @return: one row per period with data, with the columns of periods followed by the aggregated columns
+        """
+        # position of the first and last hour of each period in lp_summary, whose rows are sorted by pool and hour
+        pool_codes, addresses = pd.factorize(lp_summary['address'])
+        keys = (pool_codes.astype(np.int64) << 32) + _hour_numbers(lp_summary['open_timestamp_utc'])
+        period_pool_codes = addresses.get_indexer(periods['address']).astype(np.int64)
+        first = np.searchsorted(keys, (period_pool_codes << 32) + _hour_numbers(periods['start_date']))
+        last = np.searchsorted(keys, (period_pool_codes << 32) + _hour_numbers(periods['end_date'])) - 1
+        has_data = (period_pool_codes >= 0) & (last >= first)
+        summary = periods[has_data].reset_index(drop=True)
+        first, last = first[has_data], last[has_data]
+        if summary.empty:
+            return summary
+
+        # returns relative to the first hour of each period, at its last hour
+        positions = np.stack([first, last], axis=1).ravel()
+        period_numbers = np.repeat(np.arange(len(summary)), 2)
+        is_needed = np.ones(len(positions), dtype=bool)
+        is_needed[1::2] = last > first
+        bounds = lp_summary.iloc[positions[is_needed]].reset_index(drop=True)
+        bounds['period'] = period_numbers[is_needed]
+        self.compute_returns(bounds, by='period')
+        period_end = bounds[~bounds['period'].duplicated(keep='last')].reset_index(drop=True)
+
+        window_bounds = np.stack([first, last + 1], axis=1).ravel()
+        for col, rule in self.aggregation_rules.items():
+            values = lp_summary[col].values if col in lp_summary else None
+            is_numeric = values is not None and values.dtype.kind in 'iufb'
+            if col in RET_CROI_METRICS:
+                summary[col] = period_end[RET_CROI_METRICS[col]].values
+            elif rule == 'last':
+                summary[col] = period_end[col].values if col in period_end else None
+            elif rule == 'first':
+                summary[col] = values[first] if values is not None else None
+            elif not is_numeric:
+                summary[col] = None
+            elif rule == 'sum':
+                prefix_sums = np.concatenate([[0], np.cumsum(values) if values.dtype.kind in 'iub'
+                                              else np.nancumsum(values)])
+                summary[col] = prefix_sums[last + 1] - prefix_sums[first]
+            elif rule in ('max', 'min'):
+                reduce = np.fmax if rule == 'max' else np.fmin
+                summary[col] = reduce.reduceat(np.append(values.astype(np.float64), np.nan), window_bounds)[::2]
+            else:
+                # other compounded returns (compounded_return): (x + 1).prod() - 1 from the prefix sums of log(x + 1)
+                prefix_log_growth = np.concatenate([[0], np.nancumsum(np.log1p(values.astype(np.float64)))])
+                summary[col] = np.expm1(prefix_log_growth[last + 1] - prefix_log_growth[first])
+
+        summary.drop([col for col in summary.columns if "_croi" in col], inplace=True, axis=1)
+        self._compute_base_currency_metrics(summary)
+        return summary
+
+    def fetch_period_bounds(self, periods, network):
+        """
+        Data of each period as if it was a single hour, from lookups at its bounds instead of its hourly data: the
+        reserves and lp token supply before its first hour and at its last hour, its volumes and transactions from the
+        running totals of hourly_data (see update_cumulative_totals), and the token prices at its first and last hour.
+        The lp token supply at the close of its first hour, which the returns of the period depend on, is in
+        first_close_lp_token_supply
+
+        @param periods: dataframe with the address, start_date and end_date (naive UTC) of each period
+        @param network: network of the pools
+        @return: one row per period with data, with the columns of periods followed by the data of the period. Volumes
+        and transactions are null when the running totals of the pool are not filled in yet
+        """
+        period_values = ", ".join(f"({period}, '{row.address}', CAST('{row.start_date}' AS timestamptz), "
+                                  f"CAST('{row.end_date}' AS timestamptz))" for period, row in enumerate(periods.itertuples()))
+        bound_columns = "open_timestamp_utc, close_reserves_0, close_reserves_1, close_lp_token_supply, " + \
+                        ", ".join(HOURLY_DATA_CUMULATIVE_COLUMNS)
+        query = f"""
+            WITH periods (period, address, start_date, end_date) AS (VALUES {period_values})
+            SELECT
+                periods.period,
+                pair.token0_address,
+                pair.token1_address,
+                GREATEST(periods.start_date, initial_record.open_timestamp_utc) AS open_timestamp_utc,
+                initial_record.close_reserves_0 AS open_reserve_0,
+                initial_record.close_reserves_1 AS open_reserve_1,
+                initial_record.close_lp_token_supply AS open_lp_token_supply,
+                first_record.close_lp_token_supply AS first_close_lp_token_supply,
+                last_record.close_reserves_0 AS close_reserve_0,
+                last_record.close_reserves_1 AS close_reserve_1,
+                last_record.close_lp_token_supply AS close_lp_token_supply,
+                {", ".join(f"last_record.{col} - initial_record.{col} AS {hourly_col}"
+                           for col, hourly_col in HOURLY_DATA_CUMULATIVE_COLUMNS.items())}
+            FROM periods
+            CROSS JOIN LATERAL (
+                SELECT token0_address, token1_address FROM all_pairs WHERE contract_address = periods.address LIMIT 1
+            ) pair
+            CROSS JOIN LATERAL (
+                -- the latest record prior to the period, or the first record of the period if the pool is newer
+                (
+                    SELECT {bound_columns} FROM hourly_data
+                    WHERE address = periods.address AND open_timestamp_utc < periods.start_date
+                    ORDER BY open_timestamp_utc DESC LIMIT 1
+                )
+                UNION ALL
+                (
+                    SELECT {bound_columns} FROM hourly_data
+                    WHERE address = periods.address AND open_timestamp_utc >= periods.start_date
+                    AND close_timestamp_utc <= periods.end_date
+                    ORDER BY open_timestamp_utc ASC LIMIT 1
+                )
+                ORDER BY open_timestamp_utc ASC LIMIT 1
+            ) initial_record
+            CROSS JOIN LATERAL (
+                SELECT close_lp_token_supply FROM hourly_data
+                WHERE address = periods.address AND open_timestamp_utc >= initial_record.open_timestamp_utc
+                AND open_timestamp_utc <= GREATEST(periods.start_date, initial_record.open_timestamp_utc)
+                ORDER BY open_timestamp_utc DESC LIMIT 1
+            ) first_record
+            CROSS JOIN LATERAL (
+                SELECT {bound_columns} FROM hourly_data
+                WHERE address = periods.address AND open_timestamp_utc >= initial_record.open_timestamp_utc
+                AND close_timestamp_utc <= periods.end_date
+                ORDER BY open_timestamp_utc DESC LIMIT 1
+            ) last_record
+            WHERE GREATEST(periods.start_date, initial_record.open_timestamp_utc) < periods.end_date
+        """
+        bounds = pd.read_sql(text(query), self.fl_agg_conn[network], index_col='period',
+                             parse_dates=['open_timestamp_utc'])
+        if bounds.empty:
+            print(f"No data in hourly_data table for the {len(periods)} periods on network {network}.")
+            return None
+        bounds = pd.concat([periods.iloc[bounds.index].reset_index(drop=True), bounds.reset_index(drop=True)], axis=1)
+        bounds['open_timestamp_utc'] = bounds['open_timestamp_utc'].dt.tz_convert(None)
+        bounds['close_timestamp_utc'] = bounds['end_date']
+
+        # Get the underlying tokens' prices at the bounds of the periods
+        token_periods = pd.concat({i: pd.DataFrame({
+            'token_address': bounds[f'token{i}_address'],
+            'first_hour': bounds['open_timestamp_utc'],
+            'last_hour': bounds['close_timestamp_utc'] - pd.Timedelta(hours=1)}) for i in [0, 1]})
+        prices = self.exchange_rate_server.get_token_period_prices(token_periods, network)
+        for i in [0, 1]:
+            token_prices = prices[prices.index.get_level_values(0) == i].droplevel(0)
+            bounds = bounds.join(token_prices.add_suffix(f"_{i}"), how='inner')
+        bounds = bounds.drop(['token0_address', 'token1_address'], axis=1).reset_index(drop=True)
+        if bounds.empty:
+            print("No prices were found for the underlying tokens of these pools")
+            return None
+
+        self._compute_base_currency_metrics(bounds)
+        self._compute_backward_compatibility_metrics(bounds)
+        bounds['open_reserve_ratio'] = bounds['open_reserve_0'] / bounds['open_reserve_1']
+        bounds['close_reserve_ratio'] = bounds['close_reserve_0'] / bounds['close_reserve_1']
+        return bounds
+
+    def aggregate_period_bounds(self, bounds, periods):
+        """
+        Summary of each period from its bounds (see fetch_period_bounds). The cumulative returns of the pool telescope
+        to ratios of its values at the bounds of the period, which are then the compounded returns of the period: the
+        same summary aggregate_periods computes from every hour of the period
+
+        @param bounds: one row per period with a RangeIndex, see fetch_period_bounds
+        @param periods: dataframe with the columns of the periods in bounds
+        @return: one row per period, with the columns of periods followed by the aggregated columns
+        """
+        # the returns at the last hour relative to the first hour depend on the open values of the first hour and the
+        # close lp token supply it invests in, so the first hour of each period longer than an hour is added as a row
+        first_hours = bounds[bounds['open_timestamp_utc'] < bounds['close_timestamp_utc'] - pd.Timedelta(hours=1)]
+        first_hours = first_hours.assign(close_lp_token_supply=first_hours['first_close_lp_token_supply'])
+        summary = pd.concat([first_hours, bounds]).rename_axis('period').reset_index()
+        summary = summary.sort_values('period', kind='stable', ignore_index=True)
+        self.compute_returns(summary, by='period')
+        summary = summary[~summary['period'].duplicated(keep='last')].reset_index(drop=True)
+        for ret_metric, croi_metric in RET_CROI_METRICS.items():
+            summary[ret_metric] = summary[croi_metric]
+        aggregated_columns = [col for col in self.aggregation_rules if "_croi" not in col]
+        for col in aggregated_columns:
+            if col not in summary:
+                summary[col] = None
+        return summary[list(periods.columns) + aggregated_columns]
+
     def _compute_base_currency_metrics(self, lp_summary):
         """
         Creates additional columns to lp_summary that contain base currency denominated pool metrics
@@ -183,82 +619,24 @@ class UniV2LiquidityPool(LiquidityPool):
                 lp_summary[f"{t}_price_{i}"] = lp_summary[f"{t}_price_{i}"].fillna(method="ffill").fillna(
                     method="bfill")
 
-    def compute_returns(self, lp_summary, init_lp_tokens_invested=None):
-        # ToDo: Reserves may be 0 for testnet
-        # ToDo: I suggest changing the date entered by the user to a date where the initial reserves are not 0
-        # ToDo:  This way, you don't have to handle the errors with 0 -> I highly don't recommend this
-        # ToDo:  it'll blow up in many other places, and at the best case, it'll produce ridiculously wrong data
-        t1_init_reserve = lp_summary.iloc[0]["open_reserve_1"]
-        t0_init_reserve = lp_summary.iloc[0]["open_reserve_0"]
-        t1_init_price = lp_summary.iloc[0]["open_price_1"]
-        t0_init_price = lp_summary.iloc[0]["open_price_0"]
-        lp_token_init_price = lp_summary.iloc[0]["open_lp_token_price"]
-        initial_ratio = t1_init_reserve / t0_init_reserve
-        current_rr = lp_summary["close_reserve_1"] / lp_summary["close_reserve_0"]
-        if init_lp_tokens_invested is None:
-            init_lp_tokens_invested = lp_summary.iloc[0]['open_lp_token_supply']  # randomly picked
-        # Todo: exact init reserve for lp investor
-        pool_share = init_lp_tokens_invested / lp_summary['close_lp_token_supply']
-        init_investment = pool_share.iloc[0] * lp_summary['open_poolsize'].iloc[0]
-        init_k = t1_init_reserve * t0_init_reserve * (
-                init_lp_tokens_invested / lp_summary['open_lp_token_supply'].iloc[0]) ** 2
-        # Total return
-        lp_summary["total_croi"] = lp_summary['close_lp_token_price'] / lp_token_init_price - 1
-        lp_summary["total_period_return"] = (lp_summary["total_croi"] + 1).pct_change()
-        lp_summary['investment_growth'] = lp_summary["total_croi"] + 1
-
-        # Token 0 and 1 hodler returns
-        hodl_croi = (lp_summary["close_price_1"] / t1_init_price + lp_summary["close_price_0"] / t0_init_price) / 2 - 1
-        lp_summary['hodl_croi'] = hodl_croi
-        lp_summary['hodl_return'] = (lp_summary['hodl_croi'] + 1).pct_change()
-
-        #  Token 0 only hodler returns
-        lp_summary['hodl_token_0_croi'] = lp_summary["close_price_0"] / t0_init_price - 1
-        lp_summary['token_0_price_return'] = lp_summary["close_price_0"].pct_change()
-
-        #  Token 1 only hodler returns
-        lp_summary['token_1_price_return'] = lp_summary["close_price_1"].pct_change()
-        lp_summary['hodl_token_1_croi'] = lp_summary["close_price_1"] / t1_init_price - 1
-
-        # compute impermanent loss relative to the beginning of the period
-        lp_summary["impermanent_loss_level"] = current_rr.apply(
-            lambda x: self.compute_impermanent_loss_level(x, initial_ratio))
-        lp_summary["impermanent_loss_impact"] = lp_summary["impermanent_loss_level"] * (1 + hodl_croi)
-
-        # Return contribution to LP holder form the price change
-        lp_summary["price_change_croi"] = lp_summary["impermanent_loss_impact"] + hodl_croi
-        lp_summary["price_change_ret"] = (lp_summary["price_change_croi"] + 1).pct_change()
-
-        # Return contribution to LP holder from fees earned
-
-        curr_reserve0_assuming_no_fees = (init_k / current_rr) ** .5
-
-        lp_summary["accumulated_token_1_fees"] = pool_share * lp_summary[
-            'close_reserve_1'] - init_k / curr_reserve0_assuming_no_fees
-        lp_summary["token_1_fees_croi"] = lp_summary["accumulated_token_1_fees"] * lp_summary[
-            "close_price_1"] / init_investment
-        lp_summary["token_1_fees_return"] = (lp_summary["token_1_fees_croi"] + 1).pct_change()
-
-        lp_summary["accumulated_token_0_fees"] = pool_share * lp_summary[
-            'close_reserve_0'] - curr_reserve0_assuming_no_fees
-        lp_summary["token_0_fees_croi"] = lp_summary["accumulated_token_0_fees"] * lp_summary[
-            "close_price_0"] / init_investment
-        lp_summary["token_0_fees_return"] = (lp_summary["token_0_fees_croi"] + 1).pct_change()
-
-        lp_summary["fees_croi"] = lp_summary["token_1_fees_croi"] + lp_summary["token_0_fees_croi"]
-        lp_summary["yield_on_lp_fees"] = (lp_summary["fees_croi"] + 1).pct_change()
-
-        # pct_change results in an empty first observation. Fill it up:
-        ret_croi_metrics_map = {
-            'total_period_return': 'total_croi',
-            'price_change_ret': 'price_change_croi',
-            'token_1_price_return': 'hodl_token_1_croi',
-            'token_0_price_return': 'hodl_token_0_croi',
-            'hodl_return': 'hodl_croi',
-            'yield_on_lp_fees': 'fees_croi',
-            'token_1_fees_return': 'token_1_fees_croi',
-            'token_0_fees_return': 'token_0_fees_croi'
-        }
-
-        for ret_metric, croi_metric in ret_croi_metrics_map.items():
-            lp_summary.loc[lp_summary.index[0], ret_metric] = lp_summary[croi_metric].iloc[0]
+    def compute_returns(self, lp_summary, init_lp_tokens_invested=None, by=None):
+        """
+        Adds the returns of the pool since the first hour of lp_summary, or of each pool since its own first hour
+
+        @param lp_summary: hourly data of a pool, or of many pools with their rows contiguous (see fetch_lp_data_by_pool)
+        @param init_lp_tokens_invested: lp tokens invested at the first hour, the lp token supply of the first hour if None
+        @param by: column of the pool of each row, None if lp_summary is a single pool
+        """
+        start_positions = _group_start_positions(lp_summary, by)
+        is_start = start_positions == np.arange(len(lp_summary))
+        close = {col: lp_summary[col].values.astype(np.float64) for col in
+                 ['close_reserve_0', 'close_reserve_1', 'close_lp_token_supply', 'close_lp_token_price', 'close_price_0',
+                  'close_price_1']}
+        # value of the first hour of the pool of each row
+        initial = {col: lp_summary[col].values.astype(np.float64)[start_positions] for col in
+                   ['open_reserve_0', 'open_reserve_1', 'open_price_0', 'open_price_1', 'open_lp_token_price',
+                    'open_lp_token_supply', 'open_poolsize', 'close_lp_token_supply']}
+        if isinstance(init_lp_tokens_invested, pd.Series):
+            init_lp_tokens_invested = init_lp_tokens_invested.values
+        for col, values in compute_lp_returns(close, initial, is_start, init_lp_tokens_invested).items():
+            lp_summary[col] = values
@@ -145,10 +145,78 @@ class LPSummary:
 
         return lp_summary.replace({np.nan: None}).to_dict()
 
-    def perform_qa(self, lp_summary, lp_address):
+    def get_lp_period_summaries(self, periods) -> dict:
+        """
+        Summaries of many periods of many liquidity pools, e.g. all the summary types of a batch of pools. Each period
+        is summarized from lookups at its bounds in the running totals of hourly_data and the prices (see
+        LiquidityPool.get_lp_period_summaries)
+
+        @param periods: dataframe with the contract_address, network, data_frequency, start_date and end_date of each
+        period
+        @return: summary of each period with data, by (contract_address, data_frequency)
+        """
+        assert self.denomination_currency_id is not None, "Please provide denomination_currency_id"
+        periods = self._set_period_date_ranges(periods)
+
+        summaries = {}
+        for network, network_periods in periods.groupby('network'):
+            lp_summary = self.univ2_lp.get_lp_period_summaries(network_periods, network)
+            if lp_summary is None or lp_summary.empty:
+                continue
+            network_periods = lp_summary[network_periods.columns]
+            lp_summary = lp_summary.drop(network_periods.columns, axis=1)
+            for period, summary in zip(network_periods.itertuples(), self._finish_summaries(lp_summary, network_periods)):
+                summaries[(period.address, period.data_frequency)] = summary
+        return summaries
+
+    def _set_period_date_ranges(self, periods):
+        """
+        Rounds the date range of each period like DataServer.set_date_range does for one, and sets the date range of
+        the exchange rate server to cover them all
+
+        @param periods: dataframe with a contract_address, start_date and end_date column
+        @return: copy of periods with contract_address renamed to address
+        """
+        periods = periods.rename(columns={'contract_address': 'address'})
+        periods['start_date'] = pd.to_datetime(periods['start_date'], utc=True).dt.tz_convert(None).dt.floor("H")
+        latest_hour = pd.Timestamp.utcnow().tz_convert(None).floor("H")
+        periods['end_date'] = pd.to_datetime(periods['end_date'], utc=True).dt.tz_convert(None).dt.ceil("H").clip(
+            upper=latest_hour)
+        self.exchange_rate_server.set_date_range(periods['start_date'].min(), periods['end_date'].max())
+        return periods
+
+    def _finish_summaries(self, lp_summary, periods) -> list:
+        """
+        Annualizes the returns of summaries, converts them to percentages, rounds and QA checks them, like
+        get_lp_summary does for one
+
+        @param lp_summary: one summary per row
+        @param periods: dataframe with the address, start_date and end_date of each summary, in the same order
+        @return: list of summary dicts
+        """
+        decimal_indicators = ["_apy", "_apr", "_ret", "yield_", "impermanent_loss_level", "impermanent_loss_impact",
+                              "liquidity_change"]
+        num_days = (periods['end_date'] - periods['start_date']).values / np.timedelta64(1, 'D')
+        lp_summary["total_apy"] = (lp_summary["total_period_return"] + 1) ** (365 / num_days) - 1
+        lp_summary["fees_apy"] = (lp_summary["yield_on_lp_fees"] + 1) ** (365 / num_days) - 1
+        for col in lp_summary:
+            if any([indicator in col for indicator in decimal_indicators]):
+                lp_summary[col] *= 100
+        summaries = []
+        for (_, summary), period in zip(lp_summary.iterrows(), periods.itertuples()):
+            summary = self.perform_qa(summary.apply(_round_float), period.address, period.start_date,
+                                      period.end_date, getattr(period, 'data_frequency', None))
+            summaries.append(summary.replace({np.nan: None}).to_dict())
+        return summaries
+
+    def perform_qa(self, lp_summary, lp_address, start_date=None, end_date=None, data_frequency=None):
         """
         A QA function. It aims to label a record as outlier or not
         Note: This is only snapshot data. Not for time-series
+
+        @param start_date: start of the period of the summary, the date range of this LPSummary if None
+        @param end_date: end of the period of the summary, the date range of this LPSummary if None
+        @param data_frequency: summary type of the summary, the data_frequency of this LPSummary if None
         """
         notes = []
 
@@ -167,10 +235,10 @@ class LPSummary:
             lp_summary["notes"] = ", ".join(notes)
             lp_summary["outlier"] = True
             lp_summary["replication_instructions"] = str({
-                "start_date": self.start_date,
-                "end_date": self.end_date,
+                "start_date": self.start_date if start_date is None else start_date,
+                "end_date": self.end_date if end_date is None else end_date,
                 "calculation_currency_id": self.denomination_currency_id,
-                "data_frequency": self.data_frequency,
+                "data_frequency": self.data_frequency if data_frequency is None else data_frequency,
                 # "liquidity_pool_id": lp_summary['liquidity_pool_id']
             })
             # ToDo: Disable Temporary - Get data from AWS - Recalc using new price routines
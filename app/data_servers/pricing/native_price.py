@@ -0,0 +1,118 @@
+"""
+Prices of a network token kept on disk as one float64 per block, read through a memory map
+"""
+import fcntl
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+NATIVE_PRICE_DIR = os.getenv('NATIVE_PRICE_DIR')     # directory of the native price files (empty: read from the db)
+
+
+class NativePrice:
+    def __init__(self, directory, table_name):
+        """
+        Price per block of a network token (the {table_name}_usd column of table_name), stored in
+        {directory}/{table_name}.f64 from its first block on, one float64 per block. The file only grows at its end
+        with the blocks added to the table since the last update, and any process reads a block range as a slice of
+        the memory mapped file, without copying it.
+
+        @param directory: directory of the price files
+        @param table_name: table where this price series is stored, e.g. cspr_price
+        """
+        self.table_name = table_name
+        self.path = os.path.join(directory, f'{table_name}.f64')
+        self._info_path = os.path.join(directory, f'{table_name}.json')
+        self._lock_path = os.path.join(directory, f'{table_name}.lock')
+
+    def _first_block(self):
+        """
+        Block of the first price of the file, None if there is no file yet
+        """
+        if not os.path.exists(self._info_path) or not os.path.exists(self.path):
+            return None
+        with open(self._info_path) as info_file:
+            return json.load(info_file)['first_block']
+
+    def _num_blocks(self):
+        return os.path.getsize(self.path) // 8 if os.path.exists(self.path) else 0
+
+    def _load(self, read_conn, start_block, end_block, previous_price=np.nan) -> np.ndarray:
+        """
+        Prices of the blocks from start_block to end_block, or to the last block of the table if it is before
+        end_block. A block without a price holds the price of the previous block
+        """
+        query = f"""SELECT
+                    block_number, {self.table_name}_usd
+                    FROM {self.table_name}
+                    WHERE block_number BETWEEN {start_block} AND {end_block}
+                    ORDER BY block_number"""
+        prices = pd.read_sql(text(query), read_conn, index_col='block_number')[f'{self.table_name}_usd']
+        last_block = read_conn.execute(text(f"SELECT MAX(block_number) FROM {self.table_name}")).scalar()
+        if last_block is None or last_block < start_block:
+            return np.empty(0)
+        prices = prices.reindex(range(start_block, min(end_block, last_block) + 1)).astype(np.float64)
+        return prices.ffill().fillna(previous_price).values
+
+    def update(self, read_conn, start_block, end_block):
+        """
+        Makes sure the file holds the prices from start_block to end_block, or to the last block of the table.
+        Only the missing blocks are read from the db
+
+        @param read_conn: read connection to the database of the price table
+        @param start_block: starting block, inclusive
+        @param end_block: ending block, inclusive
+        """
+        with open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            first_block = self._first_block()
+            if first_block is None:
+                prices = self._load(read_conn, start_block, end_block)
+                if len(prices) > 0:
+                    self._write(start_block, prices)
+                return
+            last_block = first_block + self._num_blocks() - 1
+            if start_block < first_block:
+                # rare: prices before the file are needed, the file is rewritten (readers keep their old map)
+                prices = self._load(read_conn, start_block, first_block - 1)
+                if len(prices) > 0:
+                    existing = np.fromfile(self.path, dtype=np.float64)
+                    self._write(start_block, np.concatenate([prices, existing]))
+            if end_block > last_block:
+                previous_price = np.memmap(self.path, dtype=np.float64, mode='r')[-1]
+                prices = self._load(read_conn, last_block + 1, end_block, previous_price)
+                with open(self.path, 'ab') as price_file:
+                    prices.tofile(price_file)
+
+    def _write(self, first_block, prices):
+        """
+        Replaces the file with prices starting at first_block (written to temp files first so a crash never leaves a
+        partial file)
+        """
+        prices.astype(np.float64).tofile(f'{self.path}.tmp')
+        with open(f'{self._info_path}.tmp', 'w') as info_file:
+            json.dump({'first_block': int(first_block)}, info_file)
+        os.replace(f'{self.path}.tmp', self.path)
+        os.replace(f'{self._info_path}.tmp', self._info_path)
+
+    def get(self, start_block, end_block) -> pd.Series:
+        """
+        Prices from start_block to end_block (inclusive), limited to the blocks in the file. The series is a read only
+        view of the memory mapped file
+
+        @return: price per block, indexed by block_number
+        """
+        first_block = self._first_block()
+        num_blocks = self._num_blocks()
+        if first_block is None or num_blocks == 0:
+            return pd.Series(dtype=np.float64, name=f'{self.table_name}_usd')
+        start_block = max(start_block, first_block)
+        end_block = min(end_block, first_block + num_blocks - 1)
+        prices = np.memmap(self.path, dtype=np.float64, mode='r', shape=(num_blocks,))
+        return pd.Series(prices[start_block - first_block:max(end_block - first_block + 1, 0)],
+                         index=pd.RangeIndex(start_block, max(end_block + 1, start_block), name='block_number'),
+                         name=f'{self.table_name}_usd',
+                         copy=False)
@@ -69,6 +69,62 @@ def _get_pool_info(pool_address, pool_platform, fl_agg_conn) -> dict:
     return dict(fl_agg_conn.execute(text(query)).fetchone())
 
 
+def _get_reserves_by_pools(pool_addresses, start_block, end_block, fl_agg_conn) -> dict:
+    """
+    Reserves of many pools in one query: for every pool, the latest sync before start_block and every sync between
+    start_block and end_block, scaled by the decimals of its tokens. Same records as
+    UniV2Pool.get_reserves_by_block_range for each pool, without the per pool lookups
+
+    @param pool_addresses: pool addresses
+    @param start_block: beginning block for the period of interest
+    @param end_block: ending block for the period of interest
+    @return: dict of pool address to its reserves (block_number, log_index, reserve0, reserve1)
+    """
+    columns = ['block_number', 'log_index', 'reserve0', 'reserve1']
+    pool_addresses = sorted(set(pool_addresses))
+    if len(pool_addresses) == 0:
+        return {}
+    addresses = ", ".join(f"'{pool_address}'" for pool_address in pool_addresses)
+    query = f"""
+        WITH pool_info AS (
+            SELECT
+                contract_address,
+                token0_decimals as token0_decimal,
+                token1_decimals as token1_decimal
+            FROM all_pairs
+            LEFT JOIN erc20_token t0 ON t0.token_address = all_pairs.token0_address
+            LEFT JOIN erc20_token t1 ON t1.token_address = all_pairs.token1_address
+            WHERE contract_address IN ({addresses})
+        ),
+        pool_reserves AS (
+            (SELECT DISTINCT ON (address) address, block_number, log_index, reserve0, reserve1
+            FROM raw_pair_sync_event
+            WHERE address IN ({addresses})
+            AND block_number < {start_block}
+            ORDER BY address, block_number DESC, log_index DESC)
+            UNION ALL
+            (SELECT address, block_number, log_index, reserve0, reserve1
+            FROM raw_pair_sync_event
+            WHERE address IN ({addresses}) AND
+            block_number BETWEEN {start_block} AND {end_block})
+        )
+        SELECT
+            address,
+            block_number,
+            log_index,
+            reserve0 / power(10, token0_decimal) as reserve0,
+            reserve1 / power(10, token1_decimal) as reserve1
+        FROM pool_reserves
+        JOIN pool_info ON pool_info.contract_address = pool_reserves.address
+        ORDER BY address, block_number, log_index"""
+    reserves = _read_sql_in_chunks(text(query), fl_agg_conn)
+    reserves_by_pool = {pool_address: pool_reserves[columns].reset_index(drop=True)
+                        for pool_address, pool_reserves in reserves.groupby('address', sort=False)}
+    # pools without any sync in the range still count as loaded
+    empty_reserves = pd.DataFrame(columns=columns)
+    return {pool_address: reserves_by_pool.get(pool_address, empty_reserves) for pool_address in pool_addresses}
+
+
 def _read_sql_in_chunks(query, read_conn, chunk_size=250000):
     df = []
     for chunk in pd.read_sql(query, read_conn, chunksize=chunk_size):
@@ -81,6 +137,37 @@ def _read_sql_in_chunks(query, read_conn, chunk_size=250000):
 class UniV2Pool:
     def __init__(self, read_conn):
         self.read_conn = read_conn
+        # reserves loaded in bulk by set_reserves, see _get_reserves_by_pools
+        self._reserves_by_pool = {}
+        self._reserves_start_block = None
+        self._reserves_end_block = None
+
+    def set_reserves(self, reserves_by_pool, start_block, end_block):
+        """
+        Call this function if you already have the reserves of the pools in memory (see _get_reserves_by_pools), so
+        this object doesn't have to reload them from the db for the block ranges within start_block and end_block
+
+        @param reserves_by_pool: dict of pool address to its reserves
+        @param start_block: beginning block of the loaded reserves
+        @param end_block: ending block of the loaded reserves
+        """
+        self._reserves_by_pool = reserves_by_pool
+        self._reserves_start_block = start_block
+        self._reserves_end_block = end_block
+
+    def _get_loaded_reserves(self, pool_address, start_block, end_block):
+        """
+        Reserves of a pool from the ones set with set_reserves, or None when they don't cover the block range
+        """
+        if pool_address not in self._reserves_by_pool or \
+                not self._reserves_start_block <= start_block <= end_block <= self._reserves_end_block:
+            return None
+        reserves = self._reserves_by_pool[pool_address]
+        block_numbers = reserves['block_number'].values
+        # the latest record before start_block, then the records of the range
+        first = max(np.searchsorted(block_numbers, start_block, side='left') - 1, 0)
+        last = np.searchsorted(block_numbers, end_block, side='right')
+        return reserves.iloc[first:last].reset_index(drop=True)
 
     def get_reserves_by_block_range(self, pool_address, start_block, end_block) -> pd.DataFrame:
         """
@@ -90,6 +177,9 @@ class UniV2Pool:
         @param end_block: ending block for the period of interest
         @return:
         """
+        reserves = self._get_loaded_reserves(pool_address, start_block, end_block)
+        if reserves is not None:
+            return reserves
         # TODO: check if there is func to get the record prior to start block
         pool_info = _get_pool_info(pool_address, 5, self.read_conn)
         if start_block > pool_info['pool_creation_block']:
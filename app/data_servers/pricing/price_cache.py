@@ -0,0 +1,130 @@
+"""
+Cache of the price indices computed by PriceIndex, by token and block range
+"""
+from collections import OrderedDict
+
+import pandas as pd
+
+PRICE_CACHE_MAX_SIZE = 5000000              # Maximum number of prices kept in memory, all tokens included
+
+
+def slice_price_index(price_index, start_block, end_block) -> pd.Series:
+    """
+    Step function price index restricted to the blocks between start_block and end_block (inclusive), starting with
+    the price in effect at start_block
+    """
+    if len(price_index) == 0:
+        return price_index
+    if price_index.index[0] >= start_block:
+        return price_index.loc[:end_block]
+    opening_price = price_index.loc[:start_block].iloc[-1:]
+    opening_price.index = [start_block]
+    return pd.concat([opening_price, price_index.loc[start_block + 1:end_block]])
+
+
+class PriceCache:
+    def __init__(self, max_size=PRICE_CACHE_MAX_SIZE):
+        """
+        Step function price indices by token, each made of contiguous block range segments. A block range within a
+        segment is served by slicing it, a block range overlapping the segments only needs the missing blocks to be
+        priced (see missing_ranges), then the segments are merged. The least recently used tokens are evicted once
+        the cache holds more than max_size prices.
+
+        @param max_size: maximum number of prices kept, all tokens included
+        """
+        self.max_size = max_size
+        self.size = 0
+        # token -> list of [start_block, end_block, price_index], sorted and neither overlapping nor adjacent
+        self._segments = OrderedDict()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token, start_block, end_block):
+        """
+        Price index of a token between start_block and end_block (inclusive), None if the range is not fully cached
+
+        @param token: token key, e.g. (address, network)
+        @return: step function price index starting at start_block, or None
+        """
+        for segment_start, segment_end, price_index in self._segments.get(token, []):
+            if segment_start <= start_block and end_block <= segment_end:
+                self._segments.move_to_end(token)
+                return slice_price_index(price_index, start_block, end_block)
+        return None
+
+    def missing_ranges(self, token, start_block, end_block) -> list:
+        """
+        Block ranges between start_block and end_block (inclusive) which are not cached for this token, and counts
+        the lookup as a hit, a partial hit or a miss
+
+        @param token: token key, e.g. (address, network)
+        @return: list of (start_block, end_block) tuples, inclusive
+        """
+        missing = []
+        block_number = start_block
+        for segment_start, segment_end, _ in self._segments.get(token, []):
+            if segment_end < block_number:
+                continue
+            if segment_start > end_block:
+                break
+            if segment_start > block_number:
+                missing.append((block_number, segment_start - 1))
+            block_number = segment_end + 1
+        if block_number <= end_block:
+            missing.append((block_number, end_block))
+
+        if len(missing) == 0:
+            self.hits += 1
+        elif missing == [(start_block, end_block)]:
+            self.misses += 1
+        else:
+            self.partial_hits += 1
+        return missing
+
+    def put(self, token, start_block, end_block, price_index):
+        """
+        Caches the price index of a token between start_block and end_block (inclusive), merged with the cached
+        segments it overlaps or extends
+
+        @param token: token key, e.g. (address, network)
+        @param price_index: step function price index of the block range
+        """
+        segments = self._segments.pop(token, [])
+        self.size -= sum(len(segment[2]) for segment in segments)
+        merged = [start_block, end_block, price_index]
+        kept = []
+        for segment in segments:
+            if segment[1] + 1 < merged[0] or merged[1] + 1 < segment[0]:
+                kept.append(segment)
+                continue
+            # the new prices win over the cached ones on the blocks they share
+            if segment[0] < merged[0]:
+                merged[2] = pd.concat([segment[2].loc[:merged[0] - 1], merged[2]])
+            if segment[1] > merged[1]:
+                merged[2] = pd.concat([merged[2], slice_price_index(segment[2], merged[1] + 1, segment[1])])
+            merged[0], merged[1] = min(segment[0], merged[0]), max(segment[1], merged[1])
+        # keep the blocks where the price actually changes
+        merged[2] = merged[2][merged[2].ne(merged[2].shift()).values]
+        kept.append(merged)
+        self._segments[token] = sorted(kept, key=lambda segment: segment[0])
+        self.size += sum(len(segment[2]) for segment in kept)
+        self._evict()
+
+    def _evict(self):
+        """
+        Drops the least recently used tokens until the cache fits in max_size (the most recent token is always kept)
+        """
+        while self.size > self.max_size and len(self._segments) > 1:
+            _, segments = self._segments.popitem(last=False)
+            self.size -= sum(len(segment[2]) for segment in segments)
+            self.evictions += 1
+
+    def clear(self):
+        self._segments.clear()
+        self.size = 0
+
+    def __repr__(self):
+        return f"PriceCache(tokens={len(self._segments)}, size={self.size}, hits={self.hits}, " \
+               f"partial_hits={self.partial_hits}, misses={self.misses}, evictions={self.evictions})"
@@ -7,15 +7,14 @@ import sys
 from sqlalchemy import text
 sys.path.append('../')
 import pandas as pd
-from data_servers.pricing.pool_implied_price import PoolImpliedPrice
-
-from functools import lru_cache
+from data_servers.pricing.pool_implied_price import PoolImpliedPrice, _get_reserves_by_pools
+from data_servers.pricing.price_cache import PriceCache
+from data_servers.pricing.native_price import NativePrice, NATIVE_PRICE_DIR
 
 PRICE_EFFICIENT_POOL_MIN_RESERVE = 200000   # Maximum TVL. Used to determine number of pools we use for pricing
 MIN_POOL_SIZE_PER_BLOCK = 0                 # Minimum pool size per block Todo: set back to 100 for production
 MAX_PRICE = 10000000                        # Maximum price to not be considered an outlier
-MAX_RECURSION = 2                           # 10
-MAX_DEPTH = 1
+MAX_DEPTH = 1                               # Maximum number of tokens between a token and a stable coin or network token
 
 class TokenNotTrackedError(Exception):
     pass
@@ -24,6 +23,36 @@ class TokenNotTrackedError(Exception):
 class CouldNotGetPriceError(Exception):
     pass
 
+def _price_at(price, blocks):
+    """
+    Value at each of blocks of a price that is either a constant or a step function (pd.Series indexed by the blocks
+    where the price changes, each price holds until the next block of the index)
+    """
+    if isinstance(price, pd.Series):
+        return price.reindex(blocks, method='ffill').values
+    return price
+
+
+def _change_blocks(price) -> pd.Index:
+    """
+    Blocks of a price series where the price differs from the previous block of the series
+    """
+    return price.index[price.ne(price.shift()).values]
+
+
+def expand_price_index(price_index, end_block) -> pd.Series:
+    """
+    Expands a step function price index to one price per block, from its first block up to end_block (inclusive)
+
+    @param price_index: price per block where the price changes, as returned by PriceIndex.get_sparse_price_index
+    @param end_block: last block of the expanded series
+    @return: price per block
+    """
+    if len(price_index) == 0:
+        return price_index
+    return price_index.reindex(range(price_index.index[0], end_block + 1), method='ffill')
+
+
 class PriceIndex:
     def __init__(self, prod_us1_conn, network_read_conn):
         """
@@ -35,7 +64,9 @@ class PriceIndex:
         self.network_read_conn = network_read_conn
         self.pool_implied_price = PoolImpliedPrice(self.network_read_conn)
         self._ntwk_tkn_price = {}
-        self._num_recursions = 0
+        self.price_cache = PriceCache()
+        self._pricing_info = None
+        self._pricing_info_network = None
 
     def _get_timestamp_by_block_number(self, block_number):
         """
@@ -54,7 +85,67 @@ class PriceIndex:
             self.network_read_conn = network_read_conn
             self.pool_implied_price = PoolImpliedPrice(self.network_read_conn)
             self._ntwk_tkn_price = {}
-            self._num_recursions = 0
+            self.price_cache = PriceCache()
+            self._pricing_info = None
+            self._pricing_info_network = None
+
+    def set_pricing_data(self, pricing_data):
+        """
+        Call this function if you already have the pricing data of a network in memory (see load_pricing_data), so
+        this object doesn't have to query the pricing pools and their reserves token by token
+
+        @param pricing_data: dict returned by load_pricing_data
+        @return:
+        """
+        self._pricing_info = pricing_data['pricing_info']
+        self._pricing_info_network = pricing_data['network']
+        self.pool_implied_price.uniswap_v2_pool.set_reserves(pricing_data['reserves_by_pool'],
+                                                             pricing_data['start_block'],
+                                                             pricing_data['end_block'])
+
+    def load_pricing_data(self, start_blocks, end_block, network) -> dict:
+        """
+        Loads everything needed to price a set of tokens of a network with two queries: the pricing info of the
+        network, then the reserves of every pool used to price any of the tokens. Tokens sharing pools (e.g. the WCSPR
+        pairs) read them once, so the number of queries doesn't grow with the number of tokens.
+        Also sets the data on this object, pass it to set_pricing_data to share it with other PriceIndex objects.
+
+        @param start_blocks: dict of currency id to the first block to price it
+        @param end_block: ending block, inclusive
+        @param network: fluidefi network id
+        @return: dict with the network, pricing_info, reserves_by_pool, start_block and end_block
+        """
+        pricing_info = pd.read_sql(text(self._pricing_info_query(f"network={network}")), self.prod_us1_conn)
+        self._pricing_info = pricing_info
+        self._pricing_info_network = network
+
+        pool_addresses = set()
+        for currency_id, start_block in start_blocks.items():
+            pool_addresses.update(self._get_pricing_pool_addresses(start_block, network, currency_id))
+        start_block = min(start_blocks.values()) if len(start_blocks) > 0 else end_block
+        pricing_data = {
+            'network': network,
+            'pricing_info': pricing_info,
+            'reserves_by_pool': _get_reserves_by_pools(pool_addresses, start_block, end_block, self.network_read_conn),
+            'start_block': start_block,
+            'end_block': end_block
+        }
+        self.set_pricing_data(pricing_data)
+        return pricing_data
+
+    def _get_pricing_pool_addresses(self, start_block, network, currency_id) -> set:
+        """
+        Addresses of the pools get_sparse_price_index would read to price this token from start_block, including the
+        pools of the pricing tokens it depends on
+        """
+        try:
+            pricing_pools = self._get_pricing_pools(network=network, currency_id=currency_id, block_number=start_block)
+        except TokenNotTrackedError:
+            return set()
+        pool_addresses = set()
+        for _, token_pricing_pools, _ in self._get_pricing_graph(pricing_pools, start_block):
+            pool_addresses.update(token_pricing_pools.loc[~token_pricing_pools['is_network_currency'], 'pool_address'])
+        return pool_addresses
 
     def set_network_token_price(self, price_per_block, table_name):
         """
@@ -80,6 +171,18 @@ class PriceIndex:
                                 WHERE block_number BETWEEN {start_block} AND {end_block}
                                 ORDER BY block_number"""
 
+        # Case 0: the prices are kept in a memory mapped file, the series in memory is a view of the file
+        if NATIVE_PRICE_DIR:
+            loaded = self._ntwk_tkn_price.get(table_name)
+            if loaded is None or len(loaded) == 0 or loaded.index[0] > start_block or loaded.index[-1] < end_block:
+                native_price = NativePrice(NATIVE_PRICE_DIR, table_name)
+                load_start, load_end = start_block, end_block
+                if loaded is not None and len(loaded) > 0:
+                    load_start, load_end = min(start_block, loaded.index[0]), max(end_block, loaded.index[-1])
+                native_price.update(self.network_read_conn, load_start, load_end)
+                self._ntwk_tkn_price[table_name] = native_price.get(load_start, load_end)
+            return self._ntwk_tkn_price[table_name].loc[start_block:end_block]
+
         # Case 1: token price is never loaded before
         if table_name not in self._ntwk_tkn_price:
             # Load the price from the db
@@ -98,7 +201,7 @@ class PriceIndex:
                                                   self.network_read_conn,
                                                   index_col='block_number')[f'{table_name}_usd']
             # Store it in memory
-            self._ntwk_tkn_price[table_name] = network_token_price_usd.append(self._ntwk_tkn_price[table_name])
+            self._ntwk_tkn_price[table_name] = pd.concat([network_token_price_usd, self._ntwk_tkn_price[table_name]])
 
         # Case 3: Token price is loaded before, but prices before start_block are needed
         if self._ntwk_tkn_price[table_name].index[-1] < end_block:
@@ -108,7 +211,7 @@ class PriceIndex:
                                                   self.network_read_conn,
                                                   index_col='block_number')[f'{table_name}_usd']
             # Store it in memory
-            self._ntwk_tkn_price[table_name] = self._ntwk_tkn_price[table_name].append(network_token_price_usd)
+            self._ntwk_tkn_price[table_name] = pd.concat([self._ntwk_tkn_price[table_name], network_token_price_usd])
 
         if end_block > self._ntwk_tkn_price[table_name].index[-1]:
             end_block = self._ntwk_tkn_price[table_name].index[-1]
@@ -117,14 +220,12 @@ class PriceIndex:
 
         return self._ntwk_tkn_price[table_name].loc[start_block:end_block]
 
-    def _get_pricing_pools(self, address=None, network=None, currency_id=None, block_number=None) -> pd.DataFrame:
+    @staticmethod
+    def _pricing_info_query(condition) -> str:
         """
-        Fetches information about pools needed to price this token.
-        Only one of address or currency_id are required
+        Query of the fungible_token_pricing records matching condition
         """
-        assert (address and network) or currency_id, "Must provide an address + network or a currency_id"
-        # Step 1: Load data from fungible_token_pricing_info
-        query = f"""
+        return f"""
             SELECT 
                 target_token_address,
                 target_token_id,
@@ -146,10 +247,26 @@ class PriceIndex:
                 network_token_symbol,
                 is_network_currency
             FROM fungible_token_pricing
-            WHERE {f"target_token_address='{address}' and network={network}" if address else
-                    f"target_token_id={currency_id}"}
+            WHERE {condition}
+        """
+
+    def _get_pricing_pools(self, address=None, network=None, currency_id=None, block_number=None) -> pd.DataFrame:
         """
-        token_pricing_info = pd.read_sql(text(query), self.prod_us1_conn)
+        Fetches information about pools needed to price this token.
+        Only one of address or currency_id are required
+        """
+        assert (address and network) or currency_id, "Must provide an address + network or a currency_id"
+        # Step 1: Load data from fungible_token_pricing_info
+        if self._pricing_info is not None and (not address or network == self._pricing_info_network):
+            if address:
+                is_token = self._pricing_info['target_token_address'] == address
+            else:
+                is_token = self._pricing_info['target_token_id'] == currency_id
+            token_pricing_info = self._pricing_info[is_token]
+        else:
+            condition = f"target_token_address='{address}' and network={network}" if address else \
+                f"target_token_id={currency_id}"
+            token_pricing_info = pd.read_sql(text(self._pricing_info_query(condition)), self.prod_us1_conn)
         token_pricing_info = token_pricing_info[token_pricing_info['created_at_block_number'] <= block_number]
         if len(token_pricing_info) == 0:
             er = "Token with " + f"address='{address}'" if address else f"currency_id={currency_id}" + f" is not tracked as of block_number= {block_number}"
@@ -181,13 +298,77 @@ class PriceIndex:
         num_pools = sum(cumil_poolsize < PRICE_EFFICIENT_POOL_MIN_RESERVE) + 1
         return token_pricing_info.head(max(num_pools, 3))
 
-    @lru_cache(4)
-    def get_price_index(self, start_block, end_block, address=None, network=1, currency_id=None, depth=0):
+    def _get_pricing_graph(self, pricing_pools, start_block) -> list:
+        """
+        Pricing graph of a token: the tokens its pools are priced against, directly or through their own pools, in
+        topological order from the tokens priced against stable coins or the network token only, up to the token
+        itself (last). A pool priced against another token is only used when that token doesn't depend back on the
+        priced token and is less than MAX_DEPTH tokens away from a stable coin or the network token
+
+        @param pricing_pools: pools of the token, as returned by _get_pricing_pools
+        @param start_block: starting block, used to pick the pools of the pricing tokens
+        @return: list of (token, pricing pools, tokens priced before it that its pools use), tokens are
+        (address, network) tuples
+        """
+        token = (pricing_pools['target_token_address'].iloc[0], pricing_pools['network'].iloc[0])
+        order = []
+        self._visit_pricing_graph(token, pricing_pools, start_block, {token}, order, {})
+        # drop the tokens only reachable through unusable pools
+        needed = {token}
+        for token, _, dependencies in reversed(order):
+            if token in needed:
+                needed.update(dependencies)
+        return [node for node in order if node[0] in needed]
+
+    def _visit_pricing_graph(self, token, pricing_pools, start_block, visiting, order, levels):
         """
-        Price index for a fungible token for a given blocks range. Either address or currency id must be provided.
-        Use start_block = end_block to get the price at a certain block
+        Depth first visit of the pricing graph, appends token to order after the tokens it depends on.
+        levels holds the number of tokens between each visited token and a stable coin or the network token
+        """
+        dependencies = []
+        for _, pricing_pool in pricing_pools.iterrows():
+            if pricing_pool['is_pricing_token'] or pricing_pool['is_network_currency']:
+                continue
+            dependency = (pricing_pool['pricing_token_address'], pricing_pool['network'])
+            if dependency in visiting or dependency in dependencies:
+                continue
+            if dependency not in levels:
+                try:
+                    dependency_pools = self._get_pricing_pools(*dependency, block_number=start_block)
+                except TokenNotTrackedError:
+                    continue
+                self._visit_pricing_graph(dependency, dependency_pools, start_block, visiting | {dependency}, order,
+                                          levels)
+            if levels[dependency] < MAX_DEPTH:
+                dependencies.append(dependency)
+        levels[token] = 1 + max(levels[dependency] for dependency in dependencies) if dependencies else 0
+        order.append((token, pricing_pools, dependencies))
+
+    def get_price_index(self, start_block, end_block, address=None, network=1, currency_id=None):
+        """
+        Price index for a fungible token for a given blocks range, one price per block. Either address or currency id
+        must be provided. Use start_block = end_block to get the price at a certain block
+
+        @param start_block: starting block, inclusive
+        @param end_block: closing block, inclusive
+        @param address: checksum token address
+        @param network: fluidefi network id
+        @param currency_id: currency id as per currency table
+        @return: price per block
+        """
+        price_index = self.get_sparse_price_index(start_block, end_block, address, network, currency_id)
+        return expand_price_index(price_index, end_block)
+
+    def get_sparse_price_index(self, start_block, end_block, address=None, network=1, currency_id=None):
+        """
+        Price index for a fungible token for a given blocks range as a step function: the series only holds the blocks
+        where the price changes (a sync of a pricing pool or a change of the price of a pricing token) and each price
+        holds until the next block of the series. Either address or currency id must be provided.
+        Use expand_price_index to get one price per block.
+        The tokens its pools are priced against are priced first, in the order of the pricing graph. The price of every
+        token is kept in price_cache and reused by all the tokens priced against it, only the blocks not cached yet
+        are priced
 
-        @param depth: for tracking recursion depth
         @param start_block: starting block, inclusive
         @param end_block: closing block, inclusive
         @param address: checksum token address
@@ -201,7 +382,29 @@ class PriceIndex:
         #   Step 1: Get the pools needed to construct the price
         pricing_pools = self._get_pricing_pools(address, network, currency_id, start_block)
 
-        #   Step 2: Get an implied price the reserves from each pool
+        #   Step 2: Price the token and the tokens it depends on, in order
+        prices = {}
+        for token, token_pricing_pools, dependencies in self._get_pricing_graph(pricing_pools, start_block):
+            for missing_start, missing_end in self.price_cache.missing_ranges(token, start_block, end_block):
+                pricing_token_prices = {dependency: prices[dependency] for dependency in dependencies}
+                price_index = self._price_from_pools(token_pricing_pools, missing_start, missing_end,
+                                                     pricing_token_prices)
+                self.price_cache.put(token, missing_start, missing_end, price_index)
+            prices[token] = self.price_cache.get(token, start_block, end_block)
+        return prices[token]
+
+    def _price_from_pools(self, pricing_pools, start_block, end_block, pricing_token_prices) -> pd.Series:
+        """
+        Step function price index of a token from the reserves of its pools
+
+        @param pricing_pools: pools of the token, as returned by _get_pricing_pools
+        @param start_block: starting block, inclusive
+        @param end_block: closing block, inclusive
+        @param pricing_token_prices: price index of the tokens the pools not priced against a stable coin or the
+        network token use, by (address, network). Pools priced against any other token are skipped
+        @return: price per block where the price changes, empty if none of the pools could be used
+        """
+        #   Get an implied price the reserves from each pool
         prices_by_pool = []
         usd_size_by_pool = []
         for _, pricing_pool in pricing_pools.iterrows():
@@ -236,17 +439,12 @@ class PriceIndex:
             elif pricing_pool['is_pricing_token'] and pricing_pool['is_usd_stable_coin']:
                 # this is a stable coin, use it's value
                 pricing_token_price_usd = 1
-            # Case 2.3: Need to build an optimal path of pools
+            # Case 2.3: We imply the price using another token, priced before this one (see _get_pricing_graph)
             else:
-                # Need to get the price of this pricing token using other pools.
-                if self._num_recursions == MAX_RECURSION or depth == MAX_DEPTH:
+                pricing_token = (pricing_pool['pricing_token_address'], pricing_pool['network'])
+                if pricing_token not in pricing_token_prices:
                     continue
-                self._num_recursions += 1
-                pricing_token_price_usd = self.get_price_index(reserves.index[0],
-                                                               end_block,
-                                                               address=pricing_pool['pricing_token_address'],
-                                                               network=pricing_pool['network'],
-                                                               depth=depth + 1)
+                pricing_token_price_usd = pricing_token_prices[pricing_token]
 
             if pricing_pool['target_token_idx'] == 0:
                 reserves.rename({"reserve0": "target_token", "reserve1": "pricing_token"}, axis=1, inplace=True)
@@ -256,30 +454,36 @@ class PriceIndex:
 
             # Removing outliers
             reserves = reserves.rolling(min(len(reserves), 3), center=True).median().ffill().bfill()
-            reserves['pricing_token_price_usd'] = pricing_token_price_usd
+            reserves['pricing_token_price_usd'] = _price_at(pricing_token_price_usd, reserves.index)
             pool_size = reserves['pricing_token'] * reserves['pricing_token_price_usd'] * 2
             reserves = reserves[pool_size > MIN_POOL_SIZE_PER_BLOCK]
             token_implied_price_usd = reserves["reserve_ratio"] * reserves['pricing_token_price_usd']
             reserves = reserves[token_implied_price_usd < MAX_PRICE]
             if len(reserves) == 0:
                 continue
-            # extrapolate the reserves
-            blocks = range(max(start_block, reserves.index[0]), end_block + 1)
+            # the price of this pool changes with its reserves and with the price of the pricing token
+            blocks = reserves.index
+            if isinstance(pricing_token_price_usd, pd.Series):
+                blocks = blocks.union(_change_blocks(pricing_token_price_usd.loc[blocks[0]:end_block]))
             reserves = reserves.reindex(blocks, method='ffill')
-            reserves['pricing_token_price_usd'] = pricing_token_price_usd
+            reserves['pricing_token_price_usd'] = _price_at(pricing_token_price_usd, blocks)
             token_implied_price_usd = reserves["reserve_ratio"] * reserves['pricing_token_price_usd']
             pool_size = reserves['pricing_token'] * reserves['pricing_token_price_usd'] * 2
             prices_by_pool.append(token_implied_price_usd)
             usd_size_by_pool.append(pool_size)
 
-        if depth == 0:
-            self._num_recursions = 0
+        if len(prices_by_pool) == 0:
+            return pd.Series(dtype=float)
+
+        # Step 3: Construct a price index on the blocks where the price of any pool changes. Every pool holds its price
+        # and size until its next change, and has no weight before its first one
+        usd_size_by_pool = pd.concat(usd_size_by_pool, axis=1).sort_index().ffill().fillna(0)
+        sum_weights = usd_size_by_pool.sum(axis=1)
+        normalized_weights = usd_size_by_pool.divide(sum_weights, axis=0)
+        price_index = pd.concat(prices_by_pool, axis=1).sort_index().ffill().fillna(0).mul(normalized_weights).sum(axis=1)
+        # keep the blocks where the index actually changes
+        return price_index[price_index.ne(price_index.shift()).values]
 
-        # Step 3: Construct a price index
-        sum_weights = pd.concat(usd_size_by_pool, axis=1).fillna(0).sum(axis=1)
-        normalized_weights = pd.concat(usd_size_by_pool, axis=1).fillna(0).divide(sum_weights, axis=0)
-        price_index = pd.concat(prices_by_pool, axis=1).fillna(0).mul(normalized_weights).sum(axis=1)
-        return price_index
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+"""
+Series and dataframes shared between processes through shared memory, so worker processes read them without
+unpickling a copy each
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+def to_shared_memory(frame) -> tuple:
+    """
+    Copies a series, or a dataframe with all its columns of the same dtype, and its index to a new shared memory block
+
+    @param frame: series or dataframe with a numeric or datetime index
+    @return: the shared memory block (close and unlink it once the workers are done) and the description of the frame
+    to pass to from_shared_memory
+    """
+    index = frame.index
+    tz = getattr(index, 'tz', None)
+    index_values = np.ascontiguousarray(index.tz_convert(None).values if tz is not None else index.values)
+    values = np.ascontiguousarray(frame.values)
+    shm = shared_memory.SharedMemory(create=True, size=max(index_values.nbytes + values.nbytes, 1))
+    np.ndarray(index_values.shape, dtype=index_values.dtype, buffer=shm.buf)[:] = index_values
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=index_values.nbytes)[:] = values
+    description = {
+        'name': shm.name,
+        'index_name': index.name,
+        'index_dtype': index_values.dtype.str,
+        'tz': str(tz) if tz is not None else None,
+        'length': len(index_values),
+        'dtype': values.dtype.str,
+        'shape': values.shape,
+        'columns': list(frame.columns) if isinstance(frame, pd.DataFrame) else None,
+        'series_name': frame.name if isinstance(frame, pd.Series) else None
+    }
+    return shm, description
+
+
+def from_shared_memory(description) -> tuple:
+    """
+    Series or dataframe backed by a shared memory block created by to_shared_memory, without copying it
+
+    @param description: description returned by to_shared_memory
+    @return: the shared memory block (keep a reference to it while the frame is in use) and the series or dataframe
+    """
+    shm = shared_memory.SharedMemory(name=description['name'])
+    index_values = np.ndarray(description['length'], dtype=np.dtype(description['index_dtype']), buffer=shm.buf)
+    values = np.ndarray(description['shape'], dtype=np.dtype(description['dtype']), buffer=shm.buf,
+                        offset=index_values.nbytes)
+    index = pd.Index(index_values, name=description['index_name'], copy=False)
+    if description['tz'] is not None:
+        index = index.tz_localize(description['tz'])
+    if description['columns'] is None:
+        return shm, pd.Series(values, index=index, name=description['series_name'], copy=False)
+    return shm, pd.DataFrame(values, index=index, columns=description['columns'], copy=False)
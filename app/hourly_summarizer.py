@@ -11,7 +11,13 @@ django.setup()
 from cspr_summarization.entities.HourlyData import HourlyData
 from cspr_summarization.entities.BlockHours import BlockHours
 import pandas as pd
-from cspr_summarization.services.lp_hourly_summarizer.lp_hourly_summarizer import LpHourlySummarizer
+from cspr_summarization.services.lp_hourly_summarizer.lp_hourly_summarizer import LpHourlySummarizer, HOURLY_DATA_KEY, \
+  update_cumulative_totals, clear_cumulative_totals
+from cspr_summarization.services.pair_state.pair_state import PairState
+from cspr_summarization.services.bulk_writer.bulk_writer import bulk_upsert
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from django.db import connections
 import pytz
 from datetime import datetime, timedelta
 import logging
@@ -20,7 +26,76 @@ import time
 
 logging.basicConfig(level=logging.INFO)
 
-def run_hourly_summarizer(start_hour_param = None):
+# Latest reserves and lp token supply of every pair, carried from one hour to the next and snapshotted to
+# the `PAIR_STATE_SNAPSHOT_PATH` file (when set) so a restart does not rebuild it from the whole history
+PAIR_STATE_SNAPSHOT_PATH = os.getenv('PAIR_STATE_SNAPSHOT_PATH')
+pair_state = PairState.load(PAIR_STATE_SNAPSHOT_PATH)
+
+# Number of worker processes summarizing missed hours in parallel while catching up (1: one hour at a time).
+# Override with the `HOURLY_SUMMARY_WORKERS` env var
+HOURLY_SUMMARY_WORKERS = int(os.getenv('HOURLY_SUMMARY_WORKERS') or 1)
+
+# Number of hours written with one bulk write when recalculating a range of hours.
+# Override with the `HOURLY_RECALCULATE_BATCH_HOURS` env var
+HOURLY_RECALCULATE_BATCH_HOURS = int(os.getenv('HOURLY_RECALCULATE_BATCH_HOURS') or 24)
+
+'''
+# Summarize one hour (only `pairs` when given) and return its hourly_data rows without writing them
+'''
+def summarize_hour(start_hour, pairs = None):
+  summarizer = LpHourlySummarizer(start_hour, start_hour + timedelta(hours=1), pairs=pairs)
+  return summarizer.single_pass_summarizer()
+
+'''
+# Summarize the hours of [start_hour, end_hour), with a pool of HOURLY_SUMMARY_WORKERS processes when it is above 1.
+# Every worker opens its own DB connections and the rows are written in hour order by batches of `batch_hours` hours,
+# so the latest close_timestamp_utc of hourly_data stays a checkpoint the next run can resume from if it stops.
+# The running totals are extended with every batch, and shifted for the rows after end_hour once the range is written
+'''
+def summarize_hour_range(start_hour, end_hour, pairs = None, batch_hours = 1):
+  hours = []
+  next_start_hour = start_hour
+  while next_start_hour < end_hour:
+    hours.append(next_start_hour)
+    next_start_hour = next_start_hour + timedelta(hours=1)
+  if len(hours) == 0:
+    return
+  logging.info(f'🧮 Summarizing {len(hours)} hours from {start_hour} to {end_hour} with {HOURLY_SUMMARY_WORKERS} workers...')
+
+  started_at = time.time()
+  num_hours = num_rows = 0
+  batch = []
+  executor = None
+  try:
+    if HOURLY_SUMMARY_WORKERS > 1:
+      # the workers must not share the connections of this process
+      connections.close_all()
+      executor = ProcessPoolExecutor(max_workers=HOURLY_SUMMARY_WORKERS)
+      results = executor.map(summarize_hour, hours, repeat(pairs))
+    else:
+      results = map(summarize_hour, hours, repeat(pairs))
+    for next_start_hour, hourly_data in zip(hours, results):
+      batch.append(hourly_data)
+      if len(batch) == batch_hours or next_start_hour == hours[-1]:
+        num_rows += bulk_upsert(HourlyData, pd.concat(batch), HOURLY_DATA_KEY)
+        update_cumulative_totals(hours[num_hours], next_start_hour + timedelta(hours=1), pairs)
+        num_hours += len(batch)
+        batch = []
+        elapsed = max(time.time() - started_at, 1e-6)
+        logging.info(f'\t ✅ {num_hours}/{len(hours)} hours saved up to {next_start_hour + timedelta(hours=1)}: '
+                     f'{num_rows} rows, {num_hours / elapsed:.2f} hours/s, {num_rows / elapsed:.0f} rows/s')
+    update_cumulative_totals(end_hour, pairs=pairs)
+  except Exception as e:
+    logging.error(f'❌ Hourly Summarization stopped after {num_hours} of {len(hours)} hours: {str(e)}')
+    # the totals of the hours left and of the rows after them no longer follow the rewritten hours
+    clear_cumulative_totals(hours[num_hours] if num_hours < len(hours) else end_hour, pairs)
+    return
+  finally:
+    if executor is not None:
+      executor.shutdown(cancel_futures=True)
+  logging.info(f'✅ Summarized {len(hours)} hours in {time.time() - started_at:.1f}s')
+
+def run_hourly_summarizer(start_hour_param = None, single_pass = True):
 
   # Normal hourly run
   if start_hour_param is None:
@@ -57,52 +132,90 @@ def run_hourly_summarizer(start_hour_param = None):
   if (next_start_hour >= last_hourly_block_timestamp) and (not forced_to_run):
     logging.info(f'✅ Hourly Summarization has already been run for the time range: {next_start_hour} - {next_end_hour}')
 
+  # More than one missed hour: summarize them in parallel
+  if single_pass and (not forced_to_run) and HOURLY_SUMMARY_WORKERS > 1 \
+    and (last_hourly_block_timestamp - next_start_hour) > timedelta(hours=1):
+    summarize_hour_range(next_start_hour, last_hourly_block_timestamp)
+    return
+
   # While not done with all the missed past hours Do ...
   while (last_hourly_block_timestamp > next_start_hour) or (forced_to_run):
 
-    summarizer = LpHourlySummarizer(next_start_hour, next_end_hour)
-    # Initialize Data (all column at 0)
-    summarizer.init_hourly_data()
+    summarizer = LpHourlySummarizer(next_start_hour, next_end_hour, pair_state)
     logging.info(f'🧮 Hourly Summarization started {next_start_hour} - {next_end_hour}...')
 
-    # At least one block on the last hour
-    if len(summarizer.last_hour_block_numbers) > 0 :
-      logging.info(f'\t Sync Summarizing data...')
-      summarizer.sync_consumer()
-      logging.info(f'\t Mint Summarizing data...')
-      summarizer.mint_consumer()
-      logging.info(f'\t Burn Summarizing data...')
-      summarizer.burn_consumer()
-      logging.info(f'\t Swap Summarizing data...')
-      summarizer.swap_consumer()
-      logging.info(f'\t Clost lp token Summarizing data...')
-      summarizer.close_lp_token_supply_consumer()
-      logging.info(f'\t Max Block Summarizing data...')
-      summarizer.max_block_consumer()
-      logging.info(f'✅ End of Hourly Summarization for time range {next_start_hour} - {next_end_hour}')
-    # No block on the last hour
+    # Summarize all the pairs in memory and write each hourly_data row once
+    if single_pass:
+      summarizer.single_pass_consumer()
+      if len(summarizer.last_hour_block_numbers) > 0:
+        logging.info(f'✅ End of Hourly Summarization for time range {next_start_hour} - {next_end_hour}')
+      else:
+        logging.info(f'❗️ No blocks have been created for the time range {next_start_hour} - {next_end_hour}')
+    # Multi pass: initialize Data (all column at 0) and then update it with each consumer
     else:
-      logging.info(f'❗️ No blocks have been created for the time range {next_start_hour} - {next_end_hour}')
+      summarizer.init_hourly_data()
+      # At least one block on the last hour
+      if len(summarizer.last_hour_block_numbers) > 0 :
+        logging.info(f'\t Sync Summarizing data...')
+        summarizer.sync_consumer()
+        logging.info(f'\t Mint Summarizing data...')
+        summarizer.mint_consumer()
+        logging.info(f'\t Burn Summarizing data...')
+        summarizer.burn_consumer()
+        logging.info(f'\t Swap Summarizing data...')
+        summarizer.swap_consumer()
+        logging.info(f'\t Clost lp token Summarizing data...')
+        summarizer.close_lp_token_supply_consumer()
+        logging.info(f'\t Max Block Summarizing data...')
+        summarizer.max_block_consumer()
+        logging.info(f'✅ End of Hourly Summarization for time range {next_start_hour} - {next_end_hour}')
+      # No block on the last hour
+      else:
+        logging.info(f'❗️ No blocks have been created for the time range {next_start_hour} - {next_end_hour}')
+    summarizer.cumulative_totals_consumer()
 
     #
     next_start_hour = (next_start_hour + timedelta(hours=1))
     next_end_hour = (next_start_hour + timedelta(hours=1))
     # make sure that the FORCE Summarization run only one time
     forced_to_run = False
+
+  # A recalculated hour shifts the running totals of the rows after it, updated once all the hours are written
+  if start_hour_param is not None:
+    try:
+      update_cumulative_totals(next_start_hour)
+    except Exception as e:
+      logging.error(f'❌ Could not update the cumulative totals after {next_start_hour}, clearing them: {str(e)}')
+      clear_cumulative_totals(next_start_hour)
+
+  pair_state.save(PAIR_STATE_SNAPSHOT_PATH)
     
 
 if __name__ == '__main__':
   logging.info('🚀 Hourly Summarization service started 🚀')
 
   force_start_hour = os.getenv('FORCE_RECALCULATE_START_HOUR')
+  force_end_hour = os.getenv('FORCE_RECALCULATE_END_HOUR')
+  force_pairs = os.getenv('FORCE_RECALCULATE_PAIRS')
   if(force_start_hour is not None and force_start_hour != '' ):
     logging.info(f'🎩 Summarization forced to run for the starting hour: {force_start_hour}')
     try:
       start_hour = datetime.strptime(force_start_hour, '%Y-%m-%d %H:%M %z')
-      run_hourly_summarizer(start_hour_param=start_hour)
+      # Recalculate the range of hours [FORCE_RECALCULATE_START_HOUR, FORCE_RECALCULATE_END_HOUR) for the pairs of FORCE_RECALCULATE_PAIRS
+      if (force_end_hour is not None and force_end_hour != '') or (force_pairs is not None and force_pairs != ''):
+        end_hour = datetime.strptime(force_end_hour, '%Y-%m-%d %H:%M %z') if force_end_hour else start_hour + timedelta(hours=1)
+        pairs = [pair.strip() for pair in force_pairs.split(',') if pair.strip() != ''] if force_pairs else None
+        # a list of separators only is a mistake, not a request for all the pairs
+        if pairs is not None and len(pairs) == 0:
+          logging.error(f'❌ No pair address in `FORCE_RECALCULATE_PAIRS` ({force_pairs!r}), it should be a comma separated list of pair addresses')
+        else:
+          logging.info(f'🎩 Recalculating {start_hour} - {end_hour} for {len(pairs) if pairs else "all the"} pairs')
+          summarize_hour_range(start_hour, end_hour, pairs, HOURLY_RECALCULATE_BATCH_HOURS)
+      else:
+        run_hourly_summarizer(start_hour_param=start_hour)
     except Exception as e:
       logging.info(f'❌ Could not force the summarization')
-      logging.info(f'\t ❌ the env var `FORCE_RECALCULATE_START_HOUR` should be of format `%Y-%m-%d %H:%M %z`: ')
+      logging.info(f'\t ❌ the env vars `FORCE_RECALCULATE_START_HOUR` and `FORCE_RECALCULATE_END_HOUR` should be of format `%Y-%m-%d %H:%M %z`: ')
       logging.info(f'\t\t ❌ Y: Year (example: 2023)')
       logging.info(f'\t\t ❌ m: Month (example: 02)')
       logging.info(f'\t\t ❌ d: Day (example: 12)')
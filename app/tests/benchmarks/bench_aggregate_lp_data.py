@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../data_servers")
+import time
+import numpy as np
+import pandas as pd
+
+from data_servers.liquidity_pool.liquidity_pool import compounded_return
+from data_servers.liquidity_pool.univ2_liquidity_pool import UniV2LiquidityPool
+
+# Benchmark of UniV2LiquidityPool.aggregate_lp_data against the previous implementation (resample().agg() with one
+# (x + 1).prod() - 1 lambda call per period and return column), on the hourly summary of a pool over several years.
+# Run with: cd tests/benchmarks && python3 bench_aggregate_lp_data.py [num_years]
+
+
+def hourly_lp_summary(lp, num_hours):
+    rng = np.random.default_rng(0)
+    open_timestamps = pd.date_range('2020-01-01', periods=num_hours, freq='H')
+    close_reserve_0 = 1e6 * np.exp(np.cumsum(rng.normal(0, 0.01, num_hours)))
+    close_reserve_1 = 2e6 * np.exp(np.cumsum(rng.normal(0, 0.01, num_hours)))
+    close_lp_token_supply = np.sqrt(close_reserve_0 * close_reserve_1) * (1 - np.cumsum(rng.random(num_hours)) * 1e-7)
+    lp_summary = pd.DataFrame({
+        'open_timestamp_utc': open_timestamps,
+        'close_timestamp_utc': open_timestamps + pd.Timedelta(hours=1),
+        'close_reserve_0': close_reserve_0,
+        'close_reserve_1': close_reserve_1,
+        'close_lp_token_supply': close_lp_token_supply,
+        'open_reserve_0': np.roll(close_reserve_0, 1),
+        'open_reserve_1': np.roll(close_reserve_1, 1),
+        'open_lp_token_supply': np.roll(close_lp_token_supply, 1),
+        'num_swaps_0': rng.integers(0, 5, num_hours),
+        'num_swaps_1': rng.integers(0, 5, num_hours),
+        'num_mints': rng.integers(0, 2, num_hours),
+        'num_burns': rng.integers(0, 2, num_hours),
+        'volume_0': rng.random(num_hours) * 100,
+        'volume_1': rng.random(num_hours) * 100,
+    })
+    for i in [0, 1]:
+        close_price = np.exp(np.cumsum(rng.normal(0, 0.01, num_hours)))
+        lp_summary[f'open_price_{i}'] = np.roll(close_price, 1)
+        lp_summary[f'close_price_{i}'] = close_price
+        lp_summary[f'high_price_{i}'] = close_price * 1.01
+        lp_summary[f'low_price_{i}'] = close_price * 0.99
+        lp_summary[f'all_time_high_{i}'] = np.maximum.accumulate(close_price)
+        lp_summary[f'hours_since_ath_{i}'] = 0
+    lp_summary = lp_summary.iloc[1:].reset_index(drop=True)
+    lp._compute_base_currency_metrics(lp_summary)
+    lp._compute_backward_compatibility_metrics(lp_summary)
+    lp_summary['open_reserve_ratio'] = lp_summary['open_reserve_0'] / lp_summary['open_reserve_1']
+    lp_summary['close_reserve_ratio'] = lp_summary['close_reserve_0'] / lp_summary['close_reserve_1']
+    lp.compute_returns(lp_summary)
+    return lp_summary
+
+
+def lambda_aggregate_lp_data(lp, lp_summary, data_frequency):
+    aggregation_rules = {col: (lambda x: (x + 1).prod() - 1) if rule is compounded_return else rule
+                         for col, rule in lp.aggregation_rules.items()}
+    for col in aggregation_rules:
+        if col not in lp_summary:
+            lp_summary[col] = None
+    lp_summary.set_index('open_timestamp_utc', inplace=True, drop=False)
+    lp_summary = lp_summary.resample(data_frequency).agg(aggregation_rules)
+    lp_summary.reset_index(drop=True, inplace=True)
+    lp_summary.drop([col for col in lp_summary.columns if "_croi" in col], inplace=True, axis=1)
+    lp._compute_base_currency_metrics(lp_summary)
+    return lp_summary
+
+
+def main(num_years):
+    lp = UniV2LiquidityPool(None, {}, None)
+    lp_summary = hourly_lp_summary(lp, int(num_years * 365 * 24))
+    print(f'{len(lp_summary)} hours')
+    for data_frequency in ['D', 'W', 'M', 'Q']:
+        start = time.perf_counter()
+        expected = lambda_aggregate_lp_data(lp, lp_summary.copy(), data_frequency)
+        lambda_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = lp.aggregate_lp_data(lp_summary.copy(), data_frequency)
+        vectorized_time = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(expected, result, check_exact=False, rtol=1e-12)
+        print(f'{data_frequency}: {len(result)} periods, lambdas: {lambda_time:.3f}s, '
+              f'vectorized: {vectorized_time:.3f}s ({lambda_time / vectorized_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,117 @@
+import sys
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../data_servers")
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+
+import exchange_rate_populator
+from exchange_rate_populator import PriceIndex, _get_exchange_rates, _pull_token, _run_in_processes, _run_in_threads
+
+# Benchmark of the exchange rate populator workers, threads against processes, on synthetic tokens each priced with
+# a pool against the network token and a pool against a stable coin. The database writes are left out.
+# Run with: cd tests/benchmarks && python3 bench_exchange_rate_workers.py [num_tokens] [num_hours]
+
+BLOCKS_PER_HOUR = 100
+SYNCS_PER_HOUR = 20
+NETWORK = 1
+
+
+def synthetic_data(num_tokens, num_hours):
+  rng = np.random.default_rng(0)
+  start_block = 1000000
+  end_block = start_block + num_hours * BLOCKS_PER_HOUR - 1
+  timestamps = pd.date_range('2023-01-01', periods=num_hours, freq='H', tz='UTC', name='timestamp_utc')
+  blocks_range = pd.DataFrame({'start_block': start_block + np.arange(num_hours) * BLOCKS_PER_HOUR},
+                              index=timestamps)
+  blocks_range['end_block'] = blocks_range['start_block'] + BLOCKS_PER_HOUR - 1
+  network_token_price = pd.Series(0.03 + rng.normal(0, 0.0001, end_block - start_block + 1).cumsum(),
+                                  index=pd.Index(np.arange(start_block, end_block + 1), name='block_number'),
+                                  name='cspr_price_usd')
+
+  pricing_info = []
+  reserves_by_pool = {}
+  for token_id in range(2, num_tokens + 2):
+    for is_usd_stable_coin in [False, True]:
+      pool_address = f'pool-{token_id}-{int(is_usd_stable_coin)}'
+      pricing_info.append({
+        'target_token_address': f'token-{token_id}', 'target_token_id': token_id, 'platform_type': 5,
+        'pool_name': pool_address, 'pool_address': pool_address, 'network': NETWORK,
+        'pricing_token_address': 'usd' if is_usd_stable_coin else 'wcspr',
+        'latest_price_timestamp': timestamps[0], 'pool_creation_timestamp_utc': timestamps[0],
+        'created_at_block_number': 0, 'target_token_idx': 0, 'lp_watchlevel': 1,
+        'is_usd_stable_coin': is_usd_stable_coin, 'is_pricing_token': True, 'latest_poolsize': 1000000,
+        'fl_db_name': 'postgres', 'native_currency_table': 'cspr_price', 'network_token_symbol': 'cspr',
+        'is_network_currency': False
+      })
+      num_syncs = num_hours * SYNCS_PER_HOUR
+      reserve0 = 1000000 * np.exp(rng.normal(0, 0.001, num_syncs).cumsum())
+      reserves_by_pool[pool_address] = pd.DataFrame({
+        'block_number': np.sort(rng.integers(start_block - 10, end_block + 1, num_syncs)),
+        'log_index': np.zeros(num_syncs, dtype=np.int64),
+        'reserve0': reserve0,
+        'reserve1': reserve0 * (1 if is_usd_stable_coin else 30) * (1 + rng.normal(0, 0.001, num_syncs))
+      }).drop_duplicates('block_number')
+  pricing_data = {
+    'network': NETWORK,
+    'pricing_info': pd.DataFrame(pricing_info),
+    'reserves_by_pool': reserves_by_pool,
+    'start_block': start_block - 10,
+    'end_block': end_block
+  }
+  tokens = pd.DataFrame({
+    'target_token_address': [f'token-{token_id}' for token_id in range(2, num_tokens + 2)],
+    'target_token_id': range(2, num_tokens + 2),
+    'start_timestamp': timestamps[0],
+    'latest_ath': np.nan,
+    'latest_hrs_since_ath': np.nan
+  })
+  return tokens, network_token_price, blocks_range, pricing_data
+
+
+def price_tokens(token_queue, network_token_price, blocks_range, dbcm, pricing_data):
+  pi = PriceIndex(None, None)
+  pi.set_network_token_price(network_token_price, 'cspr_price')
+  pi.set_pricing_data(pricing_data)
+  num_rows = 0
+  token_info = _pull_token(token_queue)
+  while token_info is not None:
+    num_rows += len(_get_exchange_rates(pi, token_info, blocks_range))
+    token_info = _pull_token(token_queue)
+  return num_rows
+
+
+def price_tokens_in_worker_process():
+  worker_process = exchange_rate_populator._worker_process
+  return price_tokens(worker_process['token_queue'], worker_process['network_token_price'],
+                      worker_process['blocks_range'], None, worker_process['pricing_data'])
+
+
+def main(num_tokens, num_hours):
+  tokens, network_token_price, blocks_range, pricing_data = synthetic_data(num_tokens, num_hours)
+  print(f'{num_tokens} tokens, {num_hours} hours')
+
+  # the price index prints every pool it reads
+  with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    thread_rows = sum(_run_in_threads(tokens, network_token_price, blocks_range, None, pricing_data,
+                                      exchange_rate_populator.NUM_THREADS, price_tokens))
+    thread_elapsed = time.perf_counter() - start
+
+    num_processes = exchange_rate_populator.NUM_PROCESSES
+    start = time.perf_counter()
+    process_rows = sum(_run_in_processes(tokens, network_token_price, blocks_range, pricing_data, num_processes,
+                                         price_tokens_in_worker_process, connect=False))
+    process_elapsed = time.perf_counter() - start
+  print(f'threads ({exchange_rate_populator.NUM_THREADS}): {thread_elapsed:.2f}s '
+        f'({num_tokens / thread_elapsed * 60:,.0f} tokens/minute)')
+  print(f'processes ({num_processes}): {process_elapsed:.2f}s ({num_tokens / process_elapsed * 60:,.0f} tokens/minute)')
+
+  # both modes price the same hours
+  assert thread_rows == process_rows == num_tokens * num_hours
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 24 * 30)
@@ -0,0 +1,52 @@
+import sys
+sys.path.insert(0, "../")
+import time
+import numpy as np
+import pandas as pd
+from decimal import Decimal
+
+from mocks.hourly_summarizer import LpHourlySummarizer
+
+# Microbenchmark of the mint, burn and swap summarizers on one hour of synthetic events.
+# Run with: cd tests/benchmarks && python3 bench_hourly_summarizer.py [num_events]
+
+NUM_PAIRS = 500
+
+
+def random_amounts(rng, num_events):
+  # NUMERIC(155) amounts as the ORM returns them, well past the 28 digits of the default Decimal context
+  return [Decimal(int(value) * 10 ** 18) for value in rng.integers(0, 10 ** 12, num_events)]
+
+
+def main(num_events):
+  rng = np.random.default_rng(0)
+  addresses = np.array(['pair-%d' % index for index in range(NUM_PAIRS)])[rng.integers(0, NUM_PAIRS, num_events)]
+  df_events = pd.DataFrame({
+    'address': addresses,
+    'amount0': random_amounts(rng, num_events),
+    'amount1': random_amounts(rng, num_events)
+  })
+  df_swaps = pd.DataFrame({
+    'address': addresses,
+    'amount0_in': random_amounts(rng, num_events),
+    'amount0_out': random_amounts(rng, num_events),
+    'amount1_in': random_amounts(rng, num_events),
+    'amount1_out': random_amounts(rng, num_events)
+  })
+  hourly_summarizer = LpHourlySummarizer(None, None)
+
+  for name, summarizer, df in [('mint_summarizer', hourly_summarizer.mint_summarizer, df_events),
+                               ('burn_summarizer', hourly_summarizer.burn_summarizer, df_events),
+                               ('swap_summarizer', hourly_summarizer.swap_summarizer, df_swaps)]:
+    start = time.perf_counter()
+    result = summarizer(df)
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {num_events} events, {len(result)} pairs in {elapsed:.2f}s ({num_events / elapsed:,.0f} events/s)')
+
+  # the totals must be exact
+  mints = hourly_summarizer.mint_summarizer(df_events)
+  assert sum(mints['mints_0']) == sum(int(value) for value in df_events['amount0'])
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,53 @@
+import sys
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../data_servers")
+import time
+import numpy as np
+import pandas as pd
+
+from exchange_rate_populator import get_ohlc
+
+# Benchmark of get_ohlc against the previous implementation (one price_index.loc slice per hour).
+# Run with: cd tests/benchmarks && python3 bench_ohlc.py [num_hours] [blocks_per_hour]
+
+
+def ohlc_from_series(prices):
+    if len(prices) > 0:
+        return prices.iloc[0], prices.max(), prices.min(), prices.iloc[-1]
+    return np.nan, np.nan, np.nan, np.nan
+
+
+def slicing_get_ohlc(price_index, blocks_ranges):
+    ohlc_rates = blocks_ranges.apply(
+        lambda x: ohlc_from_series(price_index.loc[x['start_block']:x['end_block']]), axis=1)
+    ohlc_rates = ohlc_rates.apply(pd.Series)
+    ohlc_rates.columns = ["open", "high", "low", "close"]
+    return ohlc_rates
+
+
+def main(num_hours, blocks_per_hour):
+    rng = np.random.default_rng(0)
+    start_blocks = 1000000 + np.arange(num_hours) * blocks_per_hour
+    blocks_ranges = pd.DataFrame({'start_block': start_blocks, 'end_block': start_blocks + blocks_per_hour - 1},
+                                 index=pd.date_range('2023-01-01', periods=num_hours, freq='H'))
+    # the token is priced from the middle of the first hour and a few hours have no price at all
+    blocks = np.arange(start_blocks[0] + blocks_per_hour // 2, start_blocks[-1] + blocks_per_hour)
+    blocks = blocks[~np.isin((blocks - start_blocks[0]) // blocks_per_hour, rng.integers(0, num_hours, num_hours // 100))]
+    price_index = pd.Series(np.exp(np.cumsum(rng.normal(0, 0.001, len(blocks)))), index=blocks)
+
+    start = time.perf_counter()
+    expected = slicing_get_ohlc(price_index, blocks_ranges)
+    slicing_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = get_ohlc(price_index, blocks_ranges)
+    vectorized_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(expected, result)
+    print(f'{num_hours} hours, {len(price_index)} priced blocks')
+    print(f'slicing:    {slicing_time:.3f}s')
+    print(f'vectorized: {vectorized_time:.3f}s ({slicing_time / vectorized_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 9000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 300)
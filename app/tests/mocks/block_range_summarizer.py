@@ -0,0 +1,80 @@
+import sys
+sys.path.insert(0, "../")
+from fixtures.block_summarizer import blocks, pairs, sync_events, mint_events, burn_events, swap_events, total_supply
+import pandas as pd
+
+SUMMARY_COLUMNS = ['address', 'block_number', 'block_timestamp_utc', 'reserve0', 'reserve1', 'total_supply',
+                   'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns', 'mints_0', 'mints_1', 'burns_0', 'burns_1',
+                   'volume_0', 'volume_1']
+
+class MockBlockRangeSummarizer:
+    def __init__(self, startBlock, endBlock):
+        self.startBlock = startBlock
+        self.endBlock = endBlock
+        self.pairs = self.allPairsFinder()
+        self.summary = self.rangeSummaryFinder()
+
+    def allPairsFinder(self):
+        df = pd.DataFrame(pairs).rename(columns={'contract_address': 'address'})
+        df['first_mint_event_block_number'] = 0
+        return df
+
+    def blocksFinder(self):
+        df = pd.DataFrame(blocks)
+        return df[(df['block_number'] >= self.startBlock) & (df['block_number'] <= self.endBlock)]
+
+    def eventsFinder(self, events):
+        df = pd.DataFrame(events)
+        return df[(df['block_number'] >= self.startBlock) & (df['block_number'] <= self.endBlock)].sort_values('block_number')
+
+    def initialStateFinder(self, events, columns):
+        df = pd.DataFrame(events)
+        df = df[df['block_number'] < self.startBlock]
+        df = df.sort_values(['address', 'block_number']).groupby('address').tail(1)
+        return df[['address'] + columns]
+
+    def carryForward(self, index, initial, events, columns):
+        latest = events.groupby(['address', 'block_number'], sort=False)[columns].last()
+        seed = initial.assign(block_number=self.startBlock - 1).set_index(['address', 'block_number'])[columns]
+        state = pd.concat([seed, latest])
+        state = state.reindex(state.index.union(index)).sort_index()
+        state = state.groupby(level='address').ffill()
+        return state.reindex(index)
+
+    def rangeSummaryAssembler(self, blocks, initialSyncs, initialSupplies, syncs, mints, burns, swaps, supplies):
+        grid = self.pairs.merge(blocks, how='cross')
+        grid = grid[grid['block_number'] >= grid['first_mint_event_block_number']]
+        grid = grid.rename(columns={'timestamp_utc': 'block_timestamp_utc'}) \
+            .set_index(['address', 'block_number']).sort_index()[['block_timestamp_utc']]
+
+        grid = grid.join(self.carryForward(grid.index, initialSyncs, syncs, ['reserve0', 'reserve1']))
+        grid = grid.join(self.carryForward(grid.index, initialSupplies, supplies, ['total_supply']))
+
+        by_block = ['address', 'block_number']
+        mints = mints.groupby(by_block).agg(num_mints=('amount0', 'size'), mints_0=('amount0', 'sum'), mints_1=('amount1', 'sum'))
+        burns = burns.groupby(by_block).agg(num_burns=('amount0', 'size'), burns_0=('amount0', 'sum'), burns_1=('amount1', 'sum'))
+        swaps = swaps.assign(swap_0=(swaps['amount0_in'] > 0) | (swaps['amount0_out'] > 0),
+                             swap_1=(swaps['amount1_in'] > 0) | (swaps['amount1_out'] > 0))
+        swaps = swaps.groupby(by_block).agg(num_swaps_0=('swap_0', 'sum'), num_swaps_1=('swap_1', 'sum'),
+                                            amount0_in=('amount0_in', 'sum'), amount0_out=('amount0_out', 'sum'),
+                                            amount1_in=('amount1_in', 'sum'), amount1_out=('amount1_out', 'sum'))
+        swaps['volume_0'] = (swaps['amount0_in'] - swaps['amount0_out']).abs()
+        swaps['volume_1'] = (swaps['amount1_in'] - swaps['amount1_out']).abs()
+        swaps = swaps[['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']]
+
+        grid = grid.join(mints).join(burns).join(swaps)
+        grid = grid.fillna(0).reset_index()
+        count_columns = ['num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns']
+        grid[count_columns] = grid[count_columns].astype(int)
+        return grid[SUMMARY_COLUMNS]
+
+    def rangeSummaryFinder(self):
+        return self.rangeSummaryAssembler(
+            self.blocksFinder(),
+            self.initialStateFinder(sync_events, ['reserve0', 'reserve1']),
+            self.initialStateFinder(total_supply, ['total_supply']),
+            self.eventsFinder(sync_events),
+            self.eventsFinder(mint_events),
+            self.eventsFinder(burn_events),
+            self.eventsFinder(swap_events),
+            self.eventsFinder(total_supply))
@@ -6,14 +6,18 @@ import numpy as np
 from decimal import Decimal
 
 class MockBlockSummarizer:
-    def __init__(self, blockNumber):
+    def __init__(self, blockNumber, batched=False):
         self.blockNumber = blockNumber
         self.pairs = self.allPairsFinder()
-        self.syncs = self.pairSyncEventChecker()
-        self.mints = self.pairMintEventChecker()
-        self.burns = self.pairBurnEventChecker()
-        self.swaps = self.pairSwapEventChecker()
-        self.summary = self.tokenTotalSupplyChecker()
+        if batched:
+            self.pairs = self.pairs.rename(columns={'contract_address': 'address'})
+            self.summary = self.batchedSummaryFinder()
+        else:
+            self.syncs = self.pairSyncEventChecker()
+            self.mints = self.pairMintEventChecker()
+            self.burns = self.pairBurnEventChecker()
+            self.swaps = self.pairSwapEventChecker()
+            self.summary = self.tokenTotalSupplyChecker()
 
     def blockTimestampFinder(self):
         for block in blocks:
@@ -154,6 +158,61 @@ class MockBlockSummarizer:
         df = pd.concat([pairs, *merged_list], axis=1)
         return df
     
+    def latestPairSyncEventsFinder(self, addresses):
+        df = pd.DataFrame(sync_events)
+        df = df[(df['block_number'] <= self.blockNumber) & df['address'].isin(addresses)]
+        df = df.sort_values(['address', 'block_number']).groupby('address').tail(1)
+        return df[['address', 'reserve0', 'reserve1']]
+
+    def pairMintEventsFinder(self):
+        df = pd.DataFrame(mint_events)
+        df = df[df['block_number'] == self.blockNumber]
+        return df.groupby('address', as_index=False) \
+            .agg(num_mints=('amount0', 'size'), mints_0=('amount0', 'sum'), mints_1=('amount1', 'sum'))
+
+    def pairBurnEventsFinder(self):
+        df = pd.DataFrame(burn_events)
+        df = df[df['block_number'] == self.blockNumber]
+        return df.groupby('address', as_index=False) \
+            .agg(num_burns=('amount0', 'size'), burns_0=('amount0', 'sum'), burns_1=('amount1', 'sum'))
+
+    def pairSwapEventsFinder(self):
+        df = pd.DataFrame(swap_events)
+        df = df[df['block_number'] == self.blockNumber]
+        df['swap_0'] = (df['amount0_in'] > 0) | (df['amount0_out'] > 0)
+        df['swap_1'] = (df['amount1_in'] > 0) | (df['amount1_out'] > 0)
+        return df.groupby('address', as_index=False) \
+            .agg(num_swaps_0=('swap_0', 'sum'), num_swaps_1=('swap_1', 'sum'),
+                 amount0_in=('amount0_in', 'sum'), amount0_out=('amount0_out', 'sum'),
+                 amount1_in=('amount1_in', 'sum'), amount1_out=('amount1_out', 'sum'))
+
+    def latestTokenTotalSuppliesFinder(self, addresses):
+        df = pd.DataFrame(total_supply)
+        df = df[(df['block_number'] <= self.blockNumber) & df['address'].isin(addresses)]
+        df = df.sort_values(['address', 'block_number']).groupby('address').tail(1)
+        return df[['address', 'total_supply']]
+
+    def summaryAssembler(self, syncs, mints, burns, swaps, supplies):
+        df = self.pairs.set_index('address')
+        for events in [syncs, mints, burns, swaps, supplies]:
+            if events is not None and not events.empty:
+                df = df.join(events.set_index('address'), how='left')
+        if 'amount0_in' in df.columns:
+            df['volume_0'] = (df['amount0_in'] - df['amount0_out']).abs()
+            df['volume_1'] = (df['amount1_in'] - df['amount1_out']).abs()
+            df = df.drop(columns=['amount0_in', 'amount0_out', 'amount1_in', 'amount1_out'])
+        return df.reset_index()
+
+    def batchedSummaryFinder(self):
+        if self.pairs is None or self.pairs.empty:
+            return None
+        addresses = list(self.pairs['address'])
+        return self.summaryAssembler(self.latestPairSyncEventsFinder(addresses),
+                                     self.pairMintEventsFinder(),
+                                     self.pairBurnEventsFinder(),
+                                     self.pairSwapEventsFinder(),
+                                     self.latestTokenTotalSuppliesFinder(addresses))
+
     def summarizer(self):
         df = self.summary
         df.fillna(0, inplace=True)
@@ -6,6 +6,32 @@ from fixtures.block_summarizer import blocks, pairs
 
 logging.basicConfig(level=logging.INFO)
 
+HOURLY_DATA_KEY = ['address', 'open_timestamp_utc', 'close_timestamp_utc']
+HOURLY_DATA_ZERO_COLUMNS = ['close_reserves_0', 'close_reserves_1', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns',
+                            'mints_0', 'mints_1', 'burns_0', 'burns_1', 'volume_0', 'volume_1', 'max_block', 'close_lp_token_supply']
+
+'''
+# Sums `columns` of df per `by` value with exact integer precision and counts the rows of each group.
+# Amounts are NUMERIC(155) so they are summed as Python ints (object arrays) with np.add.reduceat,
+# Decimal arithmetic would round them to 28 digits. Groups are returned in order of first appearance.
+'''
+def grouped_exact_sum(df, columns, by='address'):
+  codes, uniques = pd.factorize(df[by])
+  result = pd.DataFrame(index=pd.Index(uniques))
+  if len(df) == 0:
+    result['num_events'] = np.array([], dtype=int)
+    for col in columns:
+      result[col] = np.array([], dtype=object)
+    return result
+  order = np.argsort(codes, kind='stable')
+  sorted_codes = codes[order]
+  starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+  result['num_events'] = np.diff(np.r_[starts, len(codes)])
+  for col in columns:
+    values = np.array([int(value) for value in df[col].values], dtype=object)
+    result[col] = np.add.reduceat(values[order], starts)
+  return result
+
 class LpHourlySummarizer:
   
   def __init__(self, start_hour, end_hour):
@@ -16,6 +42,33 @@ class LpHourlySummarizer:
     all_pairs = pairs
 
 
+  '''
+  # join the summarized data of every pair into one hourly_data frame, pairs without data are at zero
+  '''
+  def hourly_data_assembler(self, close_reserves, mints_sum_result, burns_sum_result, swap_sum_result, close_total_supply, max_block):
+    hourly_data = pd.DataFrame({'address': self.all_pairs['contract_address'] if len(self.all_pairs) > 0 else []})
+    hourly_data = hourly_data.set_index('address')
+    if close_reserves is not None:
+      hourly_data = hourly_data.join(close_reserves.set_index('address')[['reserve0', 'reserve1']] \
+        .rename(columns={'reserve0': 'close_reserves_0', 'reserve1': 'close_reserves_1'}))
+    for sum_result in [mints_sum_result, burns_sum_result, swap_sum_result]:
+      if sum_result is not None:
+        hourly_data = hourly_data.join(sum_result)
+    if close_total_supply is not None:
+      hourly_data = hourly_data.join(close_total_supply.set_index('token_address')[['total_supply']] \
+        .rename(columns={'total_supply': 'close_lp_token_supply'}))
+    for col in HOURLY_DATA_ZERO_COLUMNS:
+      if col not in hourly_data.columns:
+        hourly_data[col] = 0
+    hourly_data = hourly_data.fillna(0)
+    hourly_data['max_block'] = max_block if max_block is not None else 0
+    count_columns = ['num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns', 'max_block']
+    hourly_data[count_columns] = hourly_data[count_columns].astype(int)
+    hourly_data['open_timestamp_utc'] = self.start_hour
+    hourly_data['close_timestamp_utc'] = self.end_hour
+    return hourly_data.reset_index()[HOURLY_DATA_KEY + HOURLY_DATA_ZERO_COLUMNS]
+  
+
   # =================================================================
   #                             Setters
   # =================================================================
@@ -65,17 +118,13 @@ class LpHourlySummarizer:
   '''
   def mint_summarizer(self, df_mints):
     try: 
-      mints_sum_result = pd.DataFrame({'num_mints':[], 'mints_0': [], 'mints_1': []})
-      # loop through addresses within df_mints
-      for index, pair in df_mints.iterrows():
-        if pair['address'] in  mints_sum_result.index:
-          mint_sum = mints_sum_result.loc[pair['address']]
-          mint0 = Decimal(int(np.sum([mint_sum['mints_0'], pair['amount0']])))
-          mint1 = Decimal(int(np.sum([mint_sum['mints_1'], pair['amount1']])))
-          num_mints = mint_sum['num_mints'] + 1
-          mints_sum_result.loc[pair['address']] = [num_mints, mint0, mint1]
-        else:
-          mints_sum_result.loc[pair['address']] = [1, pair['amount0'], pair['amount1']]
+      # group by address and sum the amounts
+      sums = grouped_exact_sum(df_mints, ['amount0', 'amount1'])
+      mints_sum_result = pd.DataFrame({
+        'num_mints': sums['num_events'],
+        'mints_0': sums['amount0'].map(Decimal),
+        'mints_1': sums['amount1'].map(Decimal)
+      })
       
       return mints_sum_result
     except:
@@ -95,17 +144,13 @@ class LpHourlySummarizer:
   '''
   def burn_summarizer(self, df_burns):
     try:
-      burns_sum_result = pd.DataFrame({'num_burns':[], 'burns_0': [], 'burns_1': []})
-      # loop through addresses within df_burn
-      for index, pair in df_burns.iterrows():
-        if pair['address'] in  burns_sum_result.index:
-          my_sum = burns_sum_result.loc[pair['address']]
-          burn0 = Decimal(int(np.sum([my_sum['burns_0'], pair['amount0']])))
-          burn1 = Decimal(int(np.sum([my_sum['burns_1'], pair['amount1']])))
-          num_burns = my_sum['num_burns'] + 1
-          burns_sum_result.loc[pair['address']] = [num_burns, burn0, burn1]
-        else:
-          burns_sum_result.loc[pair['address']] = [1, pair['amount0'], pair['amount1']]
+      # group by address and sum the amounts
+      sums = grouped_exact_sum(df_burns, ['amount0', 'amount1'])
+      burns_sum_result = pd.DataFrame({
+        'num_burns': sums['num_events'],
+        'burns_0': sums['amount0'].map(Decimal),
+        'burns_1': sums['amount1'].map(Decimal)
+      })
       
       return burns_sum_result
     except:
@@ -125,25 +170,18 @@ class LpHourlySummarizer:
   '''
   def swap_summarizer(self, df_swaps):
     try:
-      # swap_sum_result
-      swap_sum_result = pd.DataFrame({'num_swaps_0':[], 'num_swaps_1':[], 'amount0_in':[], 'amount0_out':[], 'amount1_in':[], 'amount1_out':[], 'volume_0':[], 'volume_1':[]})
+      # a swap counts for a token when some amount of this token went in or out
+      df_swaps = df_swaps.assign(swap_0=((df_swaps['amount0_in'] > 0) | (df_swaps['amount0_out'] > 0)).astype(int),
+                                 swap_1=((df_swaps['amount1_in'] > 0) | (df_swaps['amount1_out'] > 0)).astype(int))
       # aggregate with group_by pair
-      for index, item in df_swaps.iterrows():
-        if item['address'] in swap_sum_result.index:
-          my_swap = swap_sum_result.loc[item['address']]
-          num_swaps_0 = my_swap['num_swaps_0'] + 1 if (item['amount0_in'] > 0 or item['amount0_out']>0) else my_swap['num_swaps_0']
-          num_swaps_1 = my_swap['num_swaps_1'] + 1 if (item['amount1_in'] > 0 or item['amount1_out']>0) else my_swap['num_swaps_1']
-          amount0_in = Decimal(int(np.sum([my_swap['amount0_in'], item['amount0_in']])))
-          amount0_out = Decimal(int(np.sum([my_swap['amount0_out'], item['amount0_out']])))
-          amount1_in = Decimal(int(np.sum([my_swap['amount1_in'], item['amount1_in']])))
-          amount1_out = Decimal(int(np.sum([my_swap['amount1_out'], item['amount1_out']])))
-          swap_sum_result.loc[item['address']] = [num_swaps_0, num_swaps_1, amount0_in, amount0_out, amount1_in, amount1_out, 0, 0]
-        else: 
-          swap_sum_result.loc[item['address']] = [1, 1, item['amount0_in'], item['amount0_out'], item['amount1_in'], item['amount1_out'], 0, 0]
-      # update Volumes ( |amount0_in - amount1_in| )
-      for address, item in swap_sum_result.iterrows():
-        swap_sum_result.loc[address, 'volume_0'] = Decimal(int(np.abs(item['amount0_in'] - item['amount0_out'])))
-        swap_sum_result.loc[address, 'volume_1'] = Decimal(int(np.abs(item['amount1_in'] - item['amount1_out'])))
+      sums = grouped_exact_sum(df_swaps, ['swap_0', 'swap_1', 'amount0_in', 'amount0_out', 'amount1_in', 'amount1_out'])
+      # Volumes ( |amount_in - amount_out| )
+      swap_sum_result = pd.DataFrame({
+        'num_swaps_0': sums['swap_0'].astype(int),
+        'num_swaps_1': sums['swap_1'].astype(int),
+        'volume_0': (sums['amount0_in'] - sums['amount0_out']).abs().map(Decimal),
+        'volume_1': (sums['amount1_in'] - sums['amount1_out']).abs().map(Decimal)
+      })
       
       return swap_sum_result[['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']]
     except:
@@ -0,0 +1,167 @@
+import sys
+sys.path.insert(0, "../")
+from fixtures.block_summarizer import sync_events, total_supply
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import logging
+logging.basicConfig(level=logging.INFO)
+
+class MockPairState:
+  '''
+  # Latest reserves and lp token supply of every pair as of `block_number`.
+  # The values are kept in arrays indexed by the position of the pair (see `positions`) and the state is only ever
+  # moved forward: `advance` reads the syncs and supplies of the blocks after `block_number`, so a summarizer asking
+  # for the state of the next block or hour does not re-read the history of the chain.
+  '''
+  def __init__(self):
+    self.block_number = -1
+    self.addresses = []
+    self.positions = {}
+    self.reserve0 = np.empty(0, dtype=object)
+    self.reserve1 = np.empty(0, dtype=object)
+    self.total_supply = np.empty(0, dtype=object)
+    # block of the latest sync / supply of every pair, -1 when the pair has none yet
+    self.sync_block = np.empty(0, dtype=np.int64)
+    self.supply_block = np.empty(0, dtype=np.int64)
+
+  '''
+  # return the position of every address in the arrays, unknown addresses are appended
+  '''
+  def pair_positions(self, addresses):
+    new_addresses = [address for address in pd.unique(addresses) if address not in self.positions]
+    if len(new_addresses) > 0:
+      for address in new_addresses:
+        self.positions[address] = len(self.addresses)
+        self.addresses.append(address)
+      size = len(new_addresses)
+      self.reserve0 = np.concatenate([self.reserve0, np.zeros(size, dtype=object)])
+      self.reserve1 = np.concatenate([self.reserve1, np.zeros(size, dtype=object)])
+      self.total_supply = np.concatenate([self.total_supply, np.zeros(size, dtype=object)])
+      self.sync_block = np.concatenate([self.sync_block, np.full(size, -1, dtype=np.int64)])
+      self.supply_block = np.concatenate([self.supply_block, np.full(size, -1, dtype=np.int64)])
+    return np.array([self.positions[address] for address in addresses], dtype=np.int64)
+
+  '''
+  # return the latest sync of every pair with from_block < block_number <= to_block
+  '''
+  def sync_finder(self, from_block, to_block):
+    df = pd.DataFrame(sync_events)
+    df = df[(df['block_number'] > from_block) & (df['block_number'] <= to_block)]
+    df = df.sort_values(['address', 'block_number']).groupby('address').tail(1)
+    return df[['address', 'block_number', 'reserve0', 'reserve1']].reset_index(drop=True)
+
+  '''
+  # return the latest total supply of every token with from_block < block_number <= to_block
+  '''
+  def supply_finder(self, from_block, to_block):
+    df = pd.DataFrame(total_supply).rename(columns={'address': 'token_address'})
+    df = df[(df['block_number'] > from_block) & (df['block_number'] <= to_block)]
+    df = df.sort_values(['token_address', 'block_number']).groupby('token_address').tail(1)
+    return df[['token_address', 'block_number', 'total_supply']].reset_index(drop=True)
+
+  '''
+  # overwrite the reserves of the pairs with their latest sync (one row per address)
+  '''
+  def apply_syncs(self, df_sync):
+    if len(df_sync) == 0:
+      return
+    positions = self.pair_positions(df_sync['address'].values)
+    self.reserve0[positions] = df_sync['reserve0'].values
+    self.reserve1[positions] = df_sync['reserve1'].values
+    self.sync_block[positions] = df_sync['block_number'].values
+
+  '''
+  # overwrite the total supply of the tokens with their latest supply (one row per token_address)
+  '''
+  def apply_supplies(self, df_supply):
+    if len(df_supply) == 0:
+      return
+    positions = self.pair_positions(df_supply['token_address'].values)
+    self.total_supply[positions] = df_supply['total_supply'].values
+    self.supply_block[positions] = df_supply['block_number'].values
+
+  '''
+  # move the state forward to block_number
+  '''
+  def advance(self, block_number):
+    if block_number <= self.block_number:
+      return
+    # fetch both tables before touching the arrays so a failed query leaves the state as it was
+    df_sync = self.sync_finder(self.block_number, block_number)
+    df_supply = self.supply_finder(self.block_number, block_number)
+    self.apply_syncs(df_sync)
+    self.apply_supplies(df_supply)
+    self.block_number = block_number
+
+  '''
+  # return the reserves of every pair synced at least once as of the current block
+  '''
+  def reserves(self):
+    synced = self.sync_block >= 0
+    return pd.DataFrame({
+      'address': np.array(self.addresses, dtype=object)[synced],
+      'block_number': self.sync_block[synced],
+      'reserve0': self.reserve0[synced],
+      'reserve1': self.reserve1[synced]
+    })
+
+  '''
+  # return the total supply of every token with a supply as of the current block
+  '''
+  def supplies(self):
+    supplied = self.supply_block >= 0
+    return pd.DataFrame({
+      'token_address': np.array(self.addresses, dtype=object)[supplied],
+      'block_number': self.supply_block[supplied],
+      'total_supply': self.total_supply[supplied]
+    })
+
+  '''
+  # return the reserves as of block_number, or None when the state is already past that block
+  '''
+  def reserves_at(self, block_number):
+    if block_number < self.block_number:
+      return None
+    self.advance(block_number)
+    return self.reserves()
+
+  '''
+  # return the total supplies as of block_number, or None when the state is already past that block
+  '''
+  def supplies_at(self, block_number):
+    if block_number < self.block_number:
+      return None
+    self.advance(block_number)
+    return self.supplies()
+
+  '''
+  # write the state to path (written to a temp file first so a crash never leaves a partial snapshot)
+  '''
+  def save(self, path):
+    if not path:
+      return
+    try:
+      temp_path = f'{path}.tmp'
+      with open(temp_path, 'wb') as snapshot:
+        pickle.dump(self.__dict__, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(temp_path, path)
+    except Exception as e:
+      logging.error('Error occurred while saving the pair state snapshot: %s', str(e))
+
+  '''
+  # return the state saved at path, or an empty state when there is no usable snapshot
+  '''
+  @staticmethod
+  def load(path):
+    pair_state = MockPairState()
+    if not path or not os.path.exists(path):
+      return pair_state
+    try:
+      with open(path, 'rb') as snapshot:
+        pair_state.__dict__.update(pickle.load(snapshot))
+    except Exception as e:
+      logging.error('Error occurred while loading the pair state snapshot, starting from an empty state: %s', str(e))
+      pair_state = MockPairState()
+    return pair_state
@@ -0,0 +1,32 @@
+import sys
+sys.path.insert(0, "../")
+from mocks.block_range_summarizer import MockBlockRangeSummarizer
+from mocks.block_summarizer import MockBlockSummarizer
+import unittest
+
+compared_columns = ['reserve0', 'reserve1', 'total_supply', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns',
+                    'mints_0', 'mints_1', 'burns_0', 'burns_1', 'volume_0', 'volume_1']
+
+class TestBlockRangeSummarizer(unittest.TestCase):
+    def test_rangeSummaryAssembler(self):
+        result = MockBlockRangeSummarizer(1393081, 1393083).summary
+        self.assertEqual(len(result), 6 * 3)
+        # every block of the window matches the single block summarizer
+        for block_number in [1393081, 1393082, 1393083]:
+            expected = MockBlockSummarizer(block_number, batched=True).summarizer().set_index('address')
+            block_result = result[result['block_number'] == block_number].set_index('address')
+            for address in expected.index:
+                for col in compared_columns:
+                    self.assertEqual(block_result.loc[address, col], expected.loc[address, col])
+
+    def test_carryForward(self):
+        # reserves and total supply synced before the window are carried into it
+        result = MockBlockRangeSummarizer(1393082, 1393083).summary.set_index(['address', 'block_number'])
+        pair = 'cf56e334481fe2bf0530e0c03a586d2672da8bfe1d1d259ea91457a3bd8971e0'
+        self.assertEqual(result.loc[(pair, 1393083), 'reserve0'], 1000000000)
+        self.assertEqual(result.loc[(pair, 1393083), 'total_supply'], 19421699626)
+        self.assertEqual(result.loc[(pair, 1393083), 'num_mints'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ from mocks.block_summarizer import MockBlockSummarizer
 import unittest
 
 blockSummarizer = MockBlockSummarizer(1393081)
+batchedBlockSummarizer = MockBlockSummarizer(1393081, batched=True)
 
 class TestBlockSummarizer(unittest.TestCase):
     def test_blockTimestampFinder(self):
@@ -68,6 +69,27 @@ class TestBlockSummarizer(unittest.TestCase):
         result = blockSummarizer.summarizer()
         self.assertIsNotNone(result)
 
+    def test_batchedSummaryFinder(self):
+        result = batchedBlockSummarizer.summarizer().set_index('address')
+        self.assertEqual(len(result), len(blockSummarizer.pairs))
+        # every pair matches what the per pair finders return
+        for address in result.index:
+            mints = blockSummarizer.pairMintEventFinder(address)
+            burns = blockSummarizer.pairBurnEventFinder(address)
+            swaps = blockSummarizer.pairSwapEventFinder(address)
+            for df in [mints, burns, swaps]:
+                if df is None:
+                    continue
+                for col in df.columns:
+                    self.assertEqual(result.loc[address, col], df[col].iloc[0])
+        pair = 'cf56e334481fe2bf0530e0c03a586d2672da8bfe1d1d259ea91457a3bd8971e0'
+        self.assertEqual(result.loc[pair, 'reserve0'], 1000000000)
+        self.assertEqual(result.loc[pair, 'total_supply'], 19421699626)
+        # pairs without events are zero filled
+        other_pair = '800dee0fb5abf6d3525f520a4b052d8d36edb985a748a671209745c80836c2af'
+        self.assertEqual(result.loc[other_pair, 'num_mints'], 0)
+        self.assertEqual(result.loc[other_pair, 'total_supply'], 0)
+
     
 
 if __name__ == '__main__':  
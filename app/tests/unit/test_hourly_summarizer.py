@@ -136,7 +136,36 @@ class TestHourlySummarizer(unittest.TestCase):
     df_result = hourly_summarizer.swap_summarizer(df_swap)
     # test result should equal expected result
     self.assertTrue(expected_success_result.equals(df_result))
-  
+
+  # Test mint and swap summarizers keep every digit of NUMERIC(155) amounts
+  def test_summarizers_exact_precision(self):
+    hourly_summarizer = LpHourlySummarizer(None, None)
+    big = 10 ** 60 + 1
+    df_mint = pd.DataFrame({
+      'address': ['cf56e3', 'cf56e3', '800dee'],
+      'amount0': [Decimal(big), Decimal(big), Decimal(3)],
+      'amount1': [Decimal(1), Decimal(big), Decimal(big)]
+    })
+    df_result = hourly_summarizer.mint_summarizer(df_mint)
+    self.assertEqual(list(df_result.index), ['cf56e3', '800dee'])
+    self.assertEqual(list(df_result['num_mints']), [2, 1])
+    self.assertEqual(list(df_result['mints_0']), [Decimal(2 * big), Decimal(3)])
+    self.assertEqual(list(df_result['mints_1']), [Decimal(big + 1), Decimal(big)])
+
+    # only the side of the pair with an amount counts as a swap
+    df_swap = pd.DataFrame({
+      'address': ['cf56e3', 'cf56e3'],
+      'amount0_in': [Decimal(big), Decimal(0)],
+      'amount0_out': [Decimal(0), Decimal(0)],
+      'amount1_in': [Decimal(0), Decimal(0)],
+      'amount1_out': [Decimal(big - 1), Decimal(1)]
+    })
+    df_result = hourly_summarizer.swap_summarizer(df_swap)
+    self.assertEqual(list(df_result['num_swaps_0']), [1])
+    self.assertEqual(list(df_result['num_swaps_1']), [2])
+    self.assertEqual(list(df_result['volume_0']), [Decimal(big)])
+    self.assertEqual(list(df_result['volume_1']), [Decimal(big)])
+
   # Test close_lp_token
   def test_close_lp_token(self):
     timestamp_string = '2023-01-09 09:55:39.648000 +00:00'
@@ -173,5 +202,78 @@ class TestHourlySummarizer(unittest.TestCase):
     self.assertEqual(df_result.loc[df_result['token_address'] == 'cf56e3', 'total_supply'].values[0], expected_success_result.loc[expected_success_result['token_address'] == 'cf56e3', 'total_supply'].values[0])
 
 
+  # Test single pass summarization gives the same hourly_data rows as the multi pass path
+  def test_hourly_data_assembler(self):
+    start_hour = datetime(2023, 1, 9, 9, tzinfo=pytz.UTC)
+    end_hour = start_hour + timedelta(hours=1)
+
+    hourly_summarizer = LpHourlySummarizer(start_hour, end_hour)
+    hourly_summarizer.set_all_airs(pd.DataFrame({'contract_address': ['cf56e3', '800dee', 'a3f3a7']}))
+    close_reserves = hourly_summarizer.sync_summarizer(pd.DataFrame({
+      'id': [1, 2, 3],
+      'address':      ['cf56e3', 'cf56e3', '800dee'],
+      'block_number': [1398801, 1398802, 1398803],
+      'reserve0':     [144100081137, 143967281437, 1000000000],
+      'reserve1':     [919041928425877, 910434567551373, 919041928425879]
+    }))
+    mints_sum_result = hourly_summarizer.mint_summarizer(pd.DataFrame({
+      'id': [1, 2],
+      'address':      ['cf56e3', 'cf56e3'],
+      'block_number': [1398801, 1398802],
+      'amount0':      [144100081137, 143967281437],
+      'amount1':      [919041928425877, 910434567551373]
+    }))
+    burns_sum_result = hourly_summarizer.burn_summarizer(pd.DataFrame({
+      'id': [1],
+      'address':      ['800dee'],
+      'block_number': [1398803],
+      'amount0':      [1000000000],
+      'amount1':      [919041928425879]
+    }))
+    swap_sum_result = hourly_summarizer.swap_summarizer(pd.DataFrame({
+      'id': [1, 2, 3],
+      'address':      ['cf56e3', 'cf56e3', '800dee'],
+      'block_number': [1398801, 1398802, 1398803],
+      'amount0_in':   [100, 10, 200],
+      'amount0_out':  [30, 40, 50],
+      'amount1_in':   [3000, 100, 7900],
+      'amount1_out':  [50, 50, 1000]
+    }))
+    close_total_supply = hourly_summarizer.lp_token_supply_summarizer(pd.DataFrame({
+      'id':             [1, 2, 3],
+      'token_address':  ['cf56e3', 'cf56e3', '800dee'],
+      'block_number':   [1398801, 1398802, 1398803],
+      'total_supply':   [100, 10, 200]
+    }))
+    max_block = 1398803
+
+    # multi pass: rows initialized at zero, then updated by each saver
+    expected_success_result = pd.DataFrame(0, index=['cf56e3', '800dee', 'a3f3a7'], columns=['close_reserves_0', 'close_reserves_1', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns', 'mints_0', 'mints_1', 'burns_0', 'burns_1', 'volume_0', 'volume_1', 'max_block', 'close_lp_token_supply'], dtype=object)
+    for key, item in close_reserves.iterrows():
+      expected_success_result.loc[item['address'], ['close_reserves_0', 'close_reserves_1']] = [item['reserve0'], item['reserve1']]
+    for address, item in mints_sum_result.iterrows():
+      expected_success_result.loc[address, ['num_mints', 'mints_0', 'mints_1']] = [item['num_mints'], item['mints_0'], item['mints_1']]
+    for address, item in burns_sum_result.iterrows():
+      expected_success_result.loc[address, ['num_burns', 'burns_0', 'burns_1']] = [item['num_burns'], item['burns_0'], item['burns_1']]
+    for address, item in swap_sum_result.iterrows():
+      expected_success_result.loc[address, ['num_swaps_0', 'num_swaps_1', 'volume_0', 'volume_1']] = [item['num_swaps_0'], item['num_swaps_1'], item['volume_0'], item['volume_1']]
+    for key, item in close_total_supply.iterrows():
+      expected_success_result.loc[item['token_address'], 'close_lp_token_supply'] = item['total_supply']
+    expected_success_result['max_block'] = max_block
+
+    # single pass
+    df_result = hourly_summarizer.hourly_data_assembler(close_reserves, mints_sum_result, burns_sum_result, swap_sum_result, close_total_supply, max_block)
+
+    # one row per pair and per hour
+    self.assertEqual(list(df_result['address']), ['cf56e3', '800dee', 'a3f3a7'])
+    self.assertTrue((df_result['open_timestamp_utc'] == start_hour).all())
+    self.assertTrue((df_result['close_timestamp_utc'] == end_hour).all())
+    # test result should equal expected result
+    df_result = df_result.set_index('address')
+    for address in expected_success_result.index:
+      for col in expected_success_result.columns:
+        self.assertEqual(df_result.loc[address, col], expected_success_result.loc[address, col])
+
+
 if __name__ == '__main__':  
   unittest.main()
\ No newline at end of file
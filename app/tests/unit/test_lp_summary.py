@@ -0,0 +1,107 @@
+import sys
+sys.path.insert(0, "../../")
+import unittest
+import numpy as np
+import pandas as pd
+
+from data_servers.lp_summary import LPSummary
+
+
+class ExchangeRateStub:
+    def set_date_range(self, start_date, end_date):
+        pass
+
+    def set_denomination_currency(self, denomination_currency_id):
+        pass
+
+
+def hourly_data(addresses, start, num_hours, seed=0):
+    # hourly data and prices of pools, with the hours of each pool contiguous
+    rng = np.random.default_rng(seed)
+    size = len(addresses) * num_hours
+    open_timestamps = np.tile(pd.date_range(start, periods=num_hours, freq='H'), len(addresses))
+    hourly = pd.DataFrame({
+        'address': np.repeat(addresses, num_hours),
+        'open_timestamp_utc': open_timestamps,
+        'close_timestamp_utc': open_timestamps + pd.Timedelta(hours=1),
+        'close_reserve_0': 1e6 * np.exp(rng.normal(0, 0.02, size)),
+        'close_reserve_1': 3e6 * np.exp(rng.normal(0, 0.02, size)),
+        'volume_0': rng.random(size) * 1e4,
+        'volume_1': rng.random(size) * 3e4,
+        'num_swaps_0': rng.integers(0, 5, size),
+        'num_swaps_1': rng.integers(0, 5, size),
+        'num_mints': rng.integers(0, 2, size),
+        'num_burns': rng.integers(0, 2, size),
+    })
+    hourly['close_lp_token_supply'] = np.sqrt(hourly['close_reserve_0'] * hourly['close_reserve_1']) * \
+        (1 + rng.random(size) * 0.01)
+    for i in [0, 1]:
+        hourly[f'close_price_{i}'] = np.exp(rng.normal(0, 0.02, size)) / (1 + 2 * i)
+        hourly[f'open_price_{i}'] = hourly[f'close_price_{i}'] * np.exp(rng.normal(0, 0.01, size))
+    return hourly
+
+
+def period_bounds(lp, hourly):
+    # stand-in for UniV2LiquidityPool.fetch_period_bounds, with the same lookups on the hourly data of the pools
+    def fetch_period_bounds(periods, network):
+        rows = []
+        for period in periods.itertuples(index=False):
+            pool = hourly[hourly['address'] == period.address]
+            hours = pool[(pool['open_timestamp_utc'] >= period.start_date) &
+                         (pool['close_timestamp_utc'] <= period.end_date)]
+            before = pool[pool['open_timestamp_utc'] < period.start_date]
+            initial = before.iloc[-1] if len(before) > 0 else hours.iloc[0]
+            rows.append({
+                **period._asdict(),
+                'open_timestamp_utc': hours['open_timestamp_utc'].iloc[0],
+                'close_timestamp_utc': period.end_date,
+                'open_reserve_0': initial['close_reserve_0'],
+                'open_reserve_1': initial['close_reserve_1'],
+                'open_lp_token_supply': initial['close_lp_token_supply'],
+                'first_close_lp_token_supply': hours['close_lp_token_supply'].iloc[0],
+                'close_reserve_0': hours['close_reserve_0'].iloc[-1],
+                'close_reserve_1': hours['close_reserve_1'].iloc[-1],
+                'close_lp_token_supply': hours['close_lp_token_supply'].iloc[-1],
+                **{col: hours[col].sum() for col in
+                   ['volume_0', 'volume_1', 'num_swaps_0', 'num_swaps_1', 'num_mints', 'num_burns']},
+                **{f'{bound}_price_{i}': value for i in [0, 1] for bound, value in [
+                    ('open', hours[f'open_price_{i}'].iloc[0]), ('close', hours[f'close_price_{i}'].iloc[-1]),
+                    ('high', hours[f'close_price_{i}'].max()), ('low', hours[f'close_price_{i}'].min())]},
+            })
+        bounds = pd.DataFrame(rows)
+        lp._compute_base_currency_metrics(bounds)
+        lp._compute_backward_compatibility_metrics(bounds)
+        bounds['open_reserve_ratio'] = bounds['open_reserve_0'] / bounds['open_reserve_1']
+        bounds['close_reserve_ratio'] = bounds['close_reserve_0'] / bounds['close_reserve_1']
+        return bounds
+    return fetch_period_bounds
+
+
+class TestLPSummary(unittest.TestCase):
+    def setUp(self):
+        self.lp_summary = LPSummary(None, {}, ExchangeRateStub())
+        self.lp_summary.set_denomination_currency(1)
+        hourly = hourly_data(['pool0', 'pool1', 'pool2'], '2023-01-01', 24 * 90)
+        self.lp_summary.univ2_lp.fetch_period_bounds = period_bounds(self.lp_summary.univ2_lp, hourly)
+
+    # Test a period summarized alone, as one summary type at a time, equals the same period summarized with all the
+    # summary types of a batch of pools, as --all-periods does
+    def test_period_summary_independent_of_batch(self):
+        end_date = pd.Timestamp('2023-03-31 05:00')
+        period = {'contract_address': 'pool1', 'network': 1, 'data_frequency': 't30',
+                  'start_date': end_date - pd.Timedelta(days=30), 'end_date': end_date}
+        single = self.lp_summary.get_lp_period_summaries(pd.DataFrame([period]))
+        all_periods = self.lp_summary.get_lp_period_summaries(pd.DataFrame([
+            {**period, 'contract_address': address, 'data_frequency': data_frequency,
+             'start_date': end_date - pd.Timedelta(days=days)}
+            for address in ['pool0', 'pool1', 'pool2']
+            for data_frequency, days in [('t1d', 1), ('t7d', 7), ('t30', 30), ('tq', 60)]]))
+
+        self.assertEqual(list(single), [('pool1', 't30')])
+        self.assertEqual(len(all_periods), 12)
+        self.assertEqual(single[('pool1', 't30')], all_periods[('pool1', 't30')])
+        self.assertNotEqual(all_periods[('pool1', 't30')], all_periods[('pool1', 't7d')])
+
+
+if __name__ == '__main__':
+    unittest.main()
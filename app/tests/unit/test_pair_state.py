@@ -0,0 +1,54 @@
+import sys
+sys.path.insert(0, "../")
+from mocks.pair_state import MockPairState
+import os
+import tempfile
+import unittest
+
+class TestPairState(unittest.TestCase):
+
+  # Test the state advanced block by block equals the state built at once
+  def test_advance(self):
+    incremental = MockPairState()
+    for block_number in [1393080, 1393081, 1393091, 1393448, 1393531, 1393600]:
+      incremental.advance(block_number)
+    at_once = MockPairState()
+    at_once.advance(1393600)
+
+    self.assertEqual(incremental.block_number, 1393600)
+    # the pairs are not at the same positions in both states
+    self.assertTrue(at_once.reserves().sort_values('address').reset_index(drop=True)
+                    .equals(incremental.reserves().sort_values('address').reset_index(drop=True)))
+    self.assertTrue(at_once.supplies().sort_values('token_address').reset_index(drop=True)
+                    .equals(incremental.supplies().sort_values('token_address').reset_index(drop=True)))
+
+  # Test the state as of a block only holds the pairs synced or supplied up to that block
+  def test_reserves_at(self):
+    pair_state = MockPairState()
+    reserves = pair_state.reserves_at(1393448).set_index('address')
+    self.assertEqual(sorted(reserves.index), ['a84382872d1402a5ec8d8453f516586166100d8252f997b0bcdeed8c4737588d',
+                                              'cf56e334481fe2bf0530e0c03a586d2672da8bfe1d1d259ea91457a3bd8971e0'])
+    self.assertEqual(reserves.loc['cf56e334481fe2bf0530e0c03a586d2672da8bfe1d1d259ea91457a3bd8971e0', 'reserve0'], 1000000000)
+    supplies = pair_state.supplies_at(1393448).set_index('token_address')
+    self.assertEqual(supplies.loc['800dee0fb5abf6d3525f520a4b052d8d36edb985a748a671209745c80836c2af', 'total_supply'], 166755238)
+    self.assertEqual(len(supplies), 2)
+    # the state never moves backward, older blocks are left to the raw tables
+    self.assertIsNone(pair_state.reserves_at(1393081))
+    self.assertIsNone(pair_state.supplies_at(1393081))
+
+  # Test a snapshot is reloaded as it was saved
+  def test_save_load(self):
+    pair_state = MockPairState()
+    pair_state.advance(1393600)
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'pair_state.pkl')
+      pair_state.save(path)
+      loaded = MockPairState.load(path)
+    self.assertEqual(loaded.block_number, 1393600)
+    self.assertTrue(pair_state.reserves().equals(loaded.reserves()))
+    self.assertTrue(pair_state.supplies().equals(loaded.supplies()))
+    # no snapshot yet: empty state
+    self.assertEqual(MockPairState.load(None).block_number, -1)
+
+if __name__ == '__main__':
+  unittest.main()
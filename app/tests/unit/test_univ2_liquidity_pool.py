@@ -0,0 +1,92 @@
+import sys
+sys.path.insert(0, "../../")
+import math
+import unittest
+import numpy as np
+import pandas as pd
+
+from data_servers.liquidity_pool.univ2_liquidity_pool import UniV2LiquidityPool, compute_lp_returns
+
+
+def scalar_impermanent_loss_level(current_reserve_ratio, initial_reserve_ratio):
+    price_ratio = initial_reserve_ratio / current_reserve_ratio
+    return 2 * math.sqrt(price_ratio) / (1 + price_ratio) - 1
+
+
+def hourly_data(num_pools, num_hours, seed=0):
+    # hourly data of pools with their hours contiguous, as compute_returns expects it
+    rng = np.random.default_rng(seed)
+    size = num_pools * num_hours
+    close_reserve_0 = 1e6 * np.exp(rng.normal(0, 0.02, size))
+    close_reserve_1 = 3e6 * np.exp(rng.normal(0, 0.02, size))
+    lp_summary = pd.DataFrame({
+        'address': np.repeat([f'pool{i}' for i in range(num_pools)], num_hours),
+        'close_reserve_0': close_reserve_0,
+        'close_reserve_1': close_reserve_1,
+        'close_lp_token_supply': np.sqrt(close_reserve_0 * close_reserve_1) * (1 + rng.random(size) * 0.01),
+        'close_price_0': np.exp(rng.normal(0, 0.02, size)),
+        'close_price_1': np.exp(rng.normal(0, 0.02, size)) / 3,
+    })
+    for col in ['reserve_0', 'reserve_1', 'lp_token_supply', 'price_0', 'price_1']:
+        lp_summary[f'open_{col}'] = lp_summary[f'close_{col}'] * np.exp(rng.normal(0, 0.01, size))
+    lp_summary['close_poolsize'] = lp_summary['close_reserve_0'] * lp_summary['close_price_0'] + \
+        lp_summary['close_reserve_1'] * lp_summary['close_price_1']
+    lp_summary['open_poolsize'] = lp_summary['open_reserve_0'] * lp_summary['open_price_0'] + \
+        lp_summary['open_reserve_1'] * lp_summary['open_price_1']
+    lp_summary['close_lp_token_price'] = lp_summary['close_poolsize'] / lp_summary['close_lp_token_supply']
+    lp_summary['open_lp_token_price'] = lp_summary['open_poolsize'] / lp_summary['open_lp_token_supply']
+    # a few hours without price
+    lp_summary.loc[rng.random(size) < 0.05, 'close_price_0'] = np.nan
+    return lp_summary
+
+
+class TestUniV2LiquidityPool(unittest.TestCase):
+    def setUp(self):
+        self.lp = UniV2LiquidityPool(None, {}, None)
+
+    # Test the impermanent loss of whole arrays equals the scalar formula of each element
+    def test_impermanent_loss_level(self):
+        rng = np.random.default_rng(0)
+        current_ratios = np.concatenate([np.exp(rng.normal(0, 1, 1000)), [1, 1e-12, 1e12]])
+        initial_ratios = np.concatenate([np.exp(rng.normal(0, 1, 1000)), [1, 1, 1]])
+        levels = UniV2LiquidityPool.compute_impermanent_loss_level(current_ratios, initial_ratios)
+        expected = [scalar_impermanent_loss_level(current, initial)
+                    for current, initial in zip(current_ratios, initial_ratios)]
+        np.testing.assert_allclose(levels, expected, rtol=1e-13, atol=1e-15)
+        self.assertEqual(levels[1000], 0)
+        self.assertTrue((levels <= 0).all())
+
+    # Test compute_returns measures the impermanent loss of every hour against the first hour of its pool
+    def test_compute_returns_impermanent_loss(self):
+        lp_summary = hourly_data(3, 50)
+        self.lp.compute_returns(lp_summary, by='address')
+        for address, pool in lp_summary.groupby('address'):
+            initial_ratio = pool['open_reserve_1'].iloc[0] / pool['open_reserve_0'].iloc[0]
+            expected = [scalar_impermanent_loss_level(current, initial_ratio)
+                        for current in pool['close_reserve_1'] / pool['close_reserve_0']]
+            np.testing.assert_allclose(pool['impermanent_loss_level'], expected, rtol=1e-13, atol=1e-15)
+            self.assertEqual(pool['total_period_return'].iloc[0], pool['total_croi'].iloc[0])
+
+    # Test the returns of a (pool x hour) matrix equal the returns of the hours of the pools one after the other
+    def test_compute_lp_returns_matrix(self):
+        num_pools, num_hours = 4, 30
+        lp_summary = hourly_data(num_pools, num_hours, seed=1)
+        lp_summary.loc[num_hours, 'close_price_0'] = np.nan
+        matrices = {col: lp_summary[col].values.reshape(num_pools, num_hours) for col in lp_summary if col != 'address'}
+        initial = {col: matrices[col][:, :1] for col in
+                   ['open_reserve_0', 'open_reserve_1', 'open_price_0', 'open_price_1', 'open_lp_token_price',
+                    'open_lp_token_supply', 'open_poolsize', 'close_lp_token_supply']}
+        is_start = np.zeros((num_pools, num_hours), dtype=bool)
+        is_start[:, 0] = True
+        returns = compute_lp_returns(matrices, initial, is_start)
+
+        self.lp.compute_returns(lp_summary, by='address')
+        for col, values in returns.items():
+            self.assertEqual(values.shape, (num_pools, num_hours))
+            np.testing.assert_allclose(values.ravel(), lp_summary[col].values, rtol=1e-13, atol=1e-15, err_msg=col)
+        # missing prices are carried forward within a pool only
+        self.assertTrue(np.isnan(returns['token_0_price_return'][1, :2]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
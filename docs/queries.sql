@@ -45,12 +45,23 @@ CREATE TABLE IF NOT EXISTS hourly_data
     volume_1              double precision         not null,
     max_block             integer                  not null,
     close_lp_token_supply numeric(155)             not null,
+    -- running totals of the pool up to this hour, included (see update_cumulative_totals of the hourly summarizer)
+    cumulative_volume_0    double precision,
+    cumulative_volume_1    double precision,
+    cumulative_num_swaps_0 bigint,
+    cumulative_num_swaps_1 bigint,
+    cumulative_num_mints   bigint,
+    cumulative_num_burns   bigint,
     constraint address_timestamp_unique
         unique (address, open_timestamp_utc, close_timestamp_utc)
 );
 CREATE INDEX IF NOT EXISTS idx_lp_hourly_summary_address ON hourly_data ( address, open_timestamp_utc );
 CREATE UNIQUE INDEX IF NOT EXISTS unq_lp_hourly_summary ON hourly_data ( open_timestamp_utc, close_timestamp_utc, address );
 
+-- indexes on the raw event tables for the latest state per pair lookups of the summarizers
+CREATE INDEX IF NOT EXISTS idx_raw_pair_sync_event_latest ON raw_pair_sync_event ( address, block_number DESC, log_index DESC );
+CREATE INDEX IF NOT EXISTS idx_token_total_supply_latest ON token_total_supply ( token_address, block_number DESC );
+
 -- currency table
 CREATE TABLE IF NOT EXISTS currency ( 
 	id                              serial primary key,